@@ -1,27 +1,150 @@
-import traceback
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Body, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import copy
 import json
 import os
 import random
+import threading
 import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_pinecone import PineconeVectorStore
+# langchain_groq, langchain_pinecone and langchain_huggingface are imported lazily during startup
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.runnables import RunnableLambda
-# from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
-from functools import lru_cache
+from operator import itemgetter
+from catalog import IngestError, ingest_catalog, product_document, read_products_csv, vector_id
+from catalog_version import CatalogVersion
+from context_builder import ContextBuilder
+from embedding_batcher import BatchedEmbeddings, ExecutorEmbeddings
+from embedding_cache import CachedEmbeddings
+from hedging import HEDGE, PRIMARY, HedgedLLM, reset_deadline, start_deadline
+from history import HistoryManager
+from intents import IntentRouter
+from lexical import LexicalIndex, reciprocal_rank_fusion
+from json_stream import AvatarStreamParser, parse_reply
+from model_router import LARGE, SMALL, ComplexityRouter
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, ServerTimingMiddleware
+from structured_log import StructuredLogger
+from product_table import ProductTable
+from response_cache import ResponseCache, history_fingerprint, normalize_query
+from retrieval_cache import RetrievalCache
+from sessions import SessionStore
+from singleflight import SingleFlight
+from startup import StartupTracker
+from vector_store import NumpyVectorStore
 
 # Environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+# "pinecone" (default) or "numpy" for the in-process vector index
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "local_index.npz")
+PRODUCTS_CSV_PATH = os.getenv("PRODUCTS_CSV_PATH", "products.csv")
+# Query embedding micro-batching (set EMBED_BATCH_SIZE=1 to disable)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# Query embedding cache: in-memory LRU plus a memory-mapped file shared by workers
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.bin")
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Bulk catalog ingestion
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.json")
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "256"))
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "100"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+RETRIEVAL_K = 5
+# BM25 over the catalog fused with vector results; decisive lexical hits skip the embedding
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+LEXICAL_DECISIVE_RATIO = float(os.getenv("LEXICAL_DECISIVE_RATIO", "2.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Price/stock/warranty/listing questions answered from the catalog without calling the LLM
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "true").lower() in ("1", "true", "yes")
+INTENT_PROTOTYPE_THRESHOLD = float(os.getenv("INTENT_PROTOTYPE_THRESHOLD", "0.6"))
+INTENT_LISTING_LIMIT = int(os.getenv("INTENT_LISTING_LIMIT", "5"))
+# LLM returns only product IDs; full product objects are filled in from the local catalog
+PRODUCT_ID_MODE = os.getenv("PRODUCT_ID_MODE", "true").lower() in ("1", "true", "yes")
+# Prompt context budget for retrieved products
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_DESCRIPTION_TOKENS = int(os.getenv("CONTEXT_DESCRIPTION_TOKENS", "40"))
+# Chat history: recent turns verbatim, older ones in a rolling summary, under a token ceiling
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+HISTORY_SUMMARY_EVERY = int(os.getenv("HISTORY_SUMMARY_EVERY", "2"))
+HISTORY_TOKEN_CEILING = int(os.getenv("HISTORY_TOKEN_CEILING", "500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "150"))
+# Server-side sessions for requests that carry a conversation_id
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(6 * 3600)))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "")
+# Local embedding + retrieval pass before reporting ready (never calls the LLM)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")
+# A failed startup is retried this many times, waiting STARTUP_RETRY_BACKOFF seconds, doubling up to a minute
+STARTUP_RETRIES = int(os.getenv("STARTUP_RETRIES", "5"))
+STARTUP_RETRY_BACKOFF = float(os.getenv("STARTUP_RETRY_BACKOFF", "2.0"))
+# Response cache (set RESPONSE_CACHE_SIZE=0 to disable)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Vector retrieval results keyed on an LSH signature of the query embedding (RETRIEVAL_CACHE_SIZE=0 disables)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_BITS = int(os.getenv("RETRIEVAL_CACHE_BITS", "64"))
+RETRIEVAL_CACHE_POLICY = os.getenv("RETRIEVAL_CACHE_POLICY", "lru").lower()
+# Shared with app4 so its CRUD writes invalidate the assistant's caches
+CATALOG_VERSION_PATH = os.getenv("CATALOG_VERSION_PATH", "catalog_version")
+# Identical concurrent questions (same normalized query, language and history) share one pipeline run
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+# LLM deadline per request, hedging after LLM_HEDGE_DELAY seconds (empty: observed p95) and a smaller
+# fallback model (empty: none) for when the budget left is under LLM_MIN_PRIMARY_BUDGET or the primary stalls
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "llama3-8b-8192")
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "8"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY")) if os.getenv("LLM_HEDGE_DELAY") else None
+LLM_MIN_PRIMARY_BUDGET = float(os.getenv("LLM_MIN_PRIMARY_BUDGET", "2.0"))
+LLM_FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", "1.5"))
+# Route simple turns to LLM_SMALL_MODEL and complex ones (score >= MODEL_ROUTER_THRESHOLD) to LLM_MODEL,
+# each with its own output budget and temperature
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "true").lower() in ("1", "true", "yes")
+MODEL_ROUTER_THRESHOLD = float(os.getenv("MODEL_ROUTER_THRESHOLD", "0.5"))
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama3-8b-8192")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1024"))
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+LLM_SMALL_MAX_TOKENS = int(os.getenv("LLM_SMALL_MAX_TOKENS", "768"))
+LLM_SMALL_TEMPERATURE = float(os.getenv("LLM_SMALL_TEMPERATURE", "0.1"))
+# Alternative Groq-compatible endpoint, e.g. fake_llm_server.py for latency testing
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "")
+# Thread pool size for unbatched embedding and cap on concurrent LLM calls per worker
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "2"))
+MAX_INFLIGHT_LLM_CALLS = int(os.getenv("MAX_INFLIGHT_LLM_CALLS", "16"))
+# Per-stage latency histograms (/metrics) and Server-Timing headers
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Structured request logging: level, per-level sampling (kept per request), field truncation, queue bound.
+# Query and history text are only logged with LOG_CONTENT=true; otherwise just their lengths.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+LOG_SAMPLE_DEBUG = float(os.getenv("LOG_SAMPLE_DEBUG", "0.1"))
+LOG_SAMPLE_INFO = float(os.getenv("LOG_SAMPLE_INFO", "1.0"))
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "256"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONTENT = os.getenv("LOG_CONTENT", "false").lower() in ("1", "true", "yes")
+
+METRICS = Metrics("emily", enabled=METRICS_ENABLED)
+LOG = StructuredLogger(
+    "emily",
+    level=LOG_LEVEL,
+    sample_rates={"debug": LOG_SAMPLE_DEBUG, "info": LOG_SAMPLE_INFO},
+    max_field_chars=LOG_MAX_FIELD_CHARS,
+    queue_size=LOG_QUEUE_SIZE
+)
 
 # Add new model for chat history
 class ChatMessage(BaseModel):
@@ -32,6 +155,9 @@ class LLMQueryRequest(BaseModel):
     query: str
     history: Optional[List[ChatMessage]] = []
     language: str = "english"  # Default to english
+    # With a conversation_id the server keeps the history; send only the new query
+    # (a non-empty history re-seeds the session)
+    conversation_id: Optional[str] = None
 
 # Pydantic models for API
 class ProductItem(BaseModel):
@@ -52,54 +178,165 @@ class Message(BaseModel):
     facialExpression: str
     animation: str
 
+class IngestRequest(BaseModel):
+    csv_path: Optional[str] = None  # Defaults to PRODUCTS_CSV_PATH
+    prune: bool = False
+
 class LLMResponse(BaseModel):
     messages: List[Message]
     products: List[Dict[str, Any]]
+    # primary | hedge | fallback_budget | fallback_timeout | fallback_error | catalog | cache | error
+    served_by: Optional[str] = None
     
 class ProductResponse(BaseModel):
     status: str
     message: Optional[str] = None
     data: Optional[Any] = None
 
-# Pre-initialize embedding model at module level to ensure it's loaded once
-print("Pre-loading HuggingFace embedding model...")
-start_time = time.time()
-EMBEDDING_MODEL = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",
-    model_kwargs={'device': 'cpu'}
-)
-print(f"Embedding model loaded in {time.time() - start_time:.2f} seconds")
+def load_embedding_model():
+    """Load the HuggingFace embedding model (the slowest startup phase)"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_kwargs={'device': 'cpu'}
+    )
+
+# Filler used when the LLM returns fewer than 3 messages
+FOLLOW_UP_MESSAGE = {
+    "text": "Is there anything specific about these products you'd like to know?",
+    "facialExpression": "smile",
+    "animation": "Standing Idle"
+}
+
+# Product part of the system prompt: full objects, or just IDs hydrated from the catalog
+PRODUCT_FIELD_INSTRUCTIONS = """- products: Array of relevant products from context
+
+        IMPORTANT: Each product in the products array MUST include these fields:
+        - name: full product name (Brand + Model)
+        - description: A detailed description of the product
+        - mrp: mrp price
+        - discount: discount percentage
+        - price: The final price (from Actual Price field)
+        - stock: no of stocks
+        - warrenty: warrenty years
+        - category: The product category
+        - img: The product image URL"""
+PRODUCT_ID_INSTRUCTIONS = """- products: Array of product_id strings (the product_id column of the context) for the relevant products, most relevant first. Do NOT repeat any other product details."""
 
 class EmilyAssistant:
-    def __init__(self):
-        # Use pre-loaded embedding model
-        self.embeddings = EMBEDDING_MODEL
+    def __init__(self, embedding_model):
+        # Use pre-loaded embedding model, batching concurrent query embeddings.
+        # Either way, CPU-bound embedding runs off the event loop on bounded threads.
+        if EMBED_BATCH_SIZE > 1:
+            self.embedding_dispatcher = BatchedEmbeddings(
+                embedding_model,
+                max_batch_size=EMBED_BATCH_SIZE,
+                max_wait_ms=EMBED_BATCH_WAIT_MS
+            )
+        else:
+            self.embedding_dispatcher = ExecutorEmbeddings(embedding_model, max_workers=EMBED_EXECUTOR_WORKERS)
+        # Repeated queries skip the forward pass entirely
+        self.embeddings = CachedEmbeddings(
+            self.embedding_dispatcher,
+            max_entries=EMBED_CACHE_SIZE,
+            path=EMBED_CACHE_PATH or None,
+            max_disk_bytes=EMBED_CACHE_MAX_BYTES,
+            logger=LOG
+        )
         
-        print("Initializing Pinecone connection...")
+        print(f"Initializing {VECTOR_STORE_BACKEND} vector store...")
         start_time = time.time()
         # Initialize the vector store
-        self.vectorstore = PineconeVectorStore(
-            index_name=PINECONE_INDEX_NAME,
-            embedding=self.embeddings,
+        self.vectorstore = self._create_vectorstore()
+        print(f"Vector store initialized in {time.time() - start_time:.2f} seconds")
+
+        self.product_table = self._load_product_table()
+        self.lexical_index = self._load_lexical_index()
+        self.intent_router = IntentRouter(
+            self.lexical_index,
+            self.product_table,
+            embeddings=self.embeddings,
+            prototype_threshold=INTENT_PROTOTYPE_THRESHOLD,
+            listing_limit=INTENT_LISTING_LIMIT
+        ) if INTENT_ROUTER and HYBRID_RETRIEVAL else None
+
+        self.history_manager = HistoryManager(
+            keep_turns=HISTORY_KEEP_TURNS,
+            summary_every=HISTORY_SUMMARY_EVERY,
+            token_ceiling=HISTORY_TOKEN_CEILING,
+            summary_tokens=HISTORY_SUMMARY_TOKENS
         )
-        print(f"Pinecone connection initialized in {time.time() - start_time:.2f} seconds")
 
-        # Retriever with reduced k for faster retrieval
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}
+        self.session_store = SessionStore(
+            max_sessions=SESSION_MAX_SESSIONS,
+            max_bytes=SESSION_MAX_BYTES,
+            ttl_seconds=SESSION_TTL,
+            max_messages=SESSION_MAX_MESSAGES,
+            path=SESSION_STORE_PATH or None
+        )
+
+        self.context_builder = ContextBuilder(
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            description_tokens=CONTEXT_DESCRIPTION_TOKENS
+        )
+
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL,
+            similarity_threshold=RESPONSE_CACHE_SIMILARITY
+        )
+
+        self.single_flight = SingleFlight("chat", copy=copy.deepcopy, enabled=SINGLE_FLIGHT)
+
+        self.catalog_version = CatalogVersion(CATALOG_VERSION_PATH or None)
+        self._response_cache_version = self.catalog_version.current()
+        self.retrieval_cache = RetrievalCache(
+            self.catalog_version,
+            max_entries=RETRIEVAL_CACHE_SIZE,
+            ttl_seconds=RETRIEVAL_CACHE_TTL,
+            bits=RETRIEVAL_CACHE_BITS,
+            policy=RETRIEVAL_CACHE_POLICY
         )
 
         print("Initializing LLM connection...")
         start_time = time.time()
         # Initialize the LLM with more efficient settings
+        from langchain_groq import ChatGroq
+        groq_kwargs = {"base_url": GROQ_BASE_URL} if GROQ_BASE_URL else {}
         self.llm = ChatGroq(
-            model_name="llama3-70b-8192",
-            temperature=0.2,  # Lower temperature for faster, more deterministic responses
+            model_name=LLM_MODEL,
+            temperature=LLM_TEMPERATURE,  # Lower temperature for faster, more deterministic responses
             groq_api_key=os.environ.get("GROQ_API_KEY"),
-            max_tokens=1024  # Limit output tokens for faster responses
+            max_tokens=LLM_MAX_TOKENS,  # Limit output tokens for faster responses
+            max_retries=0,  # Hedging and the fallback model retry within the deadline instead
+            **groq_kwargs
         )
+        self.fallback_llm = ChatGroq(
+            model_name=LLM_FALLBACK_MODEL,
+            temperature=LLM_TEMPERATURE,
+            groq_api_key=os.environ.get("GROQ_API_KEY"),
+            max_tokens=LLM_MAX_TOKENS,
+            max_retries=0,
+            **groq_kwargs
+        ) if LLM_FALLBACK_MODEL else None
+        self.small_llm = ChatGroq(
+            model_name=LLM_SMALL_MODEL,
+            temperature=LLM_SMALL_TEMPERATURE,
+            groq_api_key=os.environ.get("GROQ_API_KEY"),
+            max_tokens=LLM_SMALL_MAX_TOKENS,
+            max_retries=0,
+            **groq_kwargs
+        ) if MODEL_ROUTING else None
+        hedging = dict(deadline=LLM_DEADLINE, hedge_delay=LLM_HEDGE_DELAY, hedge=LLM_HEDGE,
+                       min_primary_budget=LLM_MIN_PRIMARY_BUDGET, fallback_reserve=LLM_FALLBACK_RESERVE)
+        self.hedged_llms = {LARGE: HedgedLLM(self.llm, self.fallback_llm, **hedging)}
+        if self.small_llm is not None:
+            # A short budget still needs a fast answer, so the large model only steps in when the small one fails
+            self.hedged_llms[SMALL] = HedgedLLM(self.small_llm, self.fallback_llm, error_fallback=self.llm, **hedging)
+        self.model_router = ComplexityRouter(threshold=MODEL_ROUTER_THRESHOLD, enabled=MODEL_ROUTING)
         print(f"LLM connection initialized in {time.time() - start_time:.2f} seconds")
+        self.llm_semaphore = asyncio.Semaphore(MAX_INFLIGHT_LLM_CALLS)
 
         # Prompt template
         # Update the prompt template in __init__ method
@@ -109,28 +346,17 @@ class EmilyAssistant:
         - text: Part of the response (split across 3 messages)
         - facialExpression: One of: smile, sad, angry, surprised, funnyFace, default
         - animation: One of: Talking, Dwarf Idle, Disappointed, Annoyed Head Shake, Acknowledging, Holding Idle, Head Nod Yes, Hard Head Nod, Happy Idle, Searching Pockets, Sarcastic Head Nod, Sad Idle, Neck Stretching, Look Around, Thoughtful Head Shake, Thoughtful Head Nod, Shaking Head No, Waving, Standing Idle
-        - products: Array of relevant products from context
+        {product_instructions}
 
         IMPORTANT: You MUST respond in {language} language only for all text messages.
         IMPORTANT: Provide a natural conversation that DOESN'T always start with "Hi there" or generic greetings. Vary your responses based on the query context. Only use greeting phrases in your first message when appropriate for the query.
 
-        IMPORTANT: Each product in the products array MUST include these fields:
-        - name: full product name (Brand + Model)
-        - description: A detailed description of the product
-        - mrp: mrp price
-        - discount: discount percentage
-        - price: The final price (from Actual Price field)
-        - stock: no of stocks
-        - warrenty: warrenty years
-        - category: The product category
-        - img: The product image URL
-
         Message structure:
         1. First message: Context-appropriate opening (not always a greeting)
         2. Second message: Main information/answer
         3. Third message: Conclusion with follow-up question asked
 
-        Context:
+        Context (one product per row, columns named in the first line):
         {context}
 
         Chat History:
@@ -138,32 +364,28 @@ class EmilyAssistant:
 
         Answer directly based on context provided and maintain conversation continuity with the chat history."""),
             ("human", "{question}")
-        ])
+        ]).partial(product_instructions=PRODUCT_ID_INSTRUCTIONS if self._product_id_mode() else PRODUCT_FIELD_INSTRUCTIONS)
 
         # RAG chain
         print("Setting up RAG chain...")
+        # Sync and async variants of each stage so ainvoke never blocks the event loop
+        self.answer_chain = (
+            RunnableLambda(self._compact_context)
+            | {"prompt": RunnableLambda(self._render_prompt), "model_route": itemgetter("model_route")}
+            | RunnableLambda(self._call_llm, afunc=self._acall_llm)
+            | self._format_output
+        )
         self.rag_chain = (
         {
-            "context": RunnableLambda(lambda x: self.retriever.invoke(x["question"])),
-            "question": RunnablePassthrough(),
-            "history": RunnablePassthrough(),
-            "language": RunnablePassthrough()
+            "context": RunnableLambda(self._retrieve, afunc=self._aretrieve),
+            "question": itemgetter("question"),
+            "history": itemgetter("history"),
+            "language": itemgetter("language")
         }
-        | self.prompt_template
-        | self.llm
-        | self._format_output
+        | self.answer_chain
         )
         print(f"RAG chain setup completed in {time.time() - start_time:.2f} seconds")
         
-        # Pre-warm the chain with a dummy query
-        print("Pre-warming the chain with a dummy query...")
-        start_time = time.time()
-        try:
-            _ = self.rag_chain.invoke("show me a product")
-            print(f"Chain pre-warmed in {time.time() - start_time:.2f} seconds")
-        except Exception as e:
-            print(f"Pre-warming failed, but continuing: {str(e)}")
-        
         # List of varied opening phrases to avoid repetitive greetings
         self.opening_phrases = [
             "Based on what you're looking for,",
@@ -179,11 +401,298 @@ class EmilyAssistant:
         ]
         print("EmilyAssistant initialization complete!")
 
-    @lru_cache(maxsize=128)
-    def _get_cached_response(self, query_key: str):
-        """Cache responses for common queries"""
-        return self.rag_chain.invoke(query_key)
-    
+    def warmup(self):
+        """Run one local embedding + retrieval pass so the first request doesn't pay for lazy init.
+
+        Deliberately stops short of the LLM: warming Groq costs a paid call and needs network.
+        """
+        embedding = self.embeddings.embed_query("show me a product")
+        self.vectorstore.similarity_search_by_vector(embedding, k=1)
+        if self.intent_router is not None:
+            self.intent_router.warmup()
+
+    def _create_vectorstore(self):
+        """Build the configured vector store backend."""
+        if VECTOR_STORE_BACKEND != "numpy":
+            from langchain_pinecone import PineconeVectorStore
+            return PineconeVectorStore(
+                index_name=PINECONE_INDEX_NAME,
+                embedding=self.embeddings,
+            )
+
+        if LOCAL_INDEX_PATH and os.path.exists(LOCAL_INDEX_PATH):
+            store = NumpyVectorStore.load(LOCAL_INDEX_PATH, self.embeddings)
+            print(f"Loaded {len(store)} products from {LOCAL_INDEX_PATH}")
+            return store
+
+        # No saved index yet: seed from the catalog CSV so the local backend works offline
+        store = NumpyVectorStore(self.embeddings)
+        if os.path.exists(PRODUCTS_CSV_PATH):
+            ingest_catalog(PRODUCTS_CSV_PATH, store, embed_batch_size=INGEST_EMBED_BATCH, upsert_batch_size=INGEST_UPSERT_BATCH)
+            print(f"Seeded {len(store)} products from {PRODUCTS_CSV_PATH}")
+            if LOCAL_INDEX_PATH:
+                store.save(LOCAL_INDEX_PATH)
+        return store
+
+    def ingest_catalog(self, csv_path: Optional[str] = None, prune: bool = False) -> Dict[str, Any]:
+        """Bulk-sync the vector index from a catalog CSV, skipping unchanged rows."""
+        # One manifest per backend and index: hashes recorded for one index say nothing about another
+        if VECTOR_STORE_BACKEND == "numpy":
+            scope = f"numpy:{LOCAL_INDEX_PATH or ''}"
+        else:
+            scope = f"{VECTOR_STORE_BACKEND}:{PINECONE_INDEX_NAME}"
+        try:
+            stats = ingest_catalog(
+                csv_path or PRODUCTS_CSV_PATH,
+                self.vectorstore,
+                manifest_path=INGEST_MANIFEST_PATH or None,
+                manifest_scope=scope,
+                embed_batch_size=INGEST_EMBED_BATCH,
+                upsert_batch_size=INGEST_UPSERT_BATCH,
+                max_workers=INGEST_WORKERS,
+                prune=prune
+            )
+        except IngestError as e:
+            # The batches that did succeed are in the index: save it and drop stale caches before failing
+            self._catalog_ingested(csv_path, prune, e.stats)
+            raise
+        self._catalog_ingested(csv_path, prune, stats)
+        return stats
+
+    def _catalog_ingested(self, csv_path: Optional[str], prune: bool, stats: Dict[str, Any]):
+        """Persist the local index, bump the catalog version and refresh local tables after an ingest"""
+        if stats["upserted"] or stats["deleted"]:
+            if isinstance(self.vectorstore, NumpyVectorStore) and LOCAL_INDEX_PATH:
+                self.vectorstore.save(LOCAL_INDEX_PATH)
+            self.catalog_version.bump()
+            self.response_cache.clear()
+            products = ((p["product_id"], p) for p in read_products_csv(csv_path or PRODUCTS_CSV_PATH))
+            if prune:
+                products = list(products)
+                self.product_table.rebuild(products)
+                self.lexical_index.rebuild(products)
+            else:
+                for product_id, product in products:
+                    self.product_table.upsert(product_id, product)
+                    self.lexical_index.add(product_id, product)
+
+    def _load_product_table(self) -> ProductTable:
+        """Columnar catalog table used for local /products/ listings"""
+        table = ProductTable(price_field="mrp", sale_price_field="price")
+        if os.path.exists(PRODUCTS_CSV_PATH):
+            table.rebuild((p["product_id"], p) for p in read_products_csv(PRODUCTS_CSV_PATH))
+        return table
+
+    def _load_lexical_index(self) -> LexicalIndex:
+        """BM25 index over the catalog CSV for exact model/brand lookups"""
+        index = LexicalIndex(decisive_ratio=LEXICAL_DECISIVE_RATIO)
+        if HYBRID_RETRIEVAL and os.path.exists(PRODUCTS_CSV_PATH):
+            index.rebuild((p["product_id"], p) for p in read_products_csv(PRODUCTS_CSV_PATH))
+        return index
+
+    @METRICS.timed("context")
+    def _compact_context(self, x):
+        """Replace the retrieved Document list with a deduplicated, token-budgeted product table"""
+        context, stats = self.context_builder.build(x["context"])
+        LOG.debug("context", products=stats["products"], tokens=stats["tokens"], raw_tokens=stats["raw_tokens"])
+        return {**x, "context": context, "model_route": self._choose_model(x, stats["products"])}
+
+    def _choose_model(self, x, products: int):
+        """``(route, score)`` of the model that should answer this turn"""
+        route, score, features = self.model_router.choose(x["question"], x.get("history", ""), products)
+        LOG.info("model_route", route=route, score=round(score, 3), retrieved=products, **features)
+        return route, score
+
+    def _catalog_document(self, product_id: str) -> Optional[Document]:
+        """Document for a catalog product, or None if it is not in the local catalog"""
+        metadata = self.product_table.get(product_id) or self.lexical_index.metadata(product_id)
+        if metadata is None:
+            return None
+        return Document(page_content=product_document(metadata), metadata=metadata, id=vector_id(metadata))
+
+    @METRICS.timed("lexical")
+    def _lexical_lookup(self, question: str):
+        """BM25 hits for the question, plus the documents to use as-is when the lexical match is decisive"""
+        if not HYBRID_RETRIEVAL or not len(self.lexical_index):
+            return [], None
+        hits = self.lexical_index.search(question, k=RETRIEVAL_K)
+        decisive = self.lexical_index.decisive(question, hits)
+        if decisive:
+            return hits, [self._catalog_document(product_id) for product_id in decisive[:RETRIEVAL_K]]
+        return hits, None
+
+    def _fuse(self, hits, vector_docs):
+        """Reciprocal rank fusion of BM25 hits and vector results, cut to RETRIEVAL_K"""
+        if not hits:
+            return vector_docs
+        by_id = {}
+        for doc in vector_docs:
+            by_id.setdefault(str((doc.metadata or {}).get("product_id") or doc.id), doc)
+        fused = reciprocal_rank_fusion([[product_id for product_id, _ in hits], list(by_id)], k=RRF_K)
+        return [
+            by_id[product_id] if product_id in by_id else self._catalog_document(product_id)
+            for product_id, _ in fused[:RETRIEVAL_K]
+        ]
+
+    @staticmethod
+    def _doc_product_id(doc) -> str:
+        return str((doc.metadata or {}).get("product_id") or doc.id)
+
+    def _cached_vector_docs(self, embedding, filter=None):
+        """Retrieval cache lookup: (key, documents), documents None on a miss"""
+        if not self.retrieval_cache.enabled:
+            return None, None
+        key = self.retrieval_cache.make_key(embedding, RETRIEVAL_K, filter)
+        cached = self.retrieval_cache.get(key)
+        if cached is None:
+            return key, None
+        docs = [self._catalog_document(product_id) for product_id, _ in cached]
+        # A product missing from the local catalog can't be rebuilt from its ID: search again
+        return key, (docs if all(doc is not None for doc in docs) else None)
+
+    def _vector_search(self, embedding, key=None, filter=None):
+        """Vector top-k, recorded in the retrieval cache under ``key``"""
+        version = self.catalog_version.current()
+        kwargs = {"filter": filter} if filter else {}
+        results = self.vectorstore.similarity_search_by_vector_with_score(embedding, k=RETRIEVAL_K, **kwargs)
+        if key is not None:
+            self.retrieval_cache.put(key, [(self._doc_product_id(doc), score) for doc, score in results], version)
+        return [doc for doc, _ in results]
+
+    @METRICS.timed("vector_search")
+    def _vector_docs(self, embedding, filter=None):
+        key, docs = self._cached_vector_docs(embedding, filter)
+        return docs if docs is not None else self._vector_search(embedding, key, filter)
+
+    @METRICS.timed("vector_search")
+    async def _avector_docs(self, embedding, filter=None):
+        key, docs = self._cached_vector_docs(embedding, filter)
+        if docs is not None:
+            return docs
+        if isinstance(self.vectorstore, NumpyVectorStore):
+            return self._vector_search(embedding, key, filter)
+        return await asyncio.to_thread(self._vector_search, embedding, key, filter)
+
+    @METRICS.timed("embed")
+    def _embed(self, text: str):
+        return self.embeddings.embed_query(text)
+
+    @METRICS.timed("embed")
+    async def _aembed(self, text: str):
+        return await self.embeddings.aembed_query(text)
+
+    def _retrieve(self, x):
+        hits, decisive = self._lexical_lookup(x["question"])
+        if decisive is not None:
+            return decisive
+        return self._fuse(hits, self._vector_docs(self._embed(x["question"])))
+
+    async def _aretrieve(self, x):
+        hits, decisive = self._lexical_lookup(x["question"])
+        if decisive is not None:
+            return decisive
+        embedding = await self._aembed(x["question"])
+        return self._fuse(hits, await self._avector_docs(embedding))
+
+    @METRICS.timed("router")
+    def _route(self, chain_input: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Catalog answer for a structured question, or None when the LLM is needed"""
+        if self.intent_router is None:
+            return None
+        question, language = chain_input["question"], chain_input["language"]
+        vector = self._embed(question) if self.intent_router.needs_vector(question, language) else None
+        response = self.intent_router.route(question, language, vector)
+        if response is not None:
+            response["products"] = self._format_products(response["products"])
+        return response
+
+    @METRICS.timed("router")
+    async def _aroute(self, chain_input: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        if self.intent_router is None:
+            return None
+        question, language = chain_input["question"], chain_input["language"]
+        # The query embedding is cached, so retrieval reuses it if the router falls through
+        vector = await self._aembed(question) if self.intent_router.needs_vector(question, language) else None
+        response = self.intent_router.route(question, language, vector)
+        if response is not None:
+            response["products"] = self._format_products(response["products"])
+        return response
+
+    @METRICS.timed("prompt")
+    def _render_prompt(self, x):
+        return self.prompt_template.invoke(x)
+
+    @staticmethod
+    def _tag_served_by(message, path: str):
+        message.response_metadata = {**(message.response_metadata or {}), "served_by": path}
+        return message
+
+    def _observe_route(self, model_route, seconds: float):
+        route, score = model_route
+        self.model_router.observe(route, score, seconds)
+        METRICS.record(f"llm_{route}", seconds)
+
+    @METRICS.timed("llm")
+    def _call_llm(self, x):
+        route, _ = x["model_route"]
+        started = time.perf_counter()
+        message = self._tag_served_by(*self.hedged_llms[route].invoke(x["prompt"]))
+        self._observe_route(x["model_route"], time.perf_counter() - started)
+        return message
+
+    @METRICS.timed("llm")
+    async def _acall_llm(self, x):
+        route, _ = x["model_route"]
+        # Cap concurrent Groq calls per worker; the semaphore binds to the running loop lazily
+        async with self.llm_semaphore:
+            started = time.perf_counter()
+            message = self._tag_served_by(*await self.hedged_llms[route].ainvoke(x["prompt"]))
+            self._observe_route(x["model_route"], time.perf_counter() - started)
+            return message
+
+    async def _aretrieve_by_vector(self, embedding, hits=()):
+        """Retrieve with an already computed query embedding, fused with any BM25 hits"""
+        return self._fuse(list(hits), await self._avector_docs(embedding))
+
+    def _sync_catalog_version(self):
+        """Drop cached answers once the catalog changed, here or in the store module"""
+        version = self.catalog_version.current()
+        if version != self._response_cache_version:
+            self._response_cache_version = version
+            self.response_cache.clear()
+
+    async def _acached_response(self, chain_input: Dict[str, str]) -> Dict[str, Any]:
+        """Answer from the response cache when possible, otherwise run the chain and cache the result"""
+        question, language, history = chain_input["question"], chain_input["language"], chain_input["history"]
+        self._sync_catalog_version()
+        hits, context = self._lexical_lookup(question)
+        embedding = None
+        if context is None:
+            embedding = await self._aembed(question)
+
+            cached = self.response_cache.get_similar(language, history, embedding)
+            if cached is not None:
+                return {**cached, "served_by": "cache"}
+
+            context = await self._aretrieve_by_vector(embedding, hits)
+        product_ids = [doc.metadata.get("product_id") or doc.id or doc.page_content for doc in context]
+        key = ResponseCache.make_key(question, language, history, product_ids)
+        cached = self.response_cache.get_exact(key)
+        if cached is not None:
+            return {**cached, "served_by": "cache"}
+
+        self.response_cache.record_miss()
+        response = await self.answer_chain.ainvoke({**chain_input, "context": context})
+        if self._cacheable(response):
+            self.response_cache.put(key, response, embedding)
+        return response
+
+    @staticmethod
+    def _cacheable(response: Dict[str, Any]) -> bool:
+        """Only full-quality answers are cached: neither a fallback-model answer nor an apology for an
+        unparseable reply may outlive the failure that produced it"""
+        return response.get("served_by") in (PRIMARY, HEDGE)
+
     def _format_chat_history(self, history):
         """Format chat history into a string for the prompt."""
         if not history:
@@ -209,78 +718,118 @@ class EmilyAssistant:
                     except:
                         continue
                 
-                # Format the message
-                user_role = "Customer" if role.lower() == "user" else "Emily"
-                formatted_history.append(f"{user_role}: {content}")
+                formatted_history.append((role, content))
         except Exception as e:
-            print(f"Error formatting history: {str(e)}")
-            traceback.print_exc()  # Print full stack trace
+            LOG.exception("history_format_failed", error=str(e))
             return ""  # Return empty string on error
         
-        return "\n".join(formatted_history)
+        # Recent turns verbatim, older ones folded into a cached rolling summary
+        return self.history_manager.format(formatted_history)
+
+    def _session_history(self, conversation_id: str, history) -> str:
+        """Formatted history of a server-side session; a client-sent history replaces it."""
+        if history:
+            messages = [
+                {"role": m["role"], "content": m["content"]} if isinstance(m, dict) else {"role": m.role, "content": m.content}
+                for m in history
+            ]
+            self.session_store.reset(conversation_id, messages)
+        session = self.session_store.get(conversation_id)
+        if session is None:
+            return ""
+        return self.session_store.formatted_history(session, self._format_chat_history)
+
+    def _record_turn(self, conversation_id: Optional[str], query: str, messages: List[Dict[str, Any]]):
+        """Append the user query and Emily's reply to the session."""
+        if not conversation_id:
+            return
+        self.session_store.append(conversation_id, "user", query)
+        self.session_store.append(conversation_id, "assistant", " ".join(m.get("text", "") for m in messages))
     
+    def _product_id_mode(self) -> bool:
+        # Hydration needs the catalog table; without it fall back to full objects from the LLM
+        return PRODUCT_ID_MODE and len(self.product_table) > 0
+
+    def _hydrate_products(self, products):
+        """Replace product IDs from the LLM with catalog records; unknown bare IDs are dropped."""
+        hydrated = []
+        seen = set()
+        for product in products:
+            product_id = str(product.get("product_id") or product.get("id") or "")
+            if product_id and product_id in seen:
+                continue
+            record = (self.product_table.get(product_id) or self.lexical_index.metadata(product_id)) if product_id else None
+            if record is not None:
+                hydrated.append(record)
+            elif set(product) - {"product_id", "id"}:
+                hydrated.append(product)
+            else:
+                continue
+            seen.add(product_id)
+        return hydrated
+
+    def _format_products(self, products):
+        """Ensure every product returned by the LLM carries the fields the client renders."""
+        formatted_products = []
+        
+        for product in self._hydrate_products(products):
+            # Ensure all required fields are present
+            formatted_product = {
+                "name": product.get("name", f"{product.get('brand', '')} {product.get('model', '')}").strip(),
+                "description": product.get("description", "Product description not available"),
+                "price": product.get("price", product.get("MRP", "Price not available")),
+                "category": product.get("category", product.get("Category", "Uncategorized")),
+                "img": product.get("img", product.get("image", "/default-product.jpg"))
+            }
+            
+            # Copy any additional fields that might be useful
+            for key, value in product.items():
+                if key not in formatted_product and key not in ["name", "description", "price", "category", "img"]:
+                    formatted_product[key] = value
+            
+            formatted_products.append(formatted_product)
+        
+        return formatted_products
+
+    def _vary_opening(self, message):
+        """Replace a generic greeting at the start of the first message with a varied opening."""
+        if any(message["text"].lower().startswith(greeting) for greeting in
+               ["hi there", "hello", "hi ", "greetings", "hey there"]):
+            message["text"] = random.choice(self.opening_phrases) + message["text"].split(",", 1)[1] if "," in message["text"] else message["text"]
+        return message
+
+    @METRICS.timed("format")
     def _format_output(self, llm_output):
         """Format the LLM output into the required structured JSON format with complete product information."""
+        # Which LLM route answered (see hedging.py); set by _call_llm/_acall_llm
+        served_by = (getattr(llm_output, "response_metadata", None) or {}).get("served_by", "primary")
         try:
             response = llm_output.content
 
             # Basic output structure
             structured_response = {
                 "messages": [],
-                "products": []
+                "products": [],
+                "served_by": served_by
             }
 
-            # Fast path for properly formatted JSON
-            try:
-                parsed_response = json.loads(response)
-                
+            # Tolerant extraction: preambles, code fences, trailing commas and cut-off replies are repaired
+            parsed_response = parse_reply(response)
+            if parsed_response is not None:
                 # Process products and ensure all required fields exist
-                if "products" in parsed_response and isinstance(parsed_response["products"], list):
-                    products = parsed_response.get("products", [])
-                    formatted_products = []
-                    
-                    for product in products:
-                        # Ensure all required fields are present
-                        formatted_product = {
-                            "name": product.get("name", f"{product.get('brand', '')} {product.get('model', '')}").strip(),
-                            "description": product.get("description", "Product description not available"),
-                            "price": product.get("price", product.get("MRP", "Price not available")),
-                            "category": product.get("category", product.get("Category", "Uncategorized")),
-                            "img": product.get("img", product.get("image", "/default-product.jpg"))
-                        }
-                        
-                        # Copy any additional fields that might be useful
-                        for key, value in product.items():
-                            if key not in formatted_product and key not in ["name", "description", "price", "category", "img"]:
-                                formatted_product[key] = value
-                        
-                        formatted_products.append(formatted_product)
-                    
-                    structured_response["products"] = formatted_products
+                structured_response["products"] = self._format_products(parsed_response["products"])
                 
                 # Process messages
-                if "messages" in parsed_response and isinstance(parsed_response["messages"], list):
-                    messages = parsed_response["messages"][:3]
-                    
-                    # Check if first message starts with a generic greeting and replace if needed
-                    if len(messages) > 0 and any(messages[0]["text"].lower().startswith(greeting) for greeting in 
-                                                ["hi there", "hello", "hi ", "greetings", "hey there"]):
-                        messages[0]["text"] = random.choice(self.opening_phrases) + messages[0]["text"].split(",", 1)[1] if "," in messages[0]["text"] else messages[0]["text"]
+                messages = parsed_response["messages"][:3]
+                if messages:
+                    messages[0] = self._vary_opening(messages[0])
                     
                     # Ensure we have exactly 3 messages
                     while len(messages) < 3:
-                        messages.append({
-                            "text": "Is there anything specific about these products you'd like to know?",
-                            "facialExpression": "smile",
-                            "animation": "Standing Idle"
-                        })
+                        messages.append(dict(FOLLOW_UP_MESSAGE))
                     
                     structured_response["messages"] = messages
                     return structured_response
-                
-            except json.JSONDecodeError:
-                # If not valid JSON, fall through to text processing
-                pass
             
             # Fallback text processing - simplified
             main_text = response
@@ -317,59 +866,185 @@ class EmilyAssistant:
                     {"text": "I'm sorry, I couldn't process your request properly right now.", "facialExpression": "sad", "animation": "SadIdle"},
                     {"text": "Could you try rephrasing your question, or ask about a specific product category?", "facialExpression": "default", "animation": "Idle"}
                 ],
-                "products": []
+                "products": [],
+                # An apology, not an answer: never cached or replayed
+                "served_by": "error"
             }
 
-    def get_response(self, query: str, history: List[ChatMessage] = None, language: str = "english") -> Dict[str, Any]:
-        """Process the query with chat history and return a response"""
-        try:
-            # Ensure query is a string
-            if not isinstance(query, str):
-                if isinstance(query, dict) and 'query' in query:
-                    query = query['query']
-                    language = query.get('language', 'english')
-                elif isinstance(query, dict) and 'question' in query:
-                    query = query['question']
-                    language = query.get('language', 'english')
+    @METRICS.timed("prepare")
+    def _prepare_chain_input(self, query, history, language: str, conversation_id: Optional[str] = None) -> Dict[str, str]:
+        """Normalize the query and format history into the RAG chain input."""
+        # Ensure query is a string
+        if not isinstance(query, str):
+            if isinstance(query, dict) and 'query' in query:
+                query = query['query']
+                language = query.get('language', 'english')
+            elif isinstance(query, dict) and 'question' in query:
+                query = query['question']
+                language = query.get('language', 'english')
+            else:
+                query = str(query)
+        
+        # Process and format history safely
+        formatted_history = ""
+        if conversation_id or history:
+            try:
+                if conversation_id:
+                    formatted_history = self._session_history(conversation_id, history)
                 else:
-                    query = str(query)
-            
-            # Process and format history safely
-            formatted_history = ""
-            if history:
-                try:
                     formatted_history = self._format_chat_history(history)
-                except Exception as e:
-                    print(f"Error formatting history: {str(e)}")
-                    traceback.print_exc()
-                    formatted_history = ""
-            
-            print(f"Query: {query}")
-            print(f"Formatted history: {formatted_history}")
-            print(f"Language: {language}")
-            
-            # Make sure we're passing strings to the RAG chain
-            response = self.rag_chain.invoke({
-                "question": query,
-                "history": formatted_history,
-                "language": language
-            })
+            except Exception as e:
+                LOG.exception("history_format_failed", error=str(e))
+                formatted_history = ""
+        
+        fields = {"language": language, "query_chars": len(query), "history_chars": len(formatted_history)}
+        if LOG_CONTENT:
+            fields.update(query=query, history=formatted_history)
+        LOG.debug("chain_input", **fields)
+        
+        # Make sure we're passing strings to the RAG chain
+        return {
+            "question": query,
+            "history": formatted_history,
+            "language": language
+        }
+
+    def _error_response(self) -> Dict[str, Any]:
+        return {
+            "messages": [
+                {"text": "I'm sorry, I encountered an error processing your request.", "facialExpression": "sad", "animation": "Standing Idle"},
+                {"text": "Could you try asking your question in a different way?", "facialExpression": "default", "animation": "Standing Idle"},
+                {"text": "I'm here to help with product information and shopping assistance.", "facialExpression": "smile", "animation": "Talking"}
+            ],
+            "products": [],
+            "served_by": "error"
+        }
+
+    def _flight_key(self, chain_input: Dict[str, str]) -> tuple:
+        """Requests with equal keys get the same answer; the catalog version keeps writes visible"""
+        return (normalize_query(chain_input["question"]), chain_input["language"].lower(),
+                history_fingerprint(chain_input["history"]), self.catalog_version.current())
+
+    def _answer(self, chain_input: Dict[str, str]) -> Dict[str, Any]:
+        response = self._route(chain_input)
+        if response is not None:
+            return {**response, "served_by": "catalog"}
+        return self.rag_chain.invoke(chain_input)
+
+    async def _aanswer(self, chain_input: Dict[str, str]) -> Dict[str, Any]:
+        response = await self._aroute(chain_input)
+        if response is not None:
+            response = {**response, "served_by": "catalog"}
+        elif self.response_cache.enabled:
+            response = await self._acached_response(chain_input)
+        else:
+            response = await self.rag_chain.ainvoke(chain_input)
+        return response
+
+    def get_response(self, query: str, history: List[ChatMessage] = None, language: str = "english",
+                     conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """Process the query with chat history and return a response"""
+        deadline = start_deadline(LLM_DEADLINE)
+        try:
+            chain_input = self._prepare_chain_input(query, history, language, conversation_id)
+            response = self.single_flight.do_sync(self._flight_key(chain_input), lambda: self._answer(chain_input))
+            self._record_turn(conversation_id, chain_input["question"], response["messages"])
             return response
         except Exception as e:
-            print(f"Error in get_response: {str(e)}")
-            traceback.print_exc()
-            return {
-                "messages": [
-                    {"text": "I'm sorry, I encountered an error processing your request.", "facialExpression": "sad", "animation": "Standing Idle"},
-                    {"text": "Could you try asking your question in a different way?", "facialExpression": "default", "animation": "Standing Idle"},
-                    {"text": "I'm here to help with product information and shopping assistance.", "facialExpression": "smile", "animation": "Talking"}
-                ],
-                "products": []
-            }
+            LOG.exception("get_response_failed", error=str(e))
+            return self._error_response()
+        finally:
+            reset_deadline(deadline)
+
+    async def aget_response(self, query: str, history: List[ChatMessage] = None, language: str = "english",
+                            conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """Async variant of get_response that never blocks the event loop"""
+        deadline = start_deadline(LLM_DEADLINE)
+        try:
+            chain_input = self._prepare_chain_input(query, history, language, conversation_id)
+            # Concurrent identical questions share one run; each conversation still records its own turn
+            response = await self.single_flight.do(self._flight_key(chain_input), lambda: self._aanswer(chain_input))
+            self._record_turn(conversation_id, chain_input["question"], response["messages"])
+            return response
+        except Exception as e:
+            LOG.exception("aget_response_failed", error=str(e))
+            return self._error_response()
+        finally:
+            reset_deadline(deadline)
         
         
+    async def astream_response(self, query: str, history: List[ChatMessage] = None, language: str = "english",
+                               conversation_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream avatar messages one by one as soon as each JSON object closes in the LLM output"""
+        parser = AvatarStreamParser()
+        messages_sent = 0
+        products_sent = False
+        sent_messages = []
+        chain_input = None
+        served_by = "primary"
+        # Reset by hand rather than in finally: an async generator may be closed from another context
+        deadline = start_deadline(LLM_DEADLINE)
+        try:
+            chain_input = self._prepare_chain_input(query, history, language, conversation_id)
+            routed = await self._aroute(chain_input)
+            if routed is not None:
+                for message in routed["messages"]:
+                    yield {"type": "message", "index": messages_sent, "message": message}
+                    messages_sent += 1
+                yield {"type": "products", "products": routed["products"]}
+                self._record_turn(conversation_id, chain_input["question"], routed["messages"])
+                reset_deadline(deadline)
+                yield {"type": "done", "served_by": "catalog"}
+                return
+            context = await self._aretrieve(chain_input)
+            x = self._compact_context({**chain_input, "context": context})
+            prompt_value = self._render_prompt(x)
+            route, _ = x["model_route"]
+
+            async with self.llm_semaphore:
+                llm_started = time.perf_counter()
+                first_token = True
+                async for chunk, served_by in self.hedged_llms[route].astream(prompt_value):
+                    if first_token:
+                        first_token = False
+                        METRICS.record("llm_first_token", time.perf_counter() - llm_started)
+                    for kind, payload in parser.feed(chunk.content or ""):
+                        if kind == "message" and messages_sent < 3:
+                            message = self._vary_opening(payload) if messages_sent == 0 else payload
+                            yield {"type": "message", "index": messages_sent, "message": message}
+                            sent_messages.append(message)
+                            messages_sent += 1
+                        elif kind == "products" and not products_sent:
+                            yield {"type": "products", "products": self._format_products(payload)}
+                            products_sent = True
+                METRICS.record("llm", time.perf_counter() - llm_started)
+                self._observe_route(x["model_route"], time.perf_counter() - llm_started)
+        except Exception as e:
+            LOG.exception("astream_response_failed", error=str(e))
+            parser = None
+            served_by = "error"
+        reset_deadline(deadline)
+
+        # Anything the incremental parser could not deliver comes from the regular formatter
+        if parser is None:
+            fallback = self._error_response()
+        elif messages_sent < 3 or not products_sent:
+            fallback = self._format_output(AIMessage(content=parser.buffer))
+        else:
+            fallback = None
+        if fallback is not None:
+            for message in fallback["messages"][messages_sent:3]:
+                yield {"type": "message", "index": messages_sent, "message": message}
+                sent_messages.append(message)
+                messages_sent += 1
+            if not products_sent:
+                yield {"type": "products", "products": fallback["products"]}
+        if parser is not None:
+            self._record_turn(conversation_id, chain_input["question"], sent_messages)
+        yield {"type": "done", "served_by": served_by}
+
     def add_product_to_index(self, product: ProductItem) -> bool:
-        """Add a product to the Pinecone index."""
+        """Add a product to the configured vector index."""
         try:
             # Convert the product to a format suitable for the vector store
             product_dict = product.dict()
@@ -389,37 +1064,122 @@ Discount: {product_dict['Discount']}"""
                 "model": product_dict['Model'],
                 "name": f"{product_dict['Brand']} {product_dict['Model']}",
                 "price": product_dict['MRP'],
+                "mrp": product_dict['MRP'],
                 "description": product_dict['Description'],
                 "discount": product_dict['Discount'],
-                "img": product_dict.get('Image_URL', f"/products/{product_dict['Product_ID']}.jpg")
+                "stock": product_dict['Stock'],
+                "warranty": product_dict['Warranty'],
+                "rating": product_dict['Rating'],
+                "img": product_dict.get('Image_URL') or f"/products/{product_dict['Product_ID']}.jpg"
             }
             
-            # Add to Pinecone
+            # Add to the vector index
             self.vectorstore.add_texts(
                 texts=[document_content],
                 metadatas=[metadata],
                 ids=[f"product_{product_dict['Product_ID']}"]
             )
+            if isinstance(self.vectorstore, NumpyVectorStore) and LOCAL_INDEX_PATH:
+                self.vectorstore.save(LOCAL_INDEX_PATH)
+            self.product_table.upsert(metadata["product_id"], metadata)
+            self.lexical_index.add(metadata["product_id"], metadata)
+            # Cached answers and retrieval results may reference a stale catalog
+            self.catalog_version.bump()
+            self.response_cache.clear()
             
             return True
         except Exception as e:
-            print(f"Error adding product to index: {str(e)}")
+            LOG.exception("add_product_failed", error=str(e))
             return False
 
+# Startup runs in phases off the event loop so uvicorn binds its port immediately
+STARTUP = StartupTracker(["embedding_model", "assistant", "warmup"])
+EMILY_ASSISTANT = None
+_INIT_LOCK = threading.Lock()
+
+def initialize_assistant():
+    """Load the embedding model, build the assistant and warm it up, timing each phase"""
+    global EMILY_ASSISTANT
+    with _INIT_LOCK:
+        if EMILY_ASSISTANT is not None:
+            return EMILY_ASSISTANT
+        with STARTUP.phase("embedding_model"):
+            embedding_model = load_embedding_model()
+        with STARTUP.phase("assistant"):
+            assistant = EmilyAssistant(embedding_model)
+        if STARTUP_WARMUP:
+            try:
+                with STARTUP.phase("warmup"):
+                    assistant.warmup()
+            except Exception:
+                # Still serve: a failed warmup costs the first requests latency, and /readyz reports "degraded"
+                LOG.exception("startup_warmup_failed")
+        else:
+            STARTUP.skip("warmup")
+        EMILY_ASSISTANT = assistant
+        STARTUP.mark_ready()
+        print(f"EmilyAssistant ready: {STARTUP.report()['phases']}")
+        return assistant
+
+async def initialize_with_retry():
+    """Run initialize_assistant off the loop, retrying with backoff so a transient failure does not leave the
+    server answering 503 until it is restarted"""
+    loop = asyncio.get_running_loop()
+    delay = STARTUP_RETRY_BACKOFF
+    for attempt in range(1, STARTUP_RETRIES + 2):
+        try:
+            return await loop.run_in_executor(None, initialize_assistant)
+        except Exception as e:
+            if attempt > STARTUP_RETRIES:
+                LOG.exception("startup_failed", exc=e, attempt=attempt, retrying=False)
+                raise
+            LOG.exception("startup_failed", exc=e, attempt=attempt, retrying=True, retry_in_seconds=delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 60.0)
+
+def _startup_done(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        LOG.error("startup_gave_up", error=str(task.exception()), attempts=STARTUP_RETRIES + 1)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("FastAPI server starting...")
+    STARTUP.begin()
+    init_task = asyncio.ensure_future(initialize_with_retry())
+    init_task.add_done_callback(_startup_done)
+    yield
+    if not init_task.done():
+        init_task.cancel()
+    if EMILY_ASSISTANT is not None and SESSION_STORE_PATH:
+        EMILY_ASSISTANT.session_store.save()
+    LOG.flush()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Emily AI Retail Assistant API",
-    on_startup=[lambda: print("FastAPI server starting...")]
+    lifespan=lifespan
 )
+app.add_middleware(ServerTimingMiddleware, metrics=METRICS, logger=LOG)
 
-# Pre-initialize the assistant at module level (will be created when first imported)
-print("Pre-initializing EmilyAssistant singleton...")
-EMILY_ASSISTANT = EmilyAssistant()
-print("EmilyAssistant singleton created and ready!")
-
-# Simple function to get the pre-initialized assistant
 def get_assistant():
-    return EMILY_ASSISTANT
+    """Return the assistant, or 503 while it is still starting up"""
+    if EMILY_ASSISTANT is not None:
+        return EMILY_ASSISTANT
+    if not STARTUP.started:
+        # Used outside the server (e.g. the catalog.py CLI): initialize synchronously
+        return initialize_assistant()
+    raise HTTPException(status_code=503, detail="Assistant is starting up")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the assistant is loaded, with per-phase startup timings"""
+    report = STARTUP.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
 
 # class LLMQueryRequest(BaseModel):
 #     query: str
@@ -438,17 +1198,16 @@ async def get_llm_response(request: LLMQueryRequest):
         # Extract history if present
         history = getattr(request, 'history', None)
         
-        # Debug information
-        print(f"Processing query: '{query}', Language: {language}, History present: {history is not None}")
-        if history:
-            print(f"History type: {type(history)}, length: {len(history)}")
+        fields = {"language": language, "history_turns": len(history) if history else 0, "query_chars": len(query)}
+        if LOG_CONTENT:
+            fields["query"] = query
+        LOG.info("llm_request", conversation_id=request.conversation_id, **fields)
         
         # Generate a response with proper error handling
         try:
-            response = assistant.get_response(query, history, language)
+            response = await assistant.aget_response(query, history, language, request.conversation_id)
         except Exception as e:
-            print(f"Error in assistant.get_response: {str(e)}")
-            traceback.print_exc()
+            LOG.exception("llm_response_failed", error=str(e))
             # Fallback response
             response = {
                 "messages": [
@@ -456,15 +1215,29 @@ async def get_llm_response(request: LLMQueryRequest):
                     {"text": "Our systems are experiencing some issues right now.", "facialExpression": "default", "animation": "Idle"},
                     {"text": "Please try again in a moment.", "facialExpression": "smile", "animation": "Talking"}
                 ],
-                "products": []
+                "products": [],
+                "served_by": "error"
             }
         
         return response
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error processing query: {str(e)}")
-        traceback.print_exc()
+        LOG.exception("llm_request_failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
    
+@app.post("/api/llm/response/stream")
+async def stream_llm_response(request: LLMQueryRequest):
+    """Stream the avatar response as NDJSON: one line per message, then products, then done"""
+    assistant = get_assistant()
+    history = getattr(request, 'history', None)
+
+    async def ndjson_lines():
+        async for event in assistant.astream_response(request.query, history, request.language.lower(), request.conversation_id):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 @app.post("/api/llm/addproduct", status_code=201)
 async def add_product(product: ProductItem):
     """Add a new product to the Pinecone index"""
@@ -475,56 +1248,148 @@ async def add_product(product: ProductItem):
             return {"message": f"Product {product.Brand} {product.Model} added successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to add product")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-# Get all products from pinecone
+@app.post("/api/llm/ingest")
+async def ingest_products(request: IngestRequest = Body(default=IngestRequest())):
+    """Bulk-ingest a catalog CSV into the vector index"""
+    try:
+        assistant = get_assistant()
+        stats = await asyncio.to_thread(assistant.ingest_catalog, request.csv_path, request.prune)
+        return {"status": "success", "data": stats}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Catalog file not found: {e.filename}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+# List catalog products from the local columnar table
 @app.get("/products/", response_model=ProductResponse)
 async def get_products(
     brand: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    sort_by: Optional[str] = Query(None, pattern="^(price|rating|stock)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
 ):
     try:
-        # Build filter
-        filter_dict = {}
-        if brand:
-            filter_dict["brand"] = {"$eq": brand}
-        if category:
-            filter_dict["category"] = {"$eq": category}
-        if min_price is not None:
-            filter_dict["MRP"] = {"$gte": min_price}
-        if max_price is not None:
-            if "MRP" in filter_dict:
-                filter_dict["MRP"]["$lte"] = max_price
-            else:
-                filter_dict["MRP"] = {"$lte": max_price}
-        
-        # Query Pinecone
-        query_vector = [0.0] * 384  # Dummy vector for metadata search
-        results = index.query(
-            vector=query_vector,
-            filter=filter_dict if filter_dict else None,
-            top_k=100,
-            include_metadata=True
+        data = get_assistant().product_table.query(
+            brand=brand,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            sort_by=sort_by,
+            order=order,
+            limit=limit,
+            cursor=cursor
         )
         
-        # Format results
-        products = []
-        for match in results.matches:
-            product = match.metadata if hasattr(match, "metadata") else {}
-            product["id"] = match.id
-            products.append(product)
-        
         return {
             "status": "success",
-            "data": {"products": products, "count": len(products)}
+            "data": data
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus histograms: per-stage latency and per-route request latency"""
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/llm/log-stats")
+async def log_stats():
+    """Logger throughput, sampling and drop counters, and the per-record enqueue cost"""
+    return LOG.stats()
+
+@app.get("/api/llm/coalescing-stats")
+async def coalescing_stats():
+    """Single-flight counters: pipeline runs, requests that joined one in flight instead, and errors"""
+    assistant = get_assistant()
+    return assistant.single_flight.stats()
+
+@app.get("/api/llm/llm-stats")
+async def llm_stats():
+    """Per model route: which path served LLM calls (primary, hedge, fallback), hedges sent and deadline misses"""
+    assistant = get_assistant()
+    return {route: hedged.stats() for route, hedged in assistant.hedged_llms.items()}
+
+@app.get("/api/llm/model-routing")
+async def model_routing():
+    """Small/large routing decisions, per-route LLM latency and latency by complexity score decile"""
+    assistant = get_assistant()
+    return assistant.model_router.stats()
+
+@app.get("/api/llm/embedding-stats")
+async def embedding_stats():
+    """Embedding cache metrics and batch-size distribution of the query embedding dispatcher"""
+    assistant = get_assistant()
+    dispatcher = assistant.embedding_dispatcher
+    data = {"batching": isinstance(dispatcher, BatchedEmbeddings), "cache": assistant.embeddings.stats()}
+    if isinstance(dispatcher, BatchedEmbeddings):
+        data.update(dispatcher.stats())
+    return {"status": "success", "data": data}
+
+
+@app.get("/api/llm/cache-stats")
+async def cache_stats():
+    """Hit/miss counters of the response cache and the retrieval cache"""
+    assistant = get_assistant()
+    return {"status": "success", "data": {**assistant.response_cache.stats(), "retrieval": assistant.retrieval_cache.stats()}}
+
+
+@app.get("/api/llm/context-stats")
+async def context_stats():
+    """Prompt context token usage, compacted vs. the raw Document list, history summary reuse and lexical short-circuits"""
+    assistant = get_assistant()
+    return {"status": "success", "data": {
+        **assistant.context_builder.stats(),
+        "history": assistant.history_manager.stats(),
+        "lexical": assistant.lexical_index.stats()
+    }}
+
+
+@app.get("/api/llm/router-stats")
+async def router_stats():
+    """Share of queries answered from the catalog by the intent router, by intent and fall-through reason"""
+    router = get_assistant().intent_router
+    return {"status": "success", "data": router.stats() if router is not None else {"enabled": False}}
+
+
+@app.get("/api/llm/sessions")
+async def session_stats():
+    """Session store size, byte usage and eviction counters"""
+    return {"status": "success", "data": get_assistant().session_store.stats()}
+
+
+@app.get("/api/llm/sessions/{conversation_id}")
+async def session_info(conversation_id: str):
+    """Message count, bytes held and idle time of one session"""
+    info = get_assistant().session_store.session_info(conversation_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success", "data": info}
+
+
+@app.delete("/api/llm/sessions/{conversation_id}")
+async def delete_session(conversation_id: str):
+    """Forget a conversation"""
+    if not get_assistant().session_store.delete(conversation_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "success", "message": f"Session {conversation_id} deleted"}
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -532,8 +1397,7 @@ async def root():
 
 @app.exception_handler(Exception)
 async def generic_exception_handler(request, exc):
-    print(f"Unhandled exception: {str(exc)}")
-    traceback.print_exc()
+    LOG.exception("unhandled_exception", exc=exc, error=str(exc))
     return JSONResponse(
         status_code=500,
         content={"detail": f"Internal server error: {str(exc)}"}
@@ -1,12 +1,23 @@
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from pinecone import Pinecone
+from langchain_huggingface import HuggingFaceEmbeddings
+import asyncio
 import os
 import uuid
 from dotenv import load_dotenv
 from datetime import datetime
+from write_behind import WriteBehindQueue, DELETE, TEXT_KEY
+from facets import FacetIndex
+from product_table import ProductTable
+from catalog_version import CatalogVersion
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics, ServerTimingMiddleware
+from structured_log import StructuredLogger
+from singleflight import SingleFlight
+import threading
 
 # Load environment variables
 load_dotenv()
@@ -22,13 +33,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage latency histograms (/metrics) and Server-Timing headers
+METRICS = Metrics("store", enabled=os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes"))
+# One structured record per request, tagged with its request ID and spans
+LOG = StructuredLogger(
+    "store",
+    level=os.getenv("LOG_LEVEL", "info"),
+    sample_rates={"debug": float(os.getenv("LOG_SAMPLE_DEBUG", "0.1")), "info": float(os.getenv("LOG_SAMPLE_INFO", "1.0"))},
+    max_field_chars=int(os.getenv("LOG_MAX_FIELD_CHARS", "256")),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+)
+app.add_middleware(ServerTimingMiddleware, metrics=METRICS, logger=LOG)
+
 # Initialize Pinecone with new method
 pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
 index_name = os.getenv("PINECONE_INDEX_NAME", "product-store")
-index = pc.Index(index_name)
+# Every Pinecone call is a timed stage, including the write-behind flushes
+index = METRICS.instrument(pc.Index(index_name), {
+    "upsert": "pinecone_upsert",
+    "delete": "pinecone_delete",
+    "fetch": "pinecone_fetch",
+    "query": "pinecone_query",
+    "list": "pinecone_list",
+})
+
+# Same embedding model as the assistant so CRUD products are visible to semantic search
+EMBEDDING_MODEL = METRICS.instrument(HuggingFaceEmbeddings(
+    model_name="sentence-transformers/all-MiniLM-L6-v2",
+    model_kwargs={'device': 'cpu'}
+), {"embed_documents": "embed"})
 
 # Data models
 class ProductBase(BaseModel):
+    name: Optional[str] = None
     brand: str
     category: str
     description: str
@@ -40,6 +77,7 @@ class ProductCreate(ProductBase):
     pass
 
 class ProductUpdate(BaseModel):
+    name: Optional[str] = None
     brand: Optional[str] = None
     category: Optional[str] = None
     description: Optional[str] = None
@@ -66,36 +104,168 @@ def format_product_for_pinecone(product_data, product_id=None):
     # Current timestamp
     now = datetime.now().isoformat()
     
-    # Create metadata
+    brand = product_data.get("brand", "")
+    category = product_data.get("category", "")
+    mrp = float(product_data.get("MRP", 0))
+    
+    # Create metadata; product_id, name, price and mrp are the fields the assistant renders
     metadata = {
-        "brand": product_data.get("brand", ""),
-        "category": product_data.get("category", ""),
+        "product_id": product_id,
+        "name": product_data.get("name") or f"{brand} {category}".strip(),
+        "brand": brand,
+        "category": category,
         "description": product_data.get("description", ""),
-        "MRP": float(product_data.get("MRP", 0)),
+        "MRP": mrp,
+        "mrp": mrp,
+        "price": mrp,
         "stock": int(product_data.get("stock", 0)),
         "warranty": product_data.get("warranty", ""),
         "created_at": product_data.get("created_at", now),
         "updated_at": now
     }
     
-    # Simple vector (replace with actual embeddings in production)
-    vector = [0.0] * 384  # Adjust dimension as needed
+    return product_id, metadata
+
+def product_text(metadata):
+    """Text embedded for semantic search over a product"""
+    return f"""Product: {metadata.get('name', '')}
+Brand: {metadata.get('brand', '')}
+Category: {metadata.get('category', '')}
+Description: {metadata.get('description', '')}
+Price: {metadata.get('MRP', '')}
+Warranty: {metadata.get('warranty', '')}"""
+
+# Mutations are embedded and written to Pinecone in coalesced batches
+WRITE_QUEUE = WriteBehindQueue(
+    index,
+    EMBEDDING_MODEL,
+    product_text,
+    max_batch=int(os.getenv("WRITE_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5")),
+    max_retries=int(os.getenv("WRITE_MAX_RETRIES", "5")),
+    logger=LOG
+)
+
+@app.on_event("shutdown")
+def flush_pending_writes():
+    WRITE_QUEUE.close()
+    LOG.flush()
+
+# Category/brand counts and the columnar listing table, both maintained by the CRUD endpoints
+FACETS = FacetIndex()
+PRODUCT_TABLE = ProductTable(price_field="MRP")
+CATALOG_LOAD_LOCK = threading.Lock()
+# Bumped on every write so the assistant's retrieval and response caches drop stale entries
+CATALOG_VERSION = CatalogVersion(os.getenv("CATALOG_VERSION_PATH", "catalog_version") or None)
+# Identical concurrent listing reads share one computation; keys carry the catalog version
+READS = SingleFlight("store_reads", enabled=os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes"))
+
+def stored_metadata(metadata):
+    """Product fields of index metadata, without the embedded text kept for vector search"""
+    metadata = dict(metadata or {})
+    metadata.pop(TEXT_KEY, None)
+    return metadata
+
+def scan_products():
+    """Yield (product_id, metadata) for every product in the index"""
+    try:
+        # Serverless indexes can enumerate IDs page by page
+        for ids in index.list():
+            ids = list(ids)
+            if not ids:
+                continue
+            response = index.fetch(ids=ids)
+            for product_id, vector_data in response.vectors.items():
+                yield product_id, stored_metadata(vector_data.metadata)
+    except Exception as e:
+        LOG.warning("index_list_unavailable", error=str(e))
+        query_vector = [0.0] * 384
+        results = index.query(vector=query_vector, top_k=10000, include_metadata=True)
+        for match in results.matches:
+            yield match.id, stored_metadata(getattr(match, "metadata", None))
+
+@METRICS.timed("catalog_load")
+def load_catalog(force=False):
+    """Fill the facet index and product table from one full scan of the index"""
+    with CATALOG_LOAD_LOCK:
+        if FACETS.ready and PRODUCT_TABLE.ready and not force:
+            return
+        # Journal CRUD writes that land during the scan so they are not lost
+        FACETS.begin_rebuild()
+        PRODUCT_TABLE.begin_rebuild()
+        try:
+            products = list(scan_products())
+            FACETS.rebuild(products)
+            PRODUCT_TABLE.rebuild(products)
+        finally:
+            # Each rebuild clears its own journal; after a failed scan (or a failed first rebuild)
+            # nothing else would, and it would grow with every write
+            FACETS.cancel_rebuild()
+            PRODUCT_TABLE.cancel_rebuild()
+
+def bump_catalog_version(_future=None):
+    CATALOG_VERSION.bump()
+
+def record_upsert(product_id, metadata, future):
+    FACETS.apply(product_id, metadata)
+    PRODUCT_TABLE.upsert(product_id, metadata)
+    # Once now, and again when the write reaches Pinecone, so results cached in between are dropped too
+    bump_catalog_version()
+    future.add_done_callback(bump_catalog_version)
+
+def record_delete(product_id, future):
+    FACETS.remove(product_id)
+    PRODUCT_TABLE.remove(product_id)
+    bump_catalog_version()
+    future.add_done_callback(bump_catalog_version)
+
+async def ensure_catalog_loaded():
+    if not (FACETS.ready and PRODUCT_TABLE.ready):
+        await asyncio.to_thread(load_catalog)
+
+@app.on_event("startup")
+async def warm_catalog():
+    # Load in the background so startup is not blocked on a full scan
+    asyncio.get_running_loop().run_in_executor(None, load_catalog)
+
+def fetch_product(product_id):
+    """Current product metadata, including writes that have not been flushed yet"""
+    pending = WRITE_QUEUE.pending(product_id)
+    if pending is not None:
+        operation, metadata = pending
+        return None if operation == DELETE else metadata
+    
+    response = index.fetch(ids=[product_id])
     
-    return product_id, vector, metadata
+    # Check if product exists in the new response format
+    if not response.vectors or product_id not in response.vectors:
+        return None
+    
+    # Access data using the new response format
+    return stored_metadata(response.vectors[product_id].metadata)
+
+async def write_result(future, wait: bool):
+    """Await the queued write when the caller needs read-your-writes"""
+    if wait:
+        await asyncio.wrap_future(future)
+        return "success"
+    return "pending"
 
 # API Routes
 @app.post("/products/", response_model=ProductResponse)
-async def create_product(product: ProductCreate):
+async def create_product(product: ProductCreate, wait: bool = False):
     try:
         product_dict = product.dict()
-        product_id, vector, metadata = format_product_for_pinecone(product_dict)
+        product_id, metadata = format_product_for_pinecone(product_dict)
         
-        # Upsert to Pinecone
-        index.upsert(vectors=[(product_id, vector, metadata)])
+        # Queue the upsert; it is flushed to Pinecone in the background
+        future = WRITE_QUEUE.upsert(product_id, metadata)
+        record_upsert(product_id, metadata, future)
+        status = await write_result(future, wait)
         
         return {
-            "status": "success",
-            "message": "Product added successfully",
+            "status": status,
+            "message": "Product added successfully" if status == "success" else "Product queued for indexing",
             "data": {"product_id": product_id}
         }
     except Exception as e:
@@ -106,42 +276,46 @@ async def get_products(
     brand: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    sort_by: Optional[str] = Query(None, pattern="^(price|rating|stock)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
 ):
     try:
-        # Build filter
-        filter_dict = {}
-        if brand:
-            filter_dict["brand"] = {"$eq": brand}
-        if category:
-            filter_dict["category"] = {"$eq": category}
-        if min_price is not None:
-            filter_dict["MRP"] = {"$gte": min_price}
-        if max_price is not None:
-            if "MRP" in filter_dict:
-                filter_dict["MRP"]["$lte"] = max_price
-            else:
-                filter_dict["MRP"] = {"$lte": max_price}
-        
-        # Query Pinecone
-        query_vector = [0.0] * 384  # Dummy vector for metadata search
-        results = index.query(
-            vector=query_vector,
-            filter=filter_dict if filter_dict else None,
-            top_k=100,
-            include_metadata=True
-        )
-        
-        # Format results
-        products = []
-        for match in results.matches:
-            product = match.metadata if hasattr(match, "metadata") else {}
-            product["id"] = match.id
-            products.append(product)
+        # Filter, sort and page locally from the columnar table
+        async def query_products():
+            await ensure_catalog_loaded()
+            return PRODUCT_TABLE.query(
+                brand=brand,
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                sort_by=sort_by,
+                order=order,
+                limit=limit,
+                cursor=cursor
+            )
+        key = ("products", brand, category, min_price, max_price, sort_by, order, limit, cursor, CATALOG_VERSION.current())
+        data = await READS.do(key, query_products)
         
         return {
             "status": "success",
-            "data": {"products": products, "count": len(products)}
+            "data": data
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/products/flush", response_model=ProductResponse)
+async def flush_products():
+    """Write every queued product mutation to Pinecone before returning"""
+    try:
+        await WRITE_QUEUE.aflush()
+        return {
+            "status": "success",
+            "data": WRITE_QUEUE.stats()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -149,15 +323,10 @@ async def get_products(
 @app.get("/products/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
     try:
-        response = index.fetch(ids=[product_id])
-        
-        # Check if product exists in the new response format
-        if not response.vectors or product_id not in response.vectors:
+        product_data = fetch_product(product_id)
+        if product_data is None:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Access data using the new response format
-        vector_data = response.vectors[product_id]
-        product_data = vector_data.metadata
         product_data["id"] = product_id
         
         return {
@@ -170,29 +339,26 @@ async def get_product(product_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/products/{product_id}", response_model=ProductResponse)
-async def update_product(product_id: str, product: ProductUpdate):
+async def update_product(product_id: str, product: ProductUpdate, wait: bool = False):
     try:
-        # Check if product exists
-        response = index.fetch(ids=[product_id])
-        
-        # Check if product exists in the new response format
-        if not response.vectors or product_id not in response.vectors:
+        # Check if product exists (a queued write counts)
+        current_data = fetch_product(product_id)
+        if current_data is None:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Get current data using the new response format
-        current_data = response.vectors[product_id].metadata
-        
         # Update with new data (only non-None fields)
         update_data = {k: v for k, v in product.dict().items() if v is not None}
         merged_data = {**current_data, **update_data}
         
-        # Format and upsert
-        _, vector, metadata = format_product_for_pinecone(merged_data, product_id)
-        index.upsert(vectors=[(product_id, vector, metadata)])
+        # Format and queue the upsert
+        _, metadata = format_product_for_pinecone(merged_data, product_id)
+        future = WRITE_QUEUE.upsert(product_id, metadata)
+        record_upsert(product_id, metadata, future)
+        status = await write_result(future, wait)
         
         return {
-            "status": "success",
-            "message": "Product updated successfully",
+            "status": status,
+            "message": "Product updated successfully" if status == "success" else "Product update queued",
             "data": {"product_id": product_id}
         }
     except HTTPException:
@@ -201,71 +367,84 @@ async def update_product(product_id: str, product: ProductUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/products/{product_id}", response_model=ProductResponse)
-async def delete_product(product_id: str):
+async def delete_product(product_id: str, wait: bool = False):
     try:
-        # Check if product exists
-        response = index.fetch(ids=[product_id])
-        
-        # Check if product exists in the new response format
-        if not response.vectors or product_id not in response.vectors:
+        # Check if product exists (a queued write counts)
+        if fetch_product(product_id) is None:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Delete from Pinecone
-        index.delete(ids=[product_id])
+        # Queue the delete from Pinecone
+        future = WRITE_QUEUE.delete(product_id)
+        record_delete(product_id, future)
+        status = await write_result(future, wait)
         
         return {
-            "status": "success",
-            "message": "Product deleted successfully"
+            "status": status,
+            "message": "Product deleted successfully" if status == "success" else "Product deletion queued"
         }
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_facets():
+    await ensure_catalog_loaded()
+    return FACETS.snapshot()
+
+async def get_facets():
+    # /categories/ and /brands/ both read the same snapshot
+    return await READS.do(("facets", CATALOG_VERSION.current()), load_facets)
+
 @app.get("/categories/", response_model=ProductResponse)
-async def get_categories():
+async def get_categories(counts: bool = False):
     try:
-        # Simple approach to get unique categories
-        query_vector = [0.0] * 384
-        results = index.query(
-            vector=query_vector,
-            top_k=1000,
-            include_metadata=True
-        )
-        
-        categories = set()
-        for match in results.matches:
-            category = match.metadata.get("category") if hasattr(match, "metadata") else None
-            if category:
-                categories.add(category)
+        facets = await get_facets()
+        data = {"categories": facets["categories"]}
+        if counts:
+            data["counts"] = facets["category_counts"]
         
         return {
             "status": "success",
-            "data": {"categories": list(categories)}
+            "data": data
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/brands/", response_model=ProductResponse)
-async def get_brands():
+async def get_brands(counts: bool = False):
     try:
-        # Get unique brands
-        query_vector = [0.0] * 384
-        results = index.query(
-            vector=query_vector,
-            top_k=1000,
-            include_metadata=True
-        )
-        
-        brands = set()
-        for match in results.matches:
-            brand = match.metadata.get("brand") if hasattr(match, "metadata") else None
-            if brand:
-                brands.add(brand)
+        facets = await get_facets()
+        data = {"brands": facets["brands"]}
+        if counts:
+            data["counts"] = facets["brand_counts"]
+            data["categories"] = facets["brand_categories"]
         
         return {
             "status": "success",
-            "data": {"brands": list(brands)}
+            "data": data
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/coalescing-stats")
+async def coalescing_stats():
+    """Single-flight counters for the listing reads: computations, joined requests and errors"""
+    return READS.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus histograms: per-stage latency and per-route request latency"""
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/facets/rebuild", response_model=ProductResponse)
+async def rebuild_facets():
+    """Reload facet counts and the product table from a full scan of the index"""
+    try:
+        await WRITE_QUEUE.aflush()
+        await asyncio.to_thread(load_catalog, True)
+        return {
+            "status": "success",
+            "data": {"products": FACETS.snapshot()["products"]}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
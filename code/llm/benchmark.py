@@ -0,0 +1,494 @@
+"""Offline end-to-end benchmark for the assistant (app3) and store module (app4).
+
+Runs both FastAPI apps in-process through an ASGI client, with no Groq or
+Pinecone keys and no model download:
+
+- ``FakeChatGroq`` answers deterministically from the prompt's product context,
+  with configurable first-token and per-token latency and a choice of clean,
+  fenced, malformed (trailing commas, cut off) or plain-prose output.
+- ``HashEmbeddings`` is a deterministic bag-of-words stand-in for MiniLM.
+- The assistant uses the local NumPy vector index seeded from ``products.csv``;
+  the store module gets an in-memory Pinecone index.
+
+Per endpoint and per pipeline stage it reports p50/p95/p99 latency and
+throughput, saves the results as JSON and, given a baseline, flags stages
+whose p95 regressed by more than ``--threshold``::
+
+    python benchmark.py --requests 200 --concurrency 8 --output bench.json
+    python benchmark.py --baseline bench.json          # exits 1 on regressions
+    python benchmark.py --llm-mode malformed --token-latency-ms 2
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import platform
+import re
+import sys
+import time
+import types
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+LLM_MODES = ("json", "fenced", "malformed", "prose", "mixed")
+EMBEDDING_DIM = 384
+
+QUERIES = [
+    "good camera phone for travel",
+    "which laptop is best for programming",
+    "noise cancelling headphones for flights",
+    "smartwatch with gps for running",
+    "what's the price of S23U-456",
+    "is the Pixel 8 Pro in stock",
+    "list Samsung phones",
+    "tablet for drawing with a stylus",
+    "compare OnePlus 11 5G and OnePlus Nord 3",
+    "lightweight laptop with long battery life",
+]
+
+# Pipeline stages timed on EmilyAssistant (method name -> stage label)
+STAGES = {
+    "_prepare_chain_input": "prepare_input",
+    "_aroute": "intent_router",
+    "_lexical_lookup": "lexical_lookup",
+    "_avector_docs": "vector_search",
+    "_compact_context": "context_build",
+    "_acall_llm": "llm",
+    "_format_output": "format_output",
+}
+
+
+# --------------------------------------------------------------------- fakes
+
+class HashEmbeddings:
+    """Deterministic bag-of-words embeddings with MiniLM's dimension."""
+
+    def __init__(self, *args, latency_ms: float = 0.0, recorder=None, **kwargs):
+        self.latency = latency_ms / 1000.0
+        self.recorder = recorder
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], "little") % EMBEDDING_DIM] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency * max(1, len(texts)) ** 0.5)
+        vectors = [self._vector(text) for text in texts]
+        if self.recorder is not None:
+            self.recorder.add("embed", time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatGroq:
+    """Deterministic ChatGroq stand-in: replies about the products in the prompt context."""
+
+    def __init__(self, token_latency_ms: float = 1.0, first_token_ms: float = 50.0, mode: str = "json",
+                 recorder=None, **kwargs):
+        self.token_latency = token_latency_ms / 1000.0
+        self.first_token = first_token_ms / 1000.0
+        self.mode = mode
+        self.recorder = recorder
+        self.calls = 0
+
+    def _reply(self, prompt_value) -> str:
+        text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        ids = re.findall(r"^\s*([\w-]+) \| ", text.split("Chat History:")[0], flags=re.MULTILINE)[1:4]
+        mode = self.mode if self.mode != "mixed" else LLM_MODES[self.calls % 4]
+        self.calls += 1
+        reply = {
+            "messages": [
+                {"text": "Looking at our inventory, here is what fits.", "facialExpression": "smile", "animation": "Talking"},
+                {"text": f"I'd start with {ids[0] if ids else 'our bestsellers'}; it matches what you asked for.",
+                 "facialExpression": "default", "animation": "Head Nod Yes"},
+                {"text": "Would you like to compare it with another option?", "facialExpression": "smile",
+                 "animation": "Thoughtful Head Nod"},
+            ],
+            "products": ids,
+        }
+        body = json.dumps(reply, indent=2)
+        if mode == "fenced":
+            return f"Sure! Here you go:\n```json\n{body}\n```"
+        if mode == "malformed":
+            body = body.replace('"Talking"', '"Talking",').replace("\n  ]", ",\n  ]")
+            return body[:int(len(body) * 0.9)]
+        if mode == "prose":
+            return " ".join(m["text"] for m in reply["messages"])
+        return body
+
+    @staticmethod
+    def _chunks(text: str) -> List[str]:
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def _message(self, content: str):
+        from langchain_core.messages import AIMessage
+        return AIMessage(content=content)
+
+    def invoke(self, prompt_value, *args, **kwargs):
+        content = self._reply(prompt_value)
+        time.sleep(self.first_token + self.token_latency * len(self._chunks(content)))
+        return self._message(content)
+
+    async def ainvoke(self, prompt_value, *args, **kwargs):
+        content = self._reply(prompt_value)
+        await asyncio.sleep(self.first_token + self.token_latency * len(self._chunks(content)))
+        return self._message(content)
+
+    async def astream(self, prompt_value, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+        content = self._reply(prompt_value)
+        start = time.perf_counter()
+        await asyncio.sleep(self.first_token)
+        if self.recorder is not None:
+            self.recorder.add("llm_first_token", time.perf_counter() - start)
+        for chunk in self._chunks(content):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield AIMessageChunk(content=chunk)
+        if self.recorder is not None:
+            self.recorder.add("llm_stream", time.perf_counter() - start)
+
+
+class _Record:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakePineconeIndex:
+    """In-memory subset of the Pinecone index API used by app4."""
+
+    def __init__(self):
+        self.vectors: Dict[str, Any] = {}
+
+    def upsert(self, vectors, **kwargs):
+        for vector in vectors:
+            if isinstance(vector, dict):
+                self.vectors[vector["id"]] = dict(vector.get("metadata") or {})
+            else:
+                self.vectors[vector[0]] = dict(vector[2] if len(vector) > 2 else {})
+
+    def delete(self, ids, **kwargs):
+        for vector_id in ids:
+            self.vectors.pop(vector_id, None)
+
+    def fetch(self, ids, **kwargs):
+        return _Record(vectors={i: _Record(metadata=dict(self.vectors[i])) for i in ids if i in self.vectors})
+
+    def list(self, **kwargs):
+        ids = list(self.vectors)
+        for start in range(0, len(ids), 100):
+            yield ids[start:start + 100]
+
+    def query(self, vector=None, top_k=10, include_metadata=True, **kwargs):
+        return _Record(matches=[_Record(id=i, metadata=dict(m)) for i, m in list(self.vectors.items())[:top_k]])
+
+
+def install_fakes(args, recorder: "Recorder"):
+    """Point the apps at the fakes and keep every cache/persistence file out of the working tree."""
+    os.environ.update({
+        "VECTOR_STORE_BACKEND": "numpy",
+        "LOCAL_INDEX_PATH": "",
+        "EMBED_CACHE_PATH": "",
+        "INGEST_MANIFEST_PATH": "",
+        "SESSION_STORE_PATH": "",
+        "CATALOG_VERSION_PATH": "",
+        "STARTUP_WARMUP": "true",
+        "GROQ_API_KEY": "offline",
+    })
+    os.environ.setdefault("PRODUCTS_CSV_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.csv"))
+    if args.cold:
+        os.environ.update({"RESPONSE_CACHE_SIZE": "0", "RETRIEVAL_CACHE_SIZE": "0", "EMBED_CACHE_SIZE": "0"})
+
+    groq = types.ModuleType("langchain_groq")
+    groq.ChatGroq = functools.partial(FakeChatGroq, token_latency_ms=args.token_latency_ms,
+                                      first_token_ms=args.first_token_ms, mode=args.llm_mode, recorder=recorder)
+    sys.modules["langchain_groq"] = groq
+
+    huggingface = types.ModuleType("langchain_huggingface")
+    huggingface.HuggingFaceEmbeddings = functools.partial(HashEmbeddings, latency_ms=args.embed_latency_ms,
+                                                          recorder=recorder)
+    sys.modules["langchain_huggingface"] = huggingface
+
+    pinecone_index = FakePineconeIndex()
+    pinecone = types.ModuleType("pinecone")
+    pinecone.Pinecone = lambda **kwargs: _Record(Index=lambda name: pinecone_index)
+    sys.modules["pinecone"] = pinecone
+    sys.modules.setdefault("langchain_pinecone", types.ModuleType("langchain_pinecone"))
+
+
+# ------------------------------------------------------------------- timing
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, name: str, seconds: float):
+        self.samples[name].append(seconds)
+
+    @staticmethod
+    def summarize(samples: List[float], wall_seconds: Optional[float] = None) -> Dict[str, Any]:
+        values = np.asarray(samples, dtype=np.float64) * 1000.0
+        summary = {
+            "count": int(values.size),
+            "mean_ms": round(float(values.mean()), 3),
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3),
+            "max_ms": round(float(values.max()), 3),
+        }
+        if wall_seconds:
+            summary["throughput_rps"] = round(values.size / wall_seconds, 2)
+        return summary
+
+
+def instrument(cls, recorder: Recorder):
+    """Wrap the stage methods on the class, before the assistant binds them into its chains."""
+    for method, stage in STAGES.items():
+        original = getattr(cls, method, None)
+        if original is None:
+            continue
+        if asyncio.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, _original=original, _stage=stage, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await _original(*args, **kwargs)
+                finally:
+                    recorder.add(_stage, time.perf_counter() - start)
+        else:
+            @functools.wraps(original)
+            def timed(*args, _original=original, _stage=stage, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    recorder.add(_stage, time.perf_counter() - start)
+        setattr(cls, method, timed)
+
+
+# ---------------------------------------------------------------- scenarios
+
+async def drive(client, name: str, make_request, count: int, concurrency: int, warmup: int,
+                recorder: Recorder) -> Dict[str, Any]:
+    """Fire ``count`` requests ``concurrency`` at a time; returns the endpoint summary."""
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int, measure: bool):
+        nonlocal errors
+        method, url, kwargs = make_request(i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            errors += 1
+        elif measure:
+            latencies.append(elapsed)
+
+    for i in range(warmup):
+        await one(i, False)
+    recorder.samples.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(warmup + i, True) for i in range(count)))
+    wall = time.perf_counter() - start
+    summary = Recorder.summarize(latencies, wall) if latencies else {"count": 0}
+    summary["errors"] = errors
+    summary["stages"] = {stage: Recorder.summarize(samples, wall) for stage, samples in sorted(recorder.samples.items())}
+    return summary
+
+
+def chat_request(i: int):
+    query = QUERIES[i % len(QUERIES)]
+    # A different history each time: the answer isn't cacheable, retrieval still is
+    history = [{"role": "user", "content": f"hello {i}"}, {"role": "assistant", "content": "Hi! How can I help?"}]
+    return "POST", "/api/llm/response", {"json": {"query": query, "history": history, "language": "english"}}
+
+
+def stream_request(i: int):
+    method, _, kwargs = chat_request(i)
+    return method, "/api/llm/response/stream", kwargs
+
+
+def format_output_benchmark(assistant, count: int) -> Dict[str, Any]:
+    """Direct micro-benchmark of ``_format_output`` on each fake LLM output mode."""
+    from langchain_core.messages import AIMessage
+    from langchain_core.prompt_values import StringPromptValue
+
+    context = "product_id | name\nS23U-456 | Samsung Galaxy S23 Ultra\nM6034 | OnePlus Nord CE 3\n"
+    results = {}
+    for mode in LLM_MODES[:4]:
+        content = FakeChatGroq(mode=mode)._reply(StringPromptValue(text=context))
+        message = AIMessage(content=content)
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            assistant._format_output(message)
+            samples.append(time.perf_counter() - start)
+        results[mode] = Recorder.summarize(samples)
+    return results
+
+
+async def run(args) -> Dict[str, Any]:
+    recorder = Recorder()
+    install_fakes(args, recorder)
+    import httpx
+    import app3
+    import app4
+
+    instrument(app3.EmilyAssistant, recorder)
+    results: Dict[str, Any] = {"endpoints": {}}
+
+    # Startup happens in the lifespan; time it like a cold start
+    start = time.perf_counter()
+    async with app3.app.router.lifespan_context(app3.app):
+        await asyncio.to_thread(app3.STARTUP.wait_ready, 120)
+        results["startup_seconds"] = round(time.perf_counter() - start, 3)
+        results["startup_phases"] = app3.STARTUP.report()["phases"]
+        transport = httpx.ASGITransport(app=app3.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            scenarios = [
+                ("POST /api/llm/response", chat_request),
+                ("POST /api/llm/response/stream", stream_request),
+                ("GET /products/ (app3)", lambda i: ("GET", "/products/", {"params": {"sort_by": "price", "limit": 10}})),
+            ]
+            for name, make_request in scenarios:
+                results["endpoints"][name] = await drive(client, name, make_request, args.requests,
+                                                         args.concurrency, args.warmup, recorder)
+        results["format_output"] = format_output_benchmark(app3.EMILY_ASSISTANT, args.format_iterations)
+
+    # Store module: seed its in-memory index from the same CSV, then mix writes and listings
+    from catalog import read_products_csv
+    products = [{"brand": p["brand"], "category": p["category"], "description": p["description"],
+                 "MRP": p["mrp"], "stock": p["stock"], "warranty": p["warranty"]}
+                for p in read_products_csv(app3.PRODUCTS_CSV_PATH)]
+    for product in products:
+        product_id, metadata = app4.format_product_for_pinecone(product)
+        app4.index.upsert(vectors=[(product_id, [0.0] * EMBEDDING_DIM, metadata)])
+    async with app4.app.router.lifespan_context(app4.app):
+        transport = httpx.ASGITransport(app=app4.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            scenarios = [
+                ("POST /products/ (app4)", lambda i: ("POST", "/products/", {"json": products[i % len(products)]})),
+                ("GET /products/ (app4)", lambda i: ("GET", "/products/", {"params": {"sort_by": "price", "limit": 20}})),
+                ("GET /categories/ (app4)", lambda i: ("GET", "/categories/", {"params": {"counts": "true"}})),
+                ("GET /brands/ (app4)", lambda i: ("GET", "/brands/", {"params": {"counts": "true"}})),
+            ]
+            for name, make_request in scenarios:
+                summary = await drive(client, name, make_request, args.requests, args.concurrency, args.warmup, recorder)
+                summary.pop("stages", None)
+                results["endpoints"][name] = summary
+    return results
+
+
+# --------------------------------------------------------------- reporting
+
+def print_report(results: Dict[str, Any]):
+    row = "{:<40} {:>9} {:>9} {:>9} {:>10} {:>7}"
+    print(f"Startup: {results['startup_seconds']}s")
+    print(row.format("", "p50 ms", "p95 ms", "p99 ms", "req/s", "errors"))
+    for endpoint, summary in results["endpoints"].items():
+        print(row.format(endpoint, summary.get("p50_ms", "-"), summary.get("p95_ms", "-"), summary.get("p99_ms", "-"),
+                         summary.get("throughput_rps", "-"), summary["errors"]))
+        for stage, stage_summary in summary.get("stages", {}).items():
+            print(row.format(f"  {stage} (x{stage_summary['count']})", stage_summary["p50_ms"],
+                             stage_summary["p95_ms"], stage_summary["p99_ms"], "", ""))
+    for mode, summary in results["format_output"].items():
+        print(row.format(f"format_output[{mode}]", summary["p50_ms"], summary["p95_ms"], summary["p99_ms"], "", ""))
+
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_delta_ms: float = 0.05) -> List[str]:
+    """Names of endpoints and stages whose p95 grew by more than ``threshold`` over the baseline.
+
+    Growth under ``min_delta_ms`` is ignored so microsecond-level jitter is not flagged.
+    """
+    regressions = []
+
+    def check(name: str, current: Dict[str, Any], previous: Optional[Dict[str, Any]]):
+        if not previous or not current.get("count") or not previous.get("p95_ms"):
+            return
+        change = current["p95_ms"] / previous["p95_ms"] - 1.0
+        delta = current["p95_ms"] - previous["p95_ms"]
+        flag = "REGRESSION" if change > threshold and delta > min_delta_ms else ""
+        print(f"{name:<52} p95 {previous['p95_ms']:9.3f} -> {current['p95_ms']:9.3f} ms  {change:+7.1%}  {flag}")
+        if flag:
+            regressions.append(name)
+
+    for endpoint, summary in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        check(endpoint, summary, previous)
+        for stage, stage_summary in summary.get("stages", {}).items():
+            check(f"{endpoint} :: {stage}", stage_summary, (previous or {}).get("stages", {}).get(stage))
+    for mode, summary in results.get("format_output", {}).items():
+        check(f"format_output[{mode}]", summary, baseline.get("format_output", {}).get(mode))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for app3 and app4")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per endpoint")
+    parser.add_argument("--llm-mode", choices=LLM_MODES, default="json")
+    parser.add_argument("--token-latency-ms", type=float, default=1.0)
+    parser.add_argument("--first-token-ms", type=float, default=50.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=2.0)
+    parser.add_argument("--format-iterations", type=int, default=2000)
+    parser.add_argument("--cold", action="store_true", help="disable the response, retrieval and embedding caches")
+    parser.add_argument("--verbose", action="store_true", help="show the apps' own request logging")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative p95 increase")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="ignore p95 increases smaller than this")
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline:
+        # Read first: the baseline may be the file this run overwrites
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # The apps log every request; keep that out of the report unless asked for
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        results = asyncio.run(run(args))
+    print_report(results)
+    results["config"] = vars(args)
+    results["environment"] = {"python": platform.python_version(), "platform": platform.platform(), "timestamp": time.time()}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%} p95 increase")
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
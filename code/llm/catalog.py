@@ -0,0 +1,237 @@
+"""Helpers for reading the product catalog CSV files (products.csv, products_new.csv)
+and bulk-ingesting them into the vector index.
+
+Run ``python catalog.py products.csv`` to sync the configured index from a CSV.
+"""
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+DEFAULT_MANIFEST_SCOPE = "default"
+
+
+class IngestError(RuntimeError):
+    """Some batches failed; ``stats`` counts what did reach the index (the manifest is already saved)."""
+
+    def __init__(self, message: str, stats: Dict[str, Any]):
+        super().__init__(message)
+        self.stats = stats
+
+
+def _to_float(value: str, default: float = 0.0) -> float:
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_int(value: str, default: int = 0) -> int:
+    return int(_to_float(value, default))
+
+
+def product_from_row(row: Dict[str, str]) -> Dict[str, Any]:
+    """Convert a raw CSV row into the metadata dict stored alongside each product vector."""
+    row = {(k or "").strip(): (v or "").strip() for k, v in row.items()}
+    brand = row.get("Brand", "")
+    product = row.get("Product", "")
+    model = row.get("Model", "")
+    # Some product names already start with the brand ("OnePlus Nord CE 3")
+    name = product if product.lower().startswith(brand.lower()) else f"{brand} {product}".strip()
+    return {
+        # The catalog has no numeric ID column; model codes are unique per product
+        "product_id": model,
+        "category": row.get("Prod Category", ""),
+        "brand": brand,
+        "model": model,
+        "name": name,
+        "description": row.get("Description", ""),
+        "mrp": _to_float(row.get("MRP")),
+        "discount": row.get("Discount", ""),
+        "price": _to_float(row.get("Actual Price")),
+        "stock": _to_int(row.get("Stock")),
+        "warranty": row.get("Warranty", ""),
+        "img": row.get("Image", ""),
+    }
+
+
+def product_document(metadata: Dict[str, Any]) -> str:
+    """Render the text that gets embedded for a product."""
+    return f"""Product: {metadata['name']}
+Model: {metadata['model']}
+Category: {metadata['category']}
+Description: {metadata['description']}
+Price: {metadata['price']}
+Discount: {metadata['discount']}"""
+
+
+def read_products_csv(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream product metadata dicts from a catalog CSV file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if not any((v or "").strip() for v in row.values()):
+                continue
+            yield product_from_row(row)
+
+
+def product_hash(metadata: Dict[str, Any]) -> str:
+    """Stable digest of a product's content, used to skip unchanged rows on re-ingest."""
+    payload = json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def vector_id(metadata: Dict[str, Any]) -> str:
+    return f"product_{metadata['product_id']}"
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _read_manifests(path: Optional[str]) -> Dict[str, Dict[str, str]]:
+    """``{scope: {product_id: digest}}``; an old flat manifest names no index, so it is ignored."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {scope: hashes for scope, hashes in data.items() if isinstance(hashes, dict)}
+
+
+def load_manifest(path: Optional[str], scope: str = DEFAULT_MANIFEST_SCOPE) -> Dict[str, str]:
+    """Content hashes of the products last ingested into the index named by ``scope``."""
+    return dict(_read_manifests(path).get(scope, {}))
+
+
+def save_manifest(path: Optional[str], manifest: Dict[str, str], scope: str = DEFAULT_MANIFEST_SCOPE):
+    if not path:
+        return
+    manifests = _read_manifests(path)
+    manifests[scope] = manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifests, f)
+    os.replace(tmp_path, path)
+
+
+def write_products(vectorstore, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                   vectors: Optional[List[List[float]]] = None):
+    """Write a batch through the vector store's public API, with explicit ids.
+
+    ``vectors`` are used by stores that accept precomputed embeddings (the local
+    NumPy store); others, like PineconeVectorStore, embed in ``add_texts``.
+    """
+    if vectors is not None and hasattr(vectorstore, "add_embeddings"):
+        vectorstore.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+    else:
+        vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+
+
+def ingest_catalog(
+    csv_path: str,
+    vectorstore,
+    manifest_path: Optional[str] = None,
+    manifest_scope: str = DEFAULT_MANIFEST_SCOPE,
+    embed_batch_size: int = 256,
+    upsert_batch_size: int = 100,
+    max_workers: int = 4,
+    prune: bool = False,
+) -> Dict[str, Any]:
+    """Stream a catalog CSV into the vector store, embedding and upserting in batches.
+
+    Rows whose content hash matches the manifest from the previous run are skipped.
+    The manifest keeps one set of hashes per ``manifest_scope`` (backend and index
+    name), so switching to another index ingests everything into it. A row is only
+    marked in the manifest once its upsert succeeded, so failed batches are retried
+    on the next run (``IngestError`` is raised after the manifest is saved). With
+    ``prune``, products missing from the CSV are deleted from the index.
+    """
+    start_time = time.time()
+    manifest = load_manifest(manifest_path, manifest_scope)
+    seen = set()
+    stats = {"rows": 0, "skipped": 0, "upserted": 0, "deleted": 0, "failed": 0}
+    embeddings = vectorstore.embeddings
+    # Stores without add_embeddings embed inside add_texts, on the worker threads
+    precompute = hasattr(vectorstore, "add_embeddings")
+    errors = []
+
+    def settle(future, part):
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(e)
+            stats["failed"] += len(part)
+            return
+        for product, digest in part:
+            manifest[product["product_id"]] = digest
+        stats["upserted"] += len(part)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = []
+        for batch in _chunks(read_products_csv(csv_path), embed_batch_size):
+            changed = []
+            for product in batch:
+                stats["rows"] += 1
+                digest = product_hash(product)
+                seen.add(product["product_id"])
+                if manifest.get(product["product_id"]) == digest:
+                    stats["skipped"] += 1
+                    continue
+                changed.append((product, digest))
+            if not changed:
+                continue
+
+            texts = [product_document(p) for p, _ in changed]
+            vectors = embeddings.embed_documents(texts) if precompute else None
+            for offset in range(0, len(changed), upsert_batch_size):
+                part = changed[offset:offset + upsert_batch_size]
+                pending.append((executor.submit(
+                    write_products,
+                    vectorstore,
+                    [vector_id(p) for p, _ in part],
+                    texts[offset:offset + upsert_batch_size],
+                    [p for p, _ in part],
+                    vectors[offset:offset + upsert_batch_size] if vectors is not None else None,
+                ), part))
+            # Bound the number of in-flight chunks so a huge CSV is never held in memory at once
+            while len(pending) > 2 * max_workers:
+                settle(*pending.pop(0))
+
+        for future, part in pending:
+            settle(future, part)
+
+    if prune:
+        removed = [product_id for product_id in manifest if product_id not in seen]
+        if removed:
+            vectorstore.delete(ids=[vector_id({"product_id": product_id}) for product_id in removed])
+            for product_id in removed:
+                del manifest[product_id]
+            stats["deleted"] = len(removed)
+
+    save_manifest(manifest_path, manifest, manifest_scope)
+    stats["seconds"] = round(time.time() - start_time, 3)
+    if errors:
+        print(f"Catalog ingest: {stats['failed']} products failed and will be retried next run: {str(errors[0])}")
+        raise IngestError(f"{stats['failed']} products failed to ingest: {str(errors[0])}", stats) from errors[0]
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk-ingest a product catalog CSV into the vector index")
+    parser.add_argument("csv_path", nargs="?", default=None, help="Catalog CSV (defaults to PRODUCTS_CSV_PATH)")
+    parser.add_argument("--prune", action="store_true", help="Delete indexed products missing from the CSV")
+    args = parser.parse_args()
+
+    from app3 import get_assistant
+
+    print(get_assistant().ingest_catalog(args.csv_path, prune=args.prune))
@@ -0,0 +1,67 @@
+"""Catalog version counter shared by the assistant (app3) and the store module (app4).
+
+Every catalog write bumps the counter; caches derived from the catalog store
+the version they were filled at and treat older entries as stale. With a
+``path`` the counter lives in a small file so writes made by another process
+(the app4 CRUD endpoints, other uvicorn workers) invalidate this one's caches
+too. The file is re-read at most every ``max_staleness`` seconds, so a bump
+from another process is seen within that window; local bumps are immediate.
+"""
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent bumps may collapse into one, which still invalidates
+    fcntl = None
+
+
+class CatalogVersion:
+    def __init__(self, path: Optional[str] = None, max_staleness: float = 0.05):
+        self.path = path
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._version = 0
+        self._checked_at = float("-inf")
+
+    def _read_file(self) -> int:
+        try:
+            with open(self.path, "r", encoding="ascii") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def current(self) -> int:
+        if not self.path:
+            return self._version
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at >= self.max_staleness:
+                self._checked_at = now
+                self._version = self._read_file()
+            return self._version
+
+    def bump(self) -> int:
+        """Record a catalog change and return the new version."""
+        with self._lock:
+            if not self.path:
+                self._version += 1
+                return self._version
+            with open(self.path, "a+", encoding="ascii") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    version = int(f.read().strip() or 0) + 1
+                except ValueError:
+                    version = 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(version))
+                f.flush()
+            self._version = version
+            self._checked_at = time.monotonic()
+            return version
@@ -0,0 +1,92 @@
+"""Compact, token-budgeted rendering of retrieved products for the prompt context.
+
+Retrieved documents arrive best-first. Each distinct product becomes one
+pipe-separated row under a single header, descriptions are trimmed to a
+per-product token budget, and the lowest-ranked rows are dropped first when
+the whole block is still over budget.
+"""
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+from tokens import estimate_tokens, estimate_tokens_from_length, truncate_to_tokens
+
+DEFAULT_FIELDS = ("product_id", "name", "category", "price", "mrp", "discount", "stock", "warranty", "img", "description")
+
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = 600, description_tokens: int = 40, fields: Sequence[str] = DEFAULT_FIELDS):
+        self.token_budget = token_budget
+        self.description_tokens = description_tokens
+        self.fields = tuple(fields)
+        self.header = " | ".join(self.fields)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens = 0
+        self.raw_tokens = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _product_key(doc) -> str:
+        metadata = doc.metadata or {}
+        return str(metadata.get("product_id") or metadata.get("name") or doc.id or doc.page_content)
+
+    def _row(self, doc) -> str:
+        metadata = dict(doc.metadata or {})
+        if not metadata.get("description") and not metadata.get("name"):
+            # Documents without structured metadata fall back to their text
+            metadata["description"] = doc.page_content
+        values = []
+        for field in self.fields:
+            value = metadata.get(field, "")
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif field == "description":
+                value = truncate_to_tokens(" ".join(str(value).split()), self.description_tokens)
+            values.append(str(value).replace("|", "/"))
+        return " | ".join(values)
+
+    def build(self, docs: List[Any]) -> Tuple[str, Dict[str, int]]:
+        """Render ``docs`` (best first) and return the context text plus token stats."""
+        seen = set()
+        rows = []
+        raw_chars = 0
+        for doc in docs:
+            raw_chars += len(getattr(doc, "page_content", "") or "")
+            key = self._product_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(self._row(doc))
+
+        tokens = estimate_tokens(self.header) + sum(estimate_tokens(row) for row in rows)
+        dropped = 0
+        while len(rows) > 1 and tokens > self.token_budget:
+            tokens -= estimate_tokens(rows.pop())
+            dropped += 1
+
+        text = "\n".join([self.header] + rows) if rows else ""
+        stats = {
+            "products": len(rows),
+            "duplicates": len(docs) - len(seen),
+            "dropped": dropped,
+            "tokens": tokens if rows else 0,
+            # What the prompt used to receive, the raw Documents, estimated from their text length alone
+            "raw_tokens": estimate_tokens_from_length(raw_chars),
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens += stats["tokens"]
+            self.raw_tokens += stats["raw_tokens"]
+            self.dropped += dropped
+        return text, stats
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "description_tokens": self.description_tokens,
+                "requests": self.requests,
+                "mean_tokens": (self.tokens / self.requests) if self.requests else 0.0,
+                "mean_raw_tokens": (self.raw_tokens / self.requests) if self.requests else 0.0,
+                "dropped_products": self.dropped,
+            }
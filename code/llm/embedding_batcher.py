@@ -0,0 +1,148 @@
+"""Off-loop dispatch for query embeddings.
+
+Concurrent chat requests each embed a single query. Instead of running many
+batch-size-1 forward passes, queries arriving within a short window are
+collected and embedded together with one ``embed_documents`` call. When
+batching is disabled, ``ExecutorEmbeddings`` still keeps the CPU-bound
+forward pass off the event loop on a bounded thread pool.
+"""
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeddings wrapper that coalesces ``embed_query`` calls into batches."""
+
+    def __init__(self, inner: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._queries = 0
+        self._closed = False
+
+    # ---------------------------------------------------------------- dispatch
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            self._closed = True
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: finish this batch, then stop
+                self._closed = True
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._closed:
+            batch = []
+            try:
+                # Callers cancelled while queued are dropped; the rest can no longer be cancelled
+                batch = [(text, future) for text, future in self._collect() if future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                vectors = self.inner.embed_documents([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+                with self._stats_lock:
+                    self._batch_sizes[len(batch)] += 1
+                    self._queries += len(batch)
+            except Exception as e:
+                # No single batch may stop the dispatcher: later queries would wait forever
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def submit(self, text: str) -> Future:
+        """Queue a query for the next batch and return a future for its vector."""
+        if self._closed:
+            raise RuntimeError("Embedding batcher is closed")
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def close(self):
+        """Stop the dispatcher thread after draining queued queries."""
+        if self._thread is not None and not self._closed:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+        self._closed = True
+
+    # -------------------------------------------------------------- Embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Document embedding is already batched by the caller
+        return self.inner.embed_documents(texts)
+
+    # ------------------------------------------------------------------- stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size distribution and totals since startup."""
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": batches,
+                "queries": self._queries,
+                "mean_batch_size": (self._queries / batches) if batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
+
+
+class ExecutorEmbeddings(Embeddings):
+    """Embeddings wrapper whose async methods run on a bounded thread pool."""
+
+    def __init__(self, inner: Embeddings, max_workers: int = 2):
+        self.inner = inner
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="embedding")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._executor.submit(self.inner.embed_query, text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._executor.submit(self.inner.embed_documents, texts))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
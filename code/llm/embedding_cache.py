@@ -0,0 +1,255 @@
+"""Query-embedding cache with a bounded in-memory LRU and a memory-mapped disk store.
+
+The disk store is an append-only file of fixed-size records
+``[16-byte text digest][dim x float32]`` behind a 16-byte header. Every uvicorn
+worker maps the same file, so a query embedded by one worker (or before a
+restart) is a disk hit for the others. Appends take an exclusive file lock
+and readers a shared one while mapping new records, where the platform
+provides ``fcntl``, so a half-written record is never mapped.
+"""
+import asyncio
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still atomic enough for a best-effort cache
+    fcntl = None
+
+_MAGIC = b"EMBC"
+_HEADER = struct.Struct("<4sII4x")  # magic, format version, dimension
+
+
+def text_key(text: str) -> bytes:
+    """Digest of the normalized text; MiniLM is uncased so case is folded too."""
+    normalized = " ".join(text.lower().split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+class _DiskStore:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dim: Optional[int] = None
+        self._dtype = None
+        self._map: Optional[np.memmap] = None
+        self._rows: Dict[bytes, int] = {}
+        self._indexed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_used(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    @property
+    def entries(self) -> int:
+        return self._record_count()
+
+    def _record_count(self) -> int:
+        size = self.bytes_used - _HEADER.size
+        return max(0, size // self._dtype.itemsize) if self._dtype is not None else 0
+
+    def _refresh(self):
+        """Map records appended since the last look, by this or another process."""
+        if self.bytes_used < _HEADER.size:
+            return
+        with open(self.path, "rb") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                self._refresh_locked(f)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh_locked(self, f):
+        """``_refresh`` for a caller already holding a lock on the file through ``f``."""
+        if self.dim is None:
+            if self.bytes_used < _HEADER.size:
+                return
+            f.seek(0)
+            magic, _, dim = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{self.path} is not an embedding cache file")
+            self._set_dim(dim)
+        count = self._record_count()
+        if count <= self._indexed:
+            return
+        self._map = np.memmap(self.path, dtype=self._dtype, mode="r", offset=_HEADER.size, shape=(count,))
+        keys = self._map["key"][self._indexed:count]
+        for offset, key in enumerate(keys):
+            self._rows.setdefault(key.tobytes(), self._indexed + offset)
+        self._indexed = count
+
+    def _set_dim(self, dim: int):
+        self.dim = dim
+        self._dtype = np.dtype([("key", "V16"), ("vec", "<f4", (dim,))])
+
+    def get(self, key: bytes) -> Optional[List[float]]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None or row >= self._indexed:
+                self._refresh()
+                row = self._rows.get(key)
+            if row is None or row >= self._indexed:
+                return None
+            return self._map["vec"][row].tolist()
+
+    def put(self, key: bytes, vector: List[float]):
+        with self._lock:
+            if self.dim is None:
+                self._refresh()
+            if self.dim is None:
+                self._set_dim(len(vector))
+            if len(vector) != self.dim or key in self._rows:
+                return
+            if self.bytes_used + self._dtype.itemsize > self.max_bytes:
+                return
+            record = np.zeros(1, dtype=self._dtype)
+            record["key"] = np.void(key)
+            record["vec"] = vector
+            with open(self.path, "ab+") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    end = f.seek(0, os.SEEK_END)
+                    if end == 0:
+                        f.write(_HEADER.pack(_MAGIC, 1, self.dim))
+                        end = _HEADER.size
+                    else:
+                        # Another worker may have appended this key since we last looked
+                        self._refresh_locked(f)
+                        if key in self._rows:
+                            return
+                    f.write(record.tobytes())
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            # Our own record: known without re-reading; it is mapped on the next get
+            self._rows[key] = (end - _HEADER.size) // self._dtype.itemsize
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches ``embed_query`` results in memory and on disk."""
+
+    def __init__(self, inner: Embeddings, max_entries: int = 4096, path: Optional[str] = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024, logger=None):
+        """``logger`` is a ``StructuredLogger`` for disk failures; without one they are printed."""
+        self.inner = inner
+        self.logger = logger
+        self.max_entries = max_entries
+        self.disk = _DiskStore(path, max_disk_bytes) if path else None
+        self._memory: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _warn(self, event: str, error: Exception):
+        if self.logger is not None:
+            self.logger.warning(event, error=str(error))
+        else:
+            print(f"{event}: {str(error)}")
+
+    def _lookup_memory(self, key: bytes) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return vector
+
+    def _lookup_disk(self, key: bytes) -> Optional[List[float]]:
+        vector = None
+        if self.disk is not None:
+            try:
+                vector = self.disk.get(key)
+            except (OSError, ValueError) as e:
+                self._warn("embedding_cache_disk_read_failed", e)
+            if vector is not None:
+                self._remember(key, vector)
+        with self._lock:
+            if vector is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        return vector
+
+    def lookup(self, text: str) -> Optional[List[float]]:
+        key = text_key(text)
+        vector = self._lookup_memory(key)
+        return vector if vector is not None else self._lookup_disk(key)
+
+    def _remember(self, key: bytes, vector: List[float]):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def store(self, text: str, vector: List[float]):
+        key = text_key(text)
+        self._remember(key, vector)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, vector)
+            except OSError as e:
+                self._warn("embedding_cache_disk_write_failed", e)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.lookup(text)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self.store(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Only the in-memory LRU is read on the event loop; the disk store may re-map its file
+        key = text_key(text)
+        vector = self._lookup_memory(key)
+        if vector is None and self.disk is not None:
+            vector = await asyncio.to_thread(self._lookup_disk, key)
+        elif vector is None:
+            vector = self._lookup_disk(key)
+        if vector is None:
+            vector = await self.inner.aembed_query(text)
+            await asyncio.to_thread(self.store, text, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Catalog documents are embedded once at ingestion; only queries are cached
+        return self.inner.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            dim = len(next(iter(self._memory.values()))) if self._memory else 0
+            stats = {
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "memory_bytes": len(self._memory) * dim * 4,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+        if self.disk is not None:
+            stats["disk_entries"] = self.disk.entries
+            stats["disk_bytes"] = self.disk.bytes_used
+            stats["max_disk_bytes"] = self.disk.max_bytes
+        return stats
@@ -0,0 +1,110 @@
+"""In-memory facet counts for the store catalog.
+
+Keeps category -> count, brand -> count and (brand, category) -> count, updated
+incrementally as products are created, updated and deleted, and rebuildable
+from a full scan of the index.
+"""
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class FacetIndex:
+    def __init__(self):
+        self._products: Dict[str, Tuple[str, str]] = {}
+        self._categories: Counter = Counter()
+        self._brands: Counter = Counter()
+        self._pairs: Counter = Counter()
+        self._lock = threading.RLock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        # Mutations seen while a rebuild scan is running, replayed on top of its result
+        self._journal: Optional[list] = None
+        self.ready = False
+
+    def _add(self, product_id: str, brand: str, category: str):
+        self._products[product_id] = (brand, category)
+        if category:
+            self._categories[category] += 1
+        if brand:
+            self._brands[brand] += 1
+        if brand and category:
+            self._pairs[(brand, category)] += 1
+
+    def _discard(self, product_id: str):
+        previous = self._products.pop(product_id, None)
+        if previous is None:
+            return
+        brand, category = previous
+        for counter, key in ((self._categories, category), (self._brands, brand), (self._pairs, (brand, category))):
+            if key in counter:
+                counter[key] -= 1
+                if counter[key] <= 0:
+                    del counter[key]
+
+    def apply(self, product_id: str, metadata: Dict[str, Any]):
+        """Record a created or updated product."""
+        brand, category = metadata.get("brand", ""), metadata.get("category", "")
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((product_id, metadata))
+            if self._products.get(product_id) == (brand, category):
+                return
+            self._discard(product_id)
+            self._add(product_id, brand, category)
+            self._snapshot = None
+
+    def remove(self, product_id: str):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((product_id, None))
+            self._discard(product_id)
+            self._snapshot = None
+
+    def begin_rebuild(self):
+        """Start recording mutations so a rebuild from a slow scan can replay them."""
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+
+    def cancel_rebuild(self):
+        """Stop recording after a scan that failed before ``rebuild``; the current counts stay."""
+        with self._lock:
+            self._journal = None
+
+    def rebuild(self, products: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Replace all counts from a full scan of ``(product_id, metadata)`` pairs."""
+        self.begin_rebuild()
+        fresh = FacetIndex()
+        try:
+            for product_id, metadata in products:
+                fresh.apply(product_id, metadata)
+        finally:
+            with self._lock:
+                journal, self._journal = self._journal, None
+        with self._lock:
+            for product_id, metadata in journal:
+                if metadata is None:
+                    fresh.remove(product_id)
+                else:
+                    fresh.apply(product_id, metadata)
+            self._products, self._categories = fresh._products, fresh._categories
+            self._brands, self._pairs = fresh._brands, fresh._pairs
+            self._snapshot = None
+            self.ready = True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Facet lists and counts, cached until the next mutation."""
+        with self._lock:
+            if self._snapshot is None:
+                brand_categories: Dict[str, Dict[str, int]] = {}
+                for (brand, category), count in sorted(self._pairs.items()):
+                    brand_categories.setdefault(brand, {})[category] = count
+                self._snapshot = {
+                    "categories": sorted(self._categories),
+                    "brands": sorted(self._brands),
+                    "category_counts": dict(sorted(self._categories.items())),
+                    "brand_counts": dict(sorted(self._brands.items())),
+                    "brand_categories": brand_categories,
+                    "products": len(self._products),
+                }
+            return self._snapshot
@@ -0,0 +1,177 @@
+"""Local stand-in for the Groq chat completions API, with injectable latency and errors.
+
+Speaks the OpenAI-compatible ``/openai/v1/chat/completions`` protocol that
+``ChatGroq`` uses (plain and ``stream=true``), and answers with the same
+canned avatar JSON as ``benchmark.FakeChatGroq``. Point the assistant at it
+to exercise deadlines, hedging and the fallback model without network::
+
+    python fake_llm_server.py --port 4010 --latency-ms 400 --spike-rate 0.1 --spike-ms 6000
+    GROQ_BASE_URL=http://127.0.0.1:4010 GROQ_API_KEY=fake python app3.py
+
+Models whose name contains ``--small-model-marker`` (default ``8b``) run at
+``--small-model-factor`` of the configured latency. ``POST /control`` changes
+the latency settings of a running server, e.g. to start a latency spike
+mid-test, and ``GET /control`` shows them with request counts.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from benchmark import LLM_MODES, FakeChatGroq
+
+app = FastAPI(title="Fake LLM server")
+
+SETTINGS: Dict[str, Any] = {
+    "latency_ms": 300.0,
+    "jitter_ms": 50.0,
+    "spike_rate": 0.0,
+    "spike_ms": 5000.0,
+    "token_ms": 2.0,
+    "error_rate": 0.0,
+    "small_model_marker": "8b",
+    "small_model_factor": 0.3,
+    "mode": "json",
+    "seed": None,
+}
+COUNTS = {"requests": 0, "streams": 0, "spikes": 0, "errors": 0}
+_RNG = random.Random()
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: Optional[str] = ""
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str
+    messages: List[ChatMessage]
+    stream: bool = False
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+
+
+class _Prompt:
+    def __init__(self, text: str):
+        self.text = text
+
+    def to_string(self) -> str:
+        return self.text
+
+
+def _first_token_delay(model: str) -> float:
+    """Seconds before the first token, including jitter and the occasional spike."""
+    delay = SETTINGS["latency_ms"] + _RNG.uniform(-1, 1) * SETTINGS["jitter_ms"]
+    if _RNG.random() < SETTINGS["spike_rate"]:
+        COUNTS["spikes"] += 1
+        delay += SETTINGS["spike_ms"]
+    if SETTINGS["small_model_marker"] and SETTINGS["small_model_marker"] in model.lower():
+        delay *= SETTINGS["small_model_factor"]
+    return max(delay, 0.0) / 1000.0
+
+
+def _completion_text(request: ChatCompletionRequest) -> str:
+    prompt = "\n".join(message.content or "" for message in request.messages)
+    return FakeChatGroq(mode=SETTINGS["mode"])._reply(_Prompt(prompt))
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    COUNTS["requests"] += 1
+    if _RNG.random() < SETTINGS["error_rate"]:
+        COUNTS["errors"] += 1
+        raise HTTPException(status_code=503, detail="Injected failure")
+    text = _completion_text(request)
+    delay = _first_token_delay(request.model)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+    token_delay = SETTINGS["token_ms"] / 1000.0
+    if SETTINGS["small_model_marker"] and SETTINGS["small_model_marker"] in request.model.lower():
+        token_delay *= SETTINGS["small_model_factor"]
+
+    if request.stream:
+        COUNTS["streams"] += 1
+
+        async def events():
+            await asyncio.sleep(delay)
+            yield _chunk(completion_id, request.model, {"role": "assistant", "content": ""})
+            for piece in pieces:
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+                yield _chunk(completion_id, request.model, {"content": piece})
+            yield _chunk(completion_id, request.model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(delay + token_delay * len(pieces))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)},
+    }
+
+
+@app.get("/control")
+async def get_control():
+    return {"settings": SETTINGS, "counts": COUNTS}
+
+
+@app.post("/control")
+async def set_control(settings: Dict[str, Any]):
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown settings: {', '.join(sorted(unknown))}")
+    if settings.get("mode", SETTINGS["mode"]) not in LLM_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(LLM_MODES)}")
+    SETTINGS.update(settings)
+    if "seed" in settings:
+        _RNG.seed(settings["seed"])
+    return {"settings": SETTINGS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Groq-compatible LLM server with latency injection")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4010)
+    parser.add_argument("--latency-ms", type=float, default=SETTINGS["latency_ms"], help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=SETTINGS["jitter_ms"])
+    parser.add_argument("--spike-rate", type=float, default=SETTINGS["spike_rate"], help="fraction of slow requests")
+    parser.add_argument("--spike-ms", type=float, default=SETTINGS["spike_ms"], help="extra latency of a slow request")
+    parser.add_argument("--token-ms", type=float, default=SETTINGS["token_ms"], help="delay per streamed chunk")
+    parser.add_argument("--error-rate", type=float, default=SETTINGS["error_rate"], help="fraction answered with 503")
+    parser.add_argument("--small-model-marker", default=SETTINGS["small_model_marker"])
+    parser.add_argument("--small-model-factor", type=float, default=SETTINGS["small_model_factor"])
+    parser.add_argument("--mode", choices=LLM_MODES, default=SETTINGS["mode"])
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    SETTINGS.update({key: value for key, value in vars(args).items() if key in SETTINGS})
+    _RNG.seed(args.seed)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
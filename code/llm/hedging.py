@@ -0,0 +1,268 @@
+"""Deadline-aware LLM calls: hedged requests and a smaller fallback model.
+
+Each request gets a deadline (``start_deadline``) that the LLM stage works
+against:
+
+- If the remaining budget is already below ``min_primary_budget``, the
+  fallback model answers straight away (``fallback_budget``).
+- Otherwise the primary model is called. If it has not answered after the
+  hedge delay (the observed p95 of primary calls, or a fixed value), a second
+  identical request is sent and whichever finishes first wins (``primary`` or
+  ``hedge``).
+- If neither answers while ``fallback_reserve`` seconds are still left, or the
+  primary fails, both are cancelled and the fallback model gets the rest of
+  the budget (``fallback_timeout`` / ``fallback_error``). An ``error_fallback``
+  model, when given, takes the ``fallback_error`` case only: a larger model is
+  a fine stand-in for a failing one, but too slow for a spent budget.
+
+Streams race on the first chunk the same way, and a fallback stream must
+deliver its first chunk within the remaining budget. Streams keep their own
+latency window (time to first chunk), so their p95 never sets the hedge
+delay of complete calls. The serving path is returned with each result so
+the response can say which one it came from.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import numpy as np
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+FALLBACK_BUDGET = "fallback_budget"
+FALLBACK_TIMEOUT = "fallback_timeout"
+FALLBACK_ERROR = "fallback_error"
+
+INVOKE = "invoke"
+STREAM = "stream"
+
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+def start_deadline(seconds: float):
+    """Start the LLM budget for the current request; returns a token for ``reset_deadline``."""
+    return _DEADLINE.set(time.monotonic() + seconds)
+
+
+def reset_deadline(token):
+    _DEADLINE.reset(token)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class HedgedLLM:
+    def __init__(self, primary, fallback=None, deadline: float = 8.0, hedge_delay: Optional[float] = None,
+                 hedge: bool = True, min_primary_budget: float = 2.0, fallback_reserve: float = 1.5,
+                 min_hedge_delay: float = 0.5, latency_window: int = 200, min_samples: int = 20,
+                 error_fallback=None):
+        """``hedge_delay`` None means adaptive: the p95 of the last ``latency_window`` primary calls.
+
+        ``error_fallback`` (default ``fallback``) answers when the primary fails; ``fallback`` answers
+        when the budget runs short, so it should be the fast one.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.error_fallback = error_fallback
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay
+        self.hedge = hedge
+        self.min_primary_budget = min_primary_budget
+        self.fallback_reserve = fallback_reserve if fallback is not None else 0.0
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        # Complete-call latency and stream time-to-first-chunk are different distributions
+        self._latencies = {INVOKE: deque(maxlen=latency_window), STREAM: deque(maxlen=latency_window)}
+        self._lock = threading.Lock()
+        self.paths: Counter = Counter()
+        self.hedges_sent = 0
+        self.deadline_exceeded = 0
+
+    def _remaining(self) -> float:
+        deadline = _DEADLINE.get()
+        if deadline is None:
+            return self.deadline
+        return deadline - time.monotonic()
+
+    def current_hedge_delay(self, kind: str = INVOKE) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        with self._lock:
+            samples = list(self._latencies[kind])
+        if len(samples) < self.min_samples:
+            # Too little history for a p95: only hedge once a call is clearly slow
+            return max(self.min_hedge_delay, self.deadline / 2)
+        return max(self.min_hedge_delay, float(np.percentile(samples, 95)))
+
+    def _record(self, path: str):
+        with self._lock:
+            self.paths[path] += 1
+
+    def _deadline_exceeded(self, message: str = "LLM deadline exceeded") -> DeadlineExceeded:
+        with self._lock:
+            self.deadline_exceeded += 1
+        return DeadlineExceeded(message)
+
+    def _fallback_model(self, path: str):
+        if path == FALLBACK_ERROR and self.error_fallback is not None:
+            return self.error_fallback
+        return self.fallback
+
+    async def _fallback(self, prompt_value, path: str) -> Tuple[Any, str]:
+        remaining = self._remaining()
+        model = self._fallback_model(path)
+        if model is None or remaining <= 0:
+            raise self._deadline_exceeded()
+        try:
+            result = await asyncio.wait_for(model.ainvoke(prompt_value), remaining)
+        except asyncio.TimeoutError:
+            raise self._deadline_exceeded("LLM deadline exceeded, fallback model included")
+        self._record(path)
+        return result, path
+
+    async def _fallback_stream(self, prompt_value, path: str):
+        """Fallback stream and its first chunk, which must arrive within the remaining budget."""
+        remaining = self._remaining()
+        if remaining <= 0:
+            raise self._deadline_exceeded()
+        stream = self._fallback_model(path).astream(prompt_value)
+        try:
+            first = await asyncio.wait_for(stream.__anext__(), remaining)
+        except asyncio.TimeoutError:
+            await stream.aclose()
+            raise self._deadline_exceeded("LLM deadline exceeded, fallback model included")
+        except StopAsyncIteration:
+            first = None
+        return first, stream
+
+    async def _race(self, start, remaining: float, kind: str = INVOKE):
+        """Run ``start(PRIMARY)``, hedged with ``start(HEDGE)``, until one succeeds or the budget is spent.
+
+        Returns ``(path, result, error, timed_out)``; ``path`` is None when nothing succeeded.
+        """
+        started = time.monotonic()
+        # Leave the fallback its reserve, but never less than half the budget for the primary
+        budget = max(remaining - self.fallback_reserve, remaining / 2)
+        hedge_at = self.current_hedge_delay(kind) if self.hedge else None
+        if hedge_at is not None and hedge_at >= budget:
+            hedge_at = None
+        tasks = {asyncio.ensure_future(start(PRIMARY)): PRIMARY}
+        error = None
+        try:
+            while tasks:
+                elapsed = time.monotonic() - started
+                timeout = (hedge_at if hedge_at is not None else budget) - elapsed
+                if timeout <= 0 and hedge_at is None:
+                    break
+                done, _ = await asyncio.wait(tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    path = tasks.pop(task)
+                    if task.exception() is None:
+                        with self._lock:
+                            self._latencies[kind].append(time.monotonic() - started)
+                        return path, task.result(), None, False
+                    error = task.exception()
+                if hedge_at is not None and (not tasks or time.monotonic() - started >= hedge_at):
+                    # The primary is slower than its usual p95 (or failed): race a second identical request
+                    tasks[asyncio.ensure_future(start(HEDGE))] = HEDGE
+                    hedge_at = None
+                    with self._lock:
+                        self.hedges_sent += 1
+            return None, None, error, bool(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _give_up(self, error, timed_out: bool):
+        path = FALLBACK_TIMEOUT if timed_out else FALLBACK_ERROR
+        if self._fallback_model(path) is not None:
+            return path
+        if timed_out or error is None:
+            raise self._deadline_exceeded()
+        raise error
+
+    async def ainvoke(self, prompt_value) -> Tuple[Any, str]:
+        """``(message, path)`` from whichever route answered within the deadline."""
+        remaining = self._remaining()
+        if self.fallback is not None and remaining < self.min_primary_budget:
+            return await self._fallback(prompt_value, FALLBACK_BUDGET)
+        path, result, error, timed_out = await self._race(lambda _: self.primary.ainvoke(prompt_value), remaining)
+        if path is not None:
+            self._record(path)
+            return result, path
+        return await self._fallback(prompt_value, self._give_up(error, timed_out))
+
+    async def astream(self, prompt_value) -> AsyncIterator[Tuple[Any, str]]:
+        """Yield ``(chunk, path)``; routes race on the first chunk, then the winner streams on."""
+        remaining = self._remaining()
+        if self.fallback is not None and remaining < self.min_primary_budget:
+            path = FALLBACK_BUDGET
+            first, stream = await self._fallback_stream(prompt_value, path)
+        else:
+            streams = {}
+
+            def start(path):
+                streams[path] = self.primary.astream(prompt_value)
+                return streams[path].__anext__()
+
+            path, first, error, timed_out = await self._race(start, remaining, STREAM)
+            for name, losing in streams.items():
+                if name != path:
+                    await losing.aclose()
+            if path is not None:
+                stream = streams[path]
+            else:
+                path = self._give_up(error, timed_out)
+                first, stream = await self._fallback_stream(prompt_value, path)
+        if first is not None:
+            yield first, path
+        async for chunk in stream:
+            yield chunk, path
+        self._record(path)
+
+    def invoke(self, prompt_value) -> Tuple[Any, str]:
+        """Blocking variant: budget check and fallback on error, without hedging."""
+        remaining = self._remaining()
+        if self.fallback is not None and remaining < self.min_primary_budget:
+            result = self.fallback.invoke(prompt_value)
+            self._record(FALLBACK_BUDGET)
+            return result, FALLBACK_BUDGET
+        started = time.monotonic()
+        try:
+            result = self.primary.invoke(prompt_value)
+        except Exception:
+            fallback = self._fallback_model(FALLBACK_ERROR)
+            if fallback is None:
+                raise
+            result = fallback.invoke(prompt_value)
+            self._record(FALLBACK_ERROR)
+            return result, FALLBACK_ERROR
+        with self._lock:
+            self._latencies[INVOKE].append(time.monotonic() - started)
+        self._record(PRIMARY)
+        return result, PRIMARY
+
+    def stats(self) -> Dict[str, Any]:
+        hedge_delay = self.current_hedge_delay(INVOKE) if self.hedge else None
+        stream_hedge_delay = self.current_hedge_delay(STREAM) if self.hedge else None
+        with self._lock:
+            served = sum(self.paths.values())
+            fallbacks = sum(count for path, count in self.paths.items() if path.startswith("fallback"))
+            return {
+                "deadline_seconds": self.deadline,
+                "hedge_delay_seconds": round(hedge_delay, 3) if hedge_delay is not None else None,
+                "stream_hedge_delay_seconds": round(stream_hedge_delay, 3) if stream_hedge_delay is not None else None,
+                "served": dict(self.paths),
+                "hedges_sent": self.hedges_sent,
+                "hedge_wins": self.paths.get(HEDGE, 0),
+                "fallback_ratio": round(fallbacks / served, 4) if served else 0.0,
+                "deadline_exceeded": self.deadline_exceeded,
+                "primary_samples": len(self._latencies[INVOKE]),
+                "stream_samples": len(self._latencies[STREAM]),
+            }
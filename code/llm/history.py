@@ -0,0 +1,142 @@
+"""Rolling-summary chat history with a hard token ceiling.
+
+The last ``keep_turns`` turns are kept verbatim. Older messages are folded into
+a summary that only advances every ``summary_every`` turns, so between updates
+the same cached summary is reused. Each update extends the previous summary
+with just the newly folded messages rather than re-summarizing the session.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from tokens import estimate_tokens, truncate_to_tokens
+
+Message = Tuple[str, str]  # (role, content)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _speaker(role: str) -> str:
+    return "Customer" if role.lower() == "user" else "Emily"
+
+
+def _fingerprint(messages: Sequence[Message]) -> str:
+    digest = hashlib.sha1()
+    for role, content in messages:
+        digest.update(role.encode("utf-8") + b"\0" + content.encode("utf-8") + b"\1")
+    return digest.hexdigest()
+
+
+def extractive_summary(previous: str, messages: Sequence[Message], max_tokens: int) -> str:
+    """Default summarizer: the first sentence of each folded message, oldest lines dropped past the budget."""
+    lines = previous.split("\n") if previous else []
+    for role, content in messages:
+        first = _SENTENCE_END.split(" ".join(content.split()), 1)[0]
+        lines.append(f"{_speaker(role)}: {truncate_to_tokens(first, 25)}")
+    while len(lines) > 1 and sum(estimate_tokens(line) for line in lines) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    def __init__(
+        self,
+        keep_turns: int = 3,
+        summary_every: int = 2,
+        token_ceiling: int = 500,
+        summary_tokens: int = 150,
+        summarizer: Optional[Callable[[str, Sequence[Message], int], str]] = None,
+        cache_size: int = 2048,
+    ):
+        self.keep_messages = max(0, keep_turns) * 2
+        self.summary_step = max(1, summary_every) * 2
+        self.token_ceiling = token_ceiling
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer or extractive_summary
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.summary_hits = 0
+        self.summary_updates = 0
+
+    def _cached(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+            return summary
+
+    def _store(self, key: str, summary: str):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    def summarize(self, messages: Sequence[Message], cut: int) -> str:
+        """Summary of ``messages[:cut]``, built incrementally from the longest cached shorter prefix."""
+        if cut <= 0:
+            return ""
+        # Walk back to the newest boundary we already have a summary for
+        pending = []
+        summary = ""
+        boundary = cut
+        while boundary > 0:
+            key = _fingerprint(messages[:boundary])
+            cached = self._cached(key)
+            if cached is not None:
+                summary = cached
+                break
+            pending.append((boundary, key))
+            boundary -= self.summary_step
+        if not pending:
+            with self._lock:
+                self.summary_hits += 1
+            return summary
+        # Then fold forward one step at a time, caching each boundary on the way
+        for end, key in reversed(pending):
+            start = max(end - self.summary_step, 0)
+            summary = self.summarizer(summary, messages[start:end], self.summary_tokens)
+            self._store(key, summary)
+            with self._lock:
+                self.summary_updates += 1
+        return summary
+
+    def format(self, messages: Sequence[Message]) -> str:
+        """Render history for the prompt: rolling summary plus recent turns, within the token ceiling."""
+        if not messages:
+            return ""
+        overflow = len(messages) - self.keep_messages
+        # The summary boundary only moves every summary_step messages
+        cut = (overflow // self.summary_step) * self.summary_step if overflow > 0 else 0
+        summary = self.summarize(messages, cut)
+
+        recent = [f"{_speaker(role)}: {content}" for role, content in messages[cut:]]
+        recent_tokens = [estimate_tokens(line) for line in recent]
+        budget = self.token_ceiling
+        # Recent turns take priority; drop the oldest of them, then truncate, if they alone are over
+        while len(recent) > 1 and sum(recent_tokens) > budget:
+            recent.pop(0)
+            recent_tokens.pop(0)
+        if recent and recent_tokens[0] > budget:
+            recent[0] = truncate_to_tokens(recent[0], budget)
+            recent_tokens[0] = estimate_tokens(recent[0])
+
+        blocks = []
+        remaining = budget - sum(recent_tokens)
+        if summary and remaining > 10:
+            header = "Summary of earlier conversation:"
+            blocks.append(f"{header}\n{truncate_to_tokens(summary, remaining - estimate_tokens(header))}")
+        blocks.extend(recent)
+        return "\n".join(blocks)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "cached_summaries": len(self._summaries),
+                "summary_hits": self.summary_hits,
+                "summary_updates": self.summary_updates,
+                "token_ceiling": self.token_ceiling,
+            }
@@ -0,0 +1,357 @@
+"""Intent router that answers structured catalog questions without the LLM.
+
+Price, stock, warranty and listing questions ("how much is the Galaxy S23
+Ultra", "is the Pixel 8 Pro in stock", "list Samsung phones") are answered
+exactly from the catalog columns and rendered into the usual three avatar
+messages from per-language templates. Classification is keyword rules first,
+then the nearest embedded intent prototype for English queries no rule covers.
+Anything open-ended, ambiguous or in a language without templates falls
+through to the RAG chain.
+"""
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+PRICE = "price"
+STOCK = "stock"
+WARRANTY = "warranty"
+LISTING = "listing"
+OPEN = "open"
+
+# Reasoning-style questions always go to the LLM, whatever else they mention
+_OPEN_RULE = re.compile(
+    r"\b(compare|comparison|vs|versus|better|best|recommend|suggest|difference|should i|good for|review|worth|"
+    r"suits?|suitable|which of|colou?rs?)\b",
+    re.IGNORECASE,
+)
+_RULES = (
+    # Bare "available" is left to the prototypes: "what colours are available" is not a stock question
+    (STOCK, re.compile(r"\b(in stock|stock|still available|available now|units left|sold out)\b|ஸ்டாக்|கையிருப்பு|இருப்பு", re.IGNORECASE)),
+    (WARRANTY, re.compile(r"\b(warrant(y|ies)|guarantee)\b|வாரண்டி|உத்தரவாதம்", re.IGNORECASE)),
+    (PRICE, re.compile(r"\b(price|prices|cost|costs|how much|mrp|discount)\b|விலை|தள்ளுபடி", re.IGNORECASE)),
+    # No bare "all"/"models": "which of all these models ..." asks for advice, not a listing
+    (LISTING, re.compile(r"\b(list|show me|show all|catalog|range|lineup)\b|பட்டியல்|காட்டு", re.IGNORECASE)),
+)
+_MAX_PRICE = re.compile(r"\b(?:under|below|less than|within|upto|up to)\s*(?:rs\.?|₹|inr)?\s*([\d,]+)", re.IGNORECASE)
+_MIN_PRICE = re.compile(r"\b(?:above|over|more than|at least)\s*(?:rs\.?|₹|inr)?\s*([\d,]+)", re.IGNORECASE)
+_WORD = re.compile(r"[a-z0-9]+")
+_TOKEN = re.compile(r"[a-z0-9]+|[\u0b80-\u0bff]+")
+# Words a listing request may carry besides brand, category and price bounds; anything else
+# ("good camera", "for programming", "budget") needs the LLM
+_LISTING_FILLER = frozenset((
+    "a", "all", "an", "any", "are", "available", "can", "catalog", "catalogue", "cost", "costs", "could", "do",
+    "does", "have", "how", "i", "in", "inr", "is", "lineup", "list", "me", "models", "mrp", "much", "of", "on",
+    "please", "price", "prices", "products", "range", "rs", "s", "see", "sell", "show", "stock", "the", "there",
+    "warranty", "we", "what", "which", "you", "your",
+))
+# Tamil words are matched by prefix so suffixed forms ("காட்டுங்கள்") count too
+_TAMIL_FILLER = ("பட்டியல்", "காட்டு", "விலை", "ஸ்டாக்", "கையிருப்பு", "இருப்பு", "வாரண்டி", "உத்தரவாதம்",
+                 "தள்ளுபடி", "என்ன", "எல்லா", "அனைத்து", "உள்ள", "இருக்கு")
+
+PROTOTYPES = {
+    PRICE: [
+        "what is the price of this phone",
+        "how much does the laptop cost",
+        "what discount do you have on it",
+    ],
+    STOCK: [
+        "is this product available right now",
+        "do you have the headphones in stock",
+        "how many units are left",
+    ],
+    WARRANTY: [
+        "what warranty comes with it",
+        "how long is the guarantee period",
+    ],
+    LISTING: [
+        "list all samsung phones",
+        "show me the laptops you sell",
+        "what tablets do you have",
+    ],
+    OPEN: [
+        "which phone has the best camera",
+        "recommend a laptop for gaming and video editing",
+        "compare these two smartwatches",
+        "what colours are available for this phone",
+        "which of all these models suits gaming",
+        "hello, how are you today",
+        "I need a gift for my father",
+    ],
+}
+
+TEMPLATES = {
+    "english": {
+        PRICE: (
+            "Here's the pricing for the {name}.",
+            "It lists at {mrp} with a {discount} discount, so you pay {price}.",
+            "Would you like to know about its stock or warranty?",
+        ),
+        STOCK: (
+            "Let me check the {name} for you.",
+            "Good news, we have {stock} units in stock right now.",
+            "Would you like to know its price or warranty?",
+        ),
+        "out_of_stock": (
+            "Let me check the {name} for you.",
+            "I'm sorry, it's out of stock at the moment.",
+            "Would you like me to suggest a similar product?",
+        ),
+        WARRANTY: (
+            "Here are the warranty details for the {name}.",
+            "It comes with a {warranty} warranty.",
+            "Would you like to know its price or availability?",
+        ),
+        LISTING: (
+            "I found {total} products matching your request.",
+            "{items}.",
+            "Which of these would you like to know more about?",
+        ),
+        "one": "I found one product matching your request.",
+        "more": "and {count} more",
+        "item": "{name} at {price}",
+    },
+    "tamil": {
+        PRICE: (
+            "{name} இன் விலை விவரங்கள் இதோ.",
+            "இதன் MRP {mrp}, தள்ளுபடி {discount}. இப்போது விலை {price}.",
+            "இதன் ஸ்டாக் அல்லது வாரண்டி பற்றி தெரிந்து கொள்ள விரும்புகிறீர்களா?",
+        ),
+        STOCK: (
+            "{name} பற்றி சரிபார்க்கிறேன்.",
+            "தற்போது {stock} யூனிட்கள் கையிருப்பில் உள்ளன.",
+            "இதன் விலை அல்லது வாரண்டி பற்றி தெரிந்து கொள்ள விரும்புகிறீர்களா?",
+        ),
+        "out_of_stock": (
+            "{name} பற்றி சரிபார்க்கிறேன்.",
+            "மன்னிக்கவும், இது தற்போது கையிருப்பில் இல்லை.",
+            "இதே போன்ற வேறு தயாரிப்பை பரிந்துரைக்கட்டுமா?",
+        ),
+        WARRANTY: (
+            "{name} இன் வாரண்டி விவரங்கள் இதோ.",
+            "இதற்கு {warranty} வாரண்டி உள்ளது.",
+            "இதன் விலை அல்லது கையிருப்பு பற்றி தெரிந்து கொள்ள விரும்புகிறீர்களா?",
+        ),
+        LISTING: (
+            "உங்கள் தேடலுக்கு பொருந்தும் {total} தயாரிப்புகள் உள்ளன.",
+            "{items}.",
+            "இவற்றில் எதைப் பற்றி மேலும் அறிய விரும்புகிறீர்கள்?",
+        ),
+        "one": "உங்கள் தேடலுக்கு பொருந்தும் ஒரு தயாரிப்பு உள்ளது.",
+        "more": "மேலும் {count}",
+        "item": "{name} - {price}",
+    },
+}
+
+# (facialExpression, animation) for the opening, answer and follow-up messages
+_EXPRESSIONS = {
+    "default": (("smile", "Talking"), ("default", "Head Nod Yes"), ("smile", "Thoughtful Head Nod")),
+    "out_of_stock": (("default", "Talking"), ("sad", "Sad Idle"), ("smile", "Thoughtful Head Nod")),
+}
+
+
+def _money(value: Any) -> str:
+    try:
+        return f"₹{float(value):,.0f}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _amount(match: Optional["re.Match"]) -> Optional[float]:
+    if match is None:
+        return None
+    try:
+        return float(match.group(1).replace(",", ""))
+    except ValueError:
+        return None
+
+
+class IntentRouter:
+    def __init__(self, lexical_index, product_table, embeddings=None, prototype_threshold: float = 0.6,
+                 listing_limit: int = 5):
+        self.lexical_index = lexical_index
+        self.product_table = product_table
+        self.embeddings = embeddings
+        self.prototype_threshold = prototype_threshold
+        self.listing_limit = listing_limit
+        self._prototype_matrix: Optional[np.ndarray] = None
+        self._prototype_intents: List[str] = []
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.answered: Counter = Counter()
+        self.fallthrough: Counter = Counter()
+        self.classified_by: Counter = Counter()
+
+    # ------------------------------------------------------------ classification
+
+    def rule_intent(self, query: str) -> Optional[str]:
+        if _OPEN_RULE.search(query):
+            return OPEN
+        for intent, pattern in _RULES:
+            if pattern.search(query):
+                return intent
+        return None
+
+    def _prototypes(self) -> Optional[np.ndarray]:
+        """Embed the prototype sentences once (first use or ``warmup``)."""
+        if self._prototype_matrix is None and self.embeddings is not None:
+            intents = [intent for intent, examples in PROTOTYPES.items() for _ in examples]
+            texts = [text for examples in PROTOTYPES.values() for text in examples]
+            matrix = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+            self._prototype_intents, self._prototype_matrix = intents, matrix
+        return self._prototype_matrix
+
+    def warmup(self):
+        self._prototypes()
+
+    def prototype_intent(self, vector) -> Tuple[str, float]:
+        """Intent of the nearest prototype, or OPEN when nothing clears the threshold."""
+        matrix = self._prototypes()
+        if matrix is None:
+            return OPEN, 0.0
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        return (self._prototype_intents[best] if score >= self.prototype_threshold else OPEN), score
+
+    def needs_vector(self, query: str, language: str) -> bool:
+        """Whether classification has to fall back to the embedding prototypes."""
+        return self.embeddings is not None and language == "english" and self.rule_intent(query) is None
+
+    # ------------------------------------------------------------------ answers
+
+    def _catalog_terms(self, query: str) -> Tuple[Optional[str], Optional[str]]:
+        """Brand and category named in the query; plural and partial category words count ("phones")."""
+        words = set(_WORD.findall(query.lower()))
+        stems = {w[:-2] if w.endswith("es") and len(w) > 5 else w[:-1] if w.endswith("s") else w for w in words}
+        brand = category = None
+        for value in self.product_table.values("brand"):
+            if value and value.lower() in words:
+                brand = value
+                break
+        for value in self.product_table.values("category"):
+            lowered = value.lower()
+            if value and any(len(stem) >= 4 and stem in lowered for stem in stems | words):
+                category = value
+                break
+        return brand, category
+
+    def _extra_terms(self, query: str, brand: Optional[str], category: Optional[str]) -> List[str]:
+        """Words of the query beyond brand, category, price bounds and listing filler."""
+        text = _MIN_PRICE.sub(" ", _MAX_PRICE.sub(" ", query.lower()))
+        category = (category or "").lower()
+        extra = []
+        for word in _TOKEN.findall(text):
+            if word in _LISTING_FILLER or word == (brand or "").lower() or word.startswith(_TAMIL_FILLER):
+                continue
+            stem = word[:-2] if word.endswith("es") and len(word) > 5 else word[:-1] if word.endswith("s") else word
+            if category and len(stem) >= 4 and stem in category:
+                continue
+            extra.append(word)
+        return extra
+
+    def _product(self, query: str) -> Optional[Dict[str, Any]]:
+        hits = self.lexical_index.search(query, k=5)
+        decisive = self.lexical_index.decisive(query, hits)
+        if len(decisive) != 1:
+            return None
+        return self.lexical_index.metadata(decisive[0])
+
+    @staticmethod
+    def _messages(lines, slots: Dict[str, Any], style: str = "default") -> List[Dict[str, str]]:
+        return [
+            {"text": line.format(**slots), "facialExpression": expression, "animation": animation}
+            for line, (expression, animation) in zip(lines, _EXPRESSIONS[style])
+        ]
+
+    def _listing(self, query: str, templates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        brand, category = self._catalog_terms(query)
+        if brand is None and category is None or self._extra_terms(query, brand, category):
+            return None
+        # Bound, sort and show the same number: the sale price when the table has one
+        fields = self.product_table.fields
+        price_field = fields.get("sale_price", fields["price"])
+        result = self.product_table.query(
+            brand=brand,
+            category=category,
+            min_price=_amount(_MIN_PRICE.search(query)),
+            max_price=_amount(_MAX_PRICE.search(query)),
+            sort_by="sale_price",
+            limit=self.listing_limit,
+            price_column="sale_price",
+        )
+        if not result["products"]:
+            return None
+        items = [templates["item"].format(name=p.get("name", ""), price=_money(p.get(price_field)))
+                 for p in result["products"]]
+        if result["total"] > len(items):
+            items.append(templates["more"].format(count=result["total"] - len(items)))
+        lines = templates[LISTING]
+        if result["total"] == 1:
+            lines = (templates["one"],) + lines[1:]
+        messages = self._messages(lines, {"total": result["total"], "items": ", ".join(items)})
+        return {"messages": messages, "products": result["products"]}
+
+    def answer(self, query: str, language: str, intent: str) -> Optional[Dict[str, Any]]:
+        """Templated response for a structured intent, or None to fall through to the LLM."""
+        templates = TEMPLATES.get(language)
+        if templates is None or intent == OPEN:
+            return None
+        product = self._product(query) if intent != LISTING else None
+        if product is None:
+            # "price of Samsung phones" names no single product: list them with prices instead
+            return self._listing(query, templates)
+        slots = {
+            "name": product.get("name", ""),
+            "mrp": _money(product.get("mrp")),
+            "price": _money(product.get("price")),
+            "discount": product.get("discount") or "0%",
+            "stock": product.get("stock", 0),
+            "warranty": product.get("warranty") or "-",
+        }
+        style = "default"
+        lines = templates[intent]
+        if intent == STOCK and not product.get("stock"):
+            style, lines = "out_of_stock", templates["out_of_stock"]
+        return {"messages": self._messages(lines, slots, style), "products": [product]}
+
+    def route(self, query: str, language: str, vector=None) -> Optional[Dict[str, Any]]:
+        """Classify and answer; ``vector`` (the query embedding) is only used when no rule matches."""
+        language = language.lower()
+        intent = self.rule_intent(query)
+        source = "rule"
+        if intent is None and vector is not None and language == "english":
+            intent, _ = self.prototype_intent(vector)
+            source = "prototype"
+        response = None
+        if intent is not None:
+            response = self.answer(query, language, intent)
+        with self._lock:
+            self.queries += 1
+            if intent is not None:
+                self.classified_by[source] += 1
+            if response is not None:
+                self.answered[intent] += 1
+            elif language not in TEMPLATES:
+                self.fallthrough["language"] += 1
+            elif intent in (None, OPEN):
+                self.fallthrough["open"] += 1
+            else:
+                self.fallthrough["unresolved"] += 1
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            answered = sum(self.answered.values())
+            return {
+                "queries": self.queries,
+                "answered": answered,
+                "hit_rate": round(answered / self.queries, 4) if self.queries else 0.0,
+                "by_intent": dict(self.answered),
+                "fallthrough": dict(self.fallthrough),
+                "classified_by": dict(self.classified_by),
+            }
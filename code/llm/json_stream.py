@@ -0,0 +1,322 @@
+"""Incremental parser for the avatar JSON reply as it streams out of the LLM.
+
+The model answers with ``{"messages": [{...}, {...}, {...}], "products": [...]}``.
+``AvatarStreamParser`` scans the token stream once, character by character, and
+emits each message object the moment its closing brace arrives, followed by the
+products array once it closes. Text before the first ``{`` (preambles, code
+fences) is skipped.
+
+``parse_reply`` is the whole-text counterpart used by ``_format_output``: it
+locates the outermost JSON object, repairs the defects models commonly produce
+(code fences, trailing commas, a reply cut off mid-string or mid-array) and
+checks the result against the message/product shape. Well-formed replies take
+the C ``raw_decode`` path; only broken ones pay for the regex repair scan.
+Run ``python json_stream.py`` for a micro-benchmark.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+Event = Tuple[str, Any]
+
+FACIAL_EXPRESSIONS = ("smile", "sad", "angry", "surprised", "funnyFace", "default")
+DEFAULT_ANIMATION = "Talking"
+
+_DECODER = json.JSONDecoder(strict=False)
+# Strings (closing quote captured, so a missing one marks a cut-off string) and structural characters
+_TOKEN = re.compile(r'"(?:[^"\\]|\\[\s\S])*(")?|[{}\[\],:]')
+_MAX_CANDIDATES = 4
+
+
+def _repair(text: str, start: int, backtrack: bool = True) -> Optional[str]:
+    """Repair the JSON object starting at ``text[start]``: drop trailing commas, close a cut-off tail."""
+    pieces: List[str] = []
+    last = start
+    stack: List[str] = []
+    comma_end = -1  # end of the last comma if nothing but whitespace may follow it yet
+    key_start = -1  # start of an object key still waiting for its colon
+    expect_key = False
+    last_comma = -1  # fallback cut point when the final value itself is truncated
+    for m in _TOKEN.finditer(text, start):
+        token = m.group()
+        if comma_end >= 0 and text[comma_end:m.start()].strip():
+            comma_end = -1
+        if token[0] == '"':
+            if m.group(1) is None:
+                # Unterminated string: close it, unless it is a key (then drop it)
+                if expect_key and stack[-1] == "}":
+                    key_start = m.start()
+                else:
+                    pieces.append(text[last:m.end()] + '"')
+                    last = len(text)
+                break
+            if expect_key and stack[-1] == "}":
+                key_start = m.start()
+            comma_end = -1
+            continue
+        if token == ":":
+            key_start, expect_key = -1, False
+        elif token == ",":
+            last_comma = m.start()
+            comma_end = m.end()
+            expect_key = stack[-1] == "}"
+        elif token in "{[":
+            stack.append("}" if token == "{" else "]")
+            expect_key = token == "{"
+            comma_end = -1
+        else:
+            if comma_end >= 0:
+                # Trailing comma before a closer
+                pieces.append(text[last:comma_end - 1])
+                last = comma_end
+            comma_end = -1
+            if not stack or stack[-1] != token:
+                return None
+            stack.pop()
+            expect_key = False
+            if not stack:
+                pieces.append(text[last:m.end()])
+                return "".join(pieces)
+
+    # Cut off mid-object: trim the tail and close whatever is still open
+    if key_start >= 0:
+        pieces.append(text[last:key_start])
+    elif last < len(text):
+        pieces.append(text[last:])
+    tail = "".join(pieces).rstrip()
+    if tail.endswith(","):
+        tail = tail[:-1]
+    elif tail.endswith(":"):
+        tail += " null"
+    candidate = tail + "".join(reversed(stack))
+    try:
+        _DECODER.decode(candidate)
+        return candidate
+    except ValueError:
+        pass
+    # The last value itself is truncated (e.g. ``"in_stock": tru``): drop it
+    if backtrack and last_comma > start:
+        return _repair(text[:last_comma], start, backtrack=False)
+    return None
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """Outermost JSON object in ``text``, repaired if needed; None when nothing usable is found."""
+    if not text:
+        return None
+    # A closing fence would otherwise end up inside a cut-off object
+    stripped = text.rstrip()
+    if stripped.endswith("```"):
+        text = stripped[:-3]
+    start = text.find("{")
+    for _ in range(_MAX_CANDIDATES):
+        if start < 0:
+            return None
+        try:
+            return _DECODER.raw_decode(text, start)[0]
+        except ValueError:
+            pass
+        repaired = _repair(text, start)
+        if repaired is not None:
+            try:
+                return _DECODER.decode(repaired)
+            except ValueError:
+                pass
+        # A stray brace in a preamble: try the next candidate
+        start = text.find("{", start + 1)
+    return None
+
+
+def clean_message(message: Any) -> Optional[Dict[str, Any]]:
+    """Coerce one avatar message to ``{text, facialExpression, animation}``; None if it has no text."""
+    if isinstance(message, str):
+        message = {"text": message}
+    if not isinstance(message, dict):
+        return None
+    text = message.get("text")
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        text = str(text)
+    if not isinstance(text, str) or not text.strip():
+        return None
+    expression = message.get("facialExpression")
+    animation = message.get("animation")
+    cleaned = dict(message)
+    cleaned["text"] = text.strip()
+    cleaned["facialExpression"] = expression if expression in FACIAL_EXPRESSIONS else "default"
+    cleaned["animation"] = animation if isinstance(animation, str) and animation else DEFAULT_ANIMATION
+    return cleaned
+
+
+def clean_products(products: Any) -> List[Dict[str, Any]]:
+    """Product objects as dicts; bare IDs (the ID-only prompt) become ``{"product_id": id}``."""
+    if isinstance(products, (dict, str)):
+        products = [products]
+    if not isinstance(products, list):
+        return []
+    cleaned = []
+    for product in products:
+        if isinstance(product, dict):
+            cleaned.append(product)
+        elif isinstance(product, (str, int)) and not isinstance(product, bool) and str(product).strip():
+            cleaned.append({"product_id": str(product).strip()})
+    return cleaned
+
+
+def validate_reply(payload: Any) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Check a decoded reply against the message/product shape, dropping entries that don't fit."""
+    if not isinstance(payload, dict):
+        return None
+    raw_messages = payload.get("messages")
+    if isinstance(raw_messages, (dict, str)):
+        raw_messages = [raw_messages]
+    messages = [m for m in map(clean_message, raw_messages if isinstance(raw_messages, list) else []) if m]
+    products = clean_products(payload.get("products"))
+    if not messages and not products:
+        return None
+    return {"messages": messages, "products": products}
+
+
+def parse_reply(text: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Extract, repair and validate the avatar reply in an LLM completion."""
+    return validate_reply(extract_json(text))
+
+
+class AvatarStreamParser:
+    """Feed LLM text chunks and collect ``("message", dict)`` / ``("products", list)`` events."""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._array_start = -1
+        self._item_start = -1
+        self.started = False
+        self.done = False
+        self.messages_emitted = 0
+        self.products_emitted = False
+
+    def feed(self, chunk: str) -> List[Event]:
+        """Append a chunk and return any events completed by it."""
+        self.buffer += chunk
+        events: List[Event] = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            if self.done:
+                break
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._expect_key:
+                        self._last_key = buf[self._string_start + 1:i]
+                continue
+
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                else:
+                    continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and len(self._stack) == 1:
+                self._current_key = self._last_key
+                self._expect_key = False
+            elif c == "," and len(self._stack) == 1:
+                self._current_key = None
+                self._expect_key = True
+            elif c in "{[":
+                self._stack.append(c)
+                depth = len(self._stack)
+                if depth == 1:
+                    self._expect_key = True
+                elif depth == 2 and c == "[":
+                    self._array_key = self._current_key
+                    self._array_start = i
+                elif depth == 3 and c == "{" and self._stack[1] == "[" and self._array_key == "messages":
+                    self._item_start = i
+            elif c in "}]":
+                if not self._stack:
+                    continue
+                closed = self._stack.pop()
+                depth = len(self._stack)
+                if depth == 2 and closed == "{" and self._item_start >= 0:
+                    event = clean_message(self._load(buf[self._item_start:i + 1]))
+                    self._item_start = -1
+                    if event is not None:
+                        events.append(("message", event))
+                        self.messages_emitted += 1
+                elif depth == 1 and closed == "[":
+                    if self._array_key == "products":
+                        products = self._load(buf[self._array_start:i + 1])
+                        if isinstance(products, list):
+                            events.append(("products", clean_products(products)))
+                            self.products_emitted = True
+                    self._array_key = None
+                elif depth == 0:
+                    self.done = True
+        self._pos = len(buf)
+        return events
+
+    def result(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Best-effort validated reply from everything fed so far, even if the stream was cut off."""
+        return parse_reply(self.buffer)
+
+    @staticmethod
+    def _load(text: str):
+        try:
+            return _DECODER.decode(text)
+        except ValueError:
+            repaired = _repair(text, 0) if text.startswith("{") else _repair("{\"v\":" + text + "}", 0)
+            if repaired is None:
+                return None
+            try:
+                value = _DECODER.decode(repaired)
+            except ValueError:
+                return None
+            return value if text.startswith("{") else value.get("v")
+
+
+if __name__ == "__main__":
+    import timeit
+
+    reply = {
+        "messages": [
+            {"text": "Looking at our inventory, we have a few great phones.", "facialExpression": "smile", "animation": "Talking"},
+            {"text": "The Samsung Galaxy S23 Ultra has a 200MP camera and is 15% off.", "facialExpression": "default", "animation": "Head Nod Yes"},
+            {"text": "Would you like to compare it with the OnePlus 11?", "facialExpression": "smile", "animation": "Thoughtful Head Nod"},
+        ],
+        "products": [
+            {"name": "Samsung Galaxy S23 Ultra", "description": "Flagship phone with S Pen and 200MP camera", "mrp": 94999,
+             "discount": "15%", "price": 80749, "stock": 25, "warrenty": "1 year", "category": "Smartphones",
+             "img": "/products/S23U-456.jpg"},
+            {"name": "OnePlus 11 5G", "description": "Snapdragon 8 Gen 2 with Hasselblad camera", "mrp": 61999,
+             "discount": "10%", "price": 55799, "stock": 40, "warrenty": "1 year", "category": "Smartphones",
+             "img": "/products/OP11-789.jpg"},
+        ],
+    }
+    clean = json.dumps(reply, indent=2)
+    cases = {
+        "clean": clean,
+        "fenced + preamble": "Sure! Here is the answer:\n```json\n" + clean + "\n```",
+        "trailing commas": clean.replace("}\n  ]", "},\n  ]").replace('"Talking"', '"Talking",'),
+        "truncated": clean[:int(len(clean) * 0.8)],
+    }
+    print(f"{'case':<20} {'us/call':>8}  messages products")
+    for name, text in cases.items():
+        result = parse_reply(text)
+        number = 2000
+        seconds = timeit.timeit(lambda: parse_reply(text), number=number)
+        print(f"{name:<20} {seconds / number * 1e6:8.1f}  {len(result['messages']):>8} {len(result['products']):>8}")
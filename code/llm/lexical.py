@@ -0,0 +1,207 @@
+"""In-process BM25 index over the catalog, fused with vector retrieval.
+
+Brand, name, model code, category and description are tokenized into one
+inverted index, with the identifying fields repeated so they outweigh
+description words. ``decisive`` recognises queries that are really exact
+lookups (a model code such as ``S23U-456``, or every query word pointing at
+one clearly leading product on enough evidence) so retrieval can skip the embedding pass.
+Otherwise ``reciprocal_rank_fusion`` merges the lexical and vector rankings.
+"""
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_WORD = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT = re.compile(r"[-_./]")
+
+STOPWORDS = frozenset(
+    "a an and any are about at available buy can cost costs do does for from get have how i in is it its "
+    "me much my need of on or please price show stock tell than that the there this to want what which "
+    "with you your".split()
+)
+
+# Field -> repeat count, a cheap stand-in for BM25F field weights
+FIELD_WEIGHTS = (("product_id", 3), ("model", 3), ("brand", 2), ("name", 2), ("category", 1), ("description", 1))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words; hyphenated codes are kept whole and also split into their parts."""
+    tokens = []
+    for word in _WORD.findall(str(text).lower()):
+        tokens.append(word)
+        if _SPLIT.search(word):
+            tokens.extend(part for part in _SPLIT.split(word) if part)
+    return tokens
+
+
+def _is_code(token: str) -> bool:
+    return any(c.isdigit() for c in token) and any(c.isalpha() for c in token)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: each id scores ``sum(1 / (k + rank))`` over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, decisive_ratio: float = 2.0, min_term_length: int = 3,
+                 min_decisive_idf: float = 1.0):
+        """A single matching word is only decisive if it has ``min_term_length`` characters and ``min_decisive_idf``."""
+        self.k1 = k1
+        self.b = b
+        self.decisive_ratio = decisive_ratio
+        self.min_term_length = min_term_length
+        self.min_decisive_idf = min_decisive_idf
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._codes: Dict[str, set] = {}
+        self._metadata: Dict[str, Dict[str, Any]] = {}
+        self.searches = 0
+        self.decisive_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def _doc_tokens(self, metadata: Dict[str, Any]) -> List[str]:
+        tokens = []
+        for field, weight in FIELD_WEIGHTS:
+            value = metadata.get(field)
+            if value:
+                tokens.extend(tokenize(value) * weight)
+        return tokens
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        metadata = self._metadata.pop(doc_id)
+        for field in ("product_id", "model"):
+            code = str(metadata.get(field) or "").lower()
+            if code in self._codes:
+                self._codes[code].discard(doc_id)
+                if not self._codes[code]:
+                    del self._codes[code]
+
+    def _add(self, doc_id: str, metadata: Dict[str, Any]):
+        self._remove(doc_id)
+        terms = Counter(self._doc_tokens(metadata))
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = sum(terms.values())
+        self._total_length += self._doc_lengths[doc_id]
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._metadata[doc_id] = dict(metadata)
+        for field in ("product_id", "model"):
+            code = str(metadata.get(field) or "").lower()
+            if _is_code(code):
+                self._codes.setdefault(code, set()).add(doc_id)
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]):
+        with self._lock:
+            self._add(doc_id, metadata)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def rebuild(self, products: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Replace the index with ``(doc_id, metadata)`` pairs."""
+        fresh = LexicalIndex(self.k1, self.b, self.decisive_ratio, self.min_term_length, self.min_decisive_idf)
+        for doc_id, metadata in products:
+            fresh._add(doc_id, metadata)
+        with self._lock:
+            self._postings, self._doc_terms = fresh._postings, fresh._doc_terms
+            self._doc_lengths, self._total_length = fresh._doc_lengths, fresh._total_length
+            self._codes, self._metadata = fresh._codes, fresh._metadata
+
+    def metadata(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            metadata = self._metadata.get(doc_id)
+            return dict(metadata) if metadata is not None else None
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self._doc_terms)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _enough_evidence(self, terms: List[str]) -> bool:
+        """Two content words, or one rare one: a stray "s" from "what's" must not pick a product."""
+        content = {t for t in terms if len(t) >= self.min_term_length}
+        if len(content) >= 2:
+            return True
+        return len(content) == 1 and self._idf(next(iter(content))) >= self.min_decisive_idf
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """BM25 top-k as ``(doc_id, score)``, best first."""
+        terms = [t for t in tokenize(query) if t not in STOPWORDS]
+        with self._lock:
+            self.searches += 1
+            n = len(self._doc_terms)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            for term in set(terms):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = self._idf(term)
+                for doc_id, tf in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def decisive(self, query: str, hits: List[Tuple[str, float]]) -> List[str]:
+        """Doc ids that settle the query on their own, or ``[]`` when vector retrieval is still needed.
+
+        Decisive means the query names a model code, or every query word occurs in
+        the top hit, they include two content words or one rare one, and it leads
+        the runner-up by ``decisive_ratio``, or the query
+        spells out the top hit's full product name and it ranks first outright.
+        """
+        tokens = tokenize(query)
+        with self._lock:
+            exact = [doc_id for t in tokens if _is_code(t) for doc_id in sorted(self._codes.get(t, ()))]
+            if exact:
+                self.decisive_hits += 1
+                return list(dict.fromkeys(exact))
+            if not hits:
+                return []
+            terms = [t for t in tokens if t not in STOPWORDS]
+            top_id, top_score = hits[0]
+            runner_up = hits[1][1] if len(hits) > 1 else 0.0
+            top_terms = self._doc_terms.get(top_id, ())
+            if (terms and all(t in top_terms for t in terms) and self._enough_evidence(terms)
+                    and top_score >= self.decisive_ratio * runner_up):
+                self.decisive_hits += 1
+                return [top_id]
+            name_terms = set(tokenize(self._metadata.get(top_id, {}).get("name", "")))
+            if name_terms and name_terms <= set(tokens) and top_score > runner_up:
+                self.decisive_hits += 1
+                return [top_id]
+        return []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._doc_terms),
+                "terms": len(self._postings),
+                "searches": self.searches,
+                "decisive_hits": self.decisive_hits,
+            }
@@ -0,0 +1,280 @@
+"""Per-stage latency spans, served as Prometheus histograms and ``Server-Timing`` headers.
+
+``Metrics.span(stage)`` (or the ``timed`` decorator) measures one stage with
+``perf_counter``, adds it to a fixed-bucket histogram and, inside a request,
+to that request's span list. ``ServerTimingMiddleware`` opens the span list
+per request under a request ID (``X-Request-ID``, echoed back), records the
+request duration per route and writes the spans into a ``Server-Timing``
+header; ``Metrics.render`` is the ``/metrics`` body. A span costs about a
+microsecond, so it stays on in production.
+
+Streaming responses send their headers before the body is generated, so their
+``Server-Timing`` only covers the stages that ran first; ``/metrics`` has all.
+"""
+import asyncio
+import functools
+import inspect
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Upper bounds in seconds: sub-millisecond lookups up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+INF_BOUND = 'le="+Inf"'
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Spans of the request being served: a list shared with threads started via asyncio.to_thread
+_REQUEST_SPANS: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+_REQUEST_ID: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    """ID of the request being served (from ``X-Request-ID`` or generated), for log correlation."""
+    return _REQUEST_ID.get()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    def __init__(self, namespace: str = "app", buckets: Iterable[float] = DEFAULT_BUCKETS, enabled: bool = True):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._help: Dict[str, str] = {
+            "stage_seconds": "Latency of one pipeline stage",
+            "request_seconds": "HTTP request latency by route",
+        }
+
+    def observe(self, name: str, seconds: float, labels: Tuple[Tuple[str, str], ...] = ()):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def record(self, stage: str, seconds: float):
+        """Add a measured stage to the histograms and to the current request's spans."""
+        if not self.enabled:
+            return
+        self.observe("stage_seconds", seconds, (("stage", stage),))
+        spans = _REQUEST_SPANS.get()
+        if spans is not None:
+            spans.append((stage, seconds))
+
+    def span(self, stage: str) -> "_Span":
+        """Context manager timing the enclosed block as ``stage``."""
+        return _Span(self, stage)
+
+    def timed(self, stage: str):
+        """Decorator form of ``span`` for sync and async functions."""
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await fn(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.record(stage, time.perf_counter() - start)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return fn(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        self.record(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def instrument(self, target, stages: Mapping[str, str]):
+        """Proxy for ``target`` whose listed methods are timed as the mapped stages.
+
+        A method returning a generator (e.g. Pinecone's paginated ``list``) is timed
+        until the generator is exhausted.
+        """
+        return _Instrumented(self, target, dict(stages))
+
+    def render(self) -> str:
+        """Prometheus text exposition of every histogram."""
+        with self._lock:
+            snapshot = [(name, labels, list(h.counts), h.total, h.count)
+                        for (name, labels), h in sorted(self._histograms.items())]
+        lines = []
+        described = set()
+        for name, labels, counts, total, count in snapshot:
+            metric = f"{self.namespace}_{name}"
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {metric} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                lines.append(f"{metric}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{metric}_bucket{_labels(labels, INF_BOUND)} {count}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Count and mean milliseconds per stage, for JSON stats endpoints."""
+        with self._lock:
+            return {
+                dict(labels).get("stage", name): {
+                    "count": h.count,
+                    "mean_ms": round(h.total / h.count * 1000, 3) if h.count else 0.0,
+                }
+                for (name, labels), h in sorted(self._histograms.items()) if name == "stage_seconds"
+            }
+
+
+class _Span:
+    # A plain class: @contextmanager costs a generator per span
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: Metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _Instrumented:
+    def __init__(self, metrics: Metrics, target, stages: Dict[str, str]):
+        self._metrics = metrics
+        self._target = target
+        self._stages = stages
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        stage = self._stages.get(name)
+        if stage is None or not callable(attribute):
+            return attribute
+        metrics = self._metrics
+
+        @functools.wraps(attribute)
+        def timed(*args, **kwargs):
+            if not metrics.enabled:
+                return attribute(*args, **kwargs)
+            start = time.perf_counter()
+            result = attribute(*args, **kwargs)
+            if inspect.isgenerator(result):
+                return _timed_generator(metrics, stage, result, start)
+            metrics.record(stage, time.perf_counter() - start)
+            return result
+        return timed
+
+
+def _timed_generator(metrics: Metrics, stage: str, generator, start: float):
+    try:
+        yield from generator
+    finally:
+        metrics.record(stage, time.perf_counter() - start)
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """``Server-Timing`` value: stages summed by name in first-seen order, then the total."""
+    durations: Dict[str, float] = {}
+    for stage, seconds in spans:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in durations.items())
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware: request ID, per-request span list, route latency histogram and ``Server-Timing`` header.
+
+    With a ``logger`` each finished request is logged once, with its spans, under its request ID.
+    """
+
+    def __init__(self, app, metrics: Metrics, logger=None):
+        self.app = app
+        self.metrics = metrics
+        self.logger = logger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        id_token = _REQUEST_ID.set(request_id)
+        spans: List[Tuple[str, float]] = []
+        spans_token = _REQUEST_SPANS.set(spans)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                if self.metrics.enabled:
+                    headers.append((b"server-timing", server_timing(spans, time.perf_counter() - start).encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            # Route templates, not raw paths, keep the label set bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if self.metrics.enabled:
+                self.metrics.observe("request_seconds", elapsed, (
+                    ("method", scope["method"]),
+                    ("route", route),
+                    ("status", str(status[0])),
+                ))
+            if self.logger is not None:
+                durations: Dict[str, float] = {}
+                for stage, seconds in spans:
+                    durations[stage] = round(durations.get(stage, 0.0) + seconds * 1000, 3)
+                self.logger.info("request", method=scope["method"], route=route, status=status[0],
+                                 duration_ms=round(elapsed * 1000, 3), spans=durations)
+            _REQUEST_SPANS.reset(spans_token)
+            _REQUEST_ID.reset(id_token)
@@ -0,0 +1,131 @@
+"""Complexity-based routing between a small and a large chat model.
+
+Each turn gets a score in [0, 1] from a few cheap features, each scaled to
+[0, 1] and weighted:
+
+- ``length``: words in the question (saturates at ``long_query_words``)
+- ``products``: retrieved products beyond the first (saturates at ``many_products``)
+- ``comparison``: comparison cues ("compare", "vs", "which is better", ...)
+- ``negotiation``: price negotiation and budget cues ("deal", "cheaper", ...)
+- ``reasoning``: open-ended advice cues ("recommend", "should I", "why", ...)
+- ``history``: earlier customer turns (saturates at ``deep_history_turns``)
+
+Turns scoring below ``threshold`` go to the small model, the rest to the
+large one. Every decision and its LLM latency are kept per route and per
+score decile, so the threshold and weights can be tuned from ``stats()``.
+"""
+import re
+import threading
+from collections import Counter, deque
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+SMALL = "small"
+LARGE = "large"
+
+DEFAULT_WEIGHTS = {
+    "length": 0.25,
+    "products": 0.2,
+    "comparison": 0.5,
+    "negotiation": 0.35,
+    "reasoning": 0.2,
+    "history": 0.2,
+}
+
+_COMPARISON = re.compile(
+    r"\b(compare|comparison|compared|vs|versus|difference|differences|which is better|better than|"
+    r"pros and cons|trade-?offs?|or the)\b|ஒப்பிடு|வித்தியாசம்",
+    re.IGNORECASE,
+)
+_NEGOTIATION = re.compile(
+    r"\b(deal|deals|negotiate|bargain|cheaper|lower price|best price|offer|bundle|combo|budget|afford|"
+    r"exchange|emi)\b|பேரம்|மலிவான",
+    re.IGNORECASE,
+)
+_REASONING = re.compile(
+    r"\b(why|explain|recommend|suggest|should i|worth|good for|suitable|alternative|alternatives)\b|பரிந்துரை",
+    re.IGNORECASE,
+)
+_CUSTOMER_TURN = re.compile(r"^Customer:", re.MULTILINE)
+
+
+class ComplexityRouter:
+    def __init__(self, threshold: float = 0.5, weights: Optional[Dict[str, float]] = None, enabled: bool = True,
+                 long_query_words: int = 40, many_products: int = 4, deep_history_turns: int = 6,
+                 latency_window: int = 500):
+        """``enabled`` False sends every turn to the large model (scores are still recorded)."""
+        self.threshold = threshold
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.enabled = enabled
+        self.long_query_words = long_query_words
+        self.many_products = many_products
+        self.deep_history_turns = deep_history_turns
+        self._lock = threading.Lock()
+        self.routes: Counter = Counter()
+        self._latencies = {SMALL: deque(maxlen=latency_window), LARGE: deque(maxlen=latency_window)}
+        # Decisions and summed latency per (route, score decile), to see where a threshold would cut
+        self._deciles: Counter = Counter()
+        self._decile_seconds: Counter = Counter()
+
+    def features(self, question: str, history: str = "", products: int = 0) -> Dict[str, float]:
+        return {
+            "length": min(len(question.split()) / self.long_query_words, 1.0),
+            "products": min(max(products - 1, 0) / max(self.many_products - 1, 1), 1.0),
+            "comparison": 1.0 if _COMPARISON.search(question) else 0.0,
+            "negotiation": 1.0 if _NEGOTIATION.search(question) else 0.0,
+            "reasoning": 1.0 if _REASONING.search(question) else 0.0,
+            "history": min(len(_CUSTOMER_TURN.findall(history or "")) / self.deep_history_turns, 1.0),
+        }
+
+    def score(self, features: Dict[str, float]) -> float:
+        return min(sum(self.weights.get(name, 0.0) * value for name, value in features.items()), 1.0)
+
+    def choose(self, question: str, history: str = "", products: int = 0) -> Tuple[str, float, Dict[str, float]]:
+        """``(route, score, features)`` for one turn."""
+        features = self.features(question, history, products)
+        score = self.score(features)
+        route = SMALL if self.enabled and score < self.threshold else LARGE
+        with self._lock:
+            self.routes[route] += 1
+        return route, score, features
+
+    def observe(self, route: str, score: float, seconds: float):
+        """Record the LLM latency of a routed turn."""
+        decile = min(int(score * 10), 9)
+        with self._lock:
+            self._latencies[route].append(seconds)
+            self._deciles[(route, decile)] += 1
+            self._decile_seconds[(route, decile)] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = {route: list(samples) for route, samples in self._latencies.items()}
+            routes = dict(self.routes)
+            deciles = sorted(self._deciles.items())
+            decile_seconds = dict(self._decile_seconds)
+        total = sum(routes.values())
+        per_route = {}
+        for route in (SMALL, LARGE):
+            samples = latencies[route]
+            per_route[route] = {
+                "decisions": routes.get(route, 0),
+                "share": round(routes.get(route, 0) / total, 4) if total else 0.0,
+                "p50_ms": round(float(np.percentile(samples, 50)) * 1000, 1) if samples else None,
+                "p95_ms": round(float(np.percentile(samples, 95)) * 1000, 1) if samples else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "weights": dict(self.weights),
+            "routes": per_route,
+            "score_deciles": [
+                {
+                    "route": route,
+                    "score": f"{decile / 10:.1f}-{(decile + 1) / 10:.1f}",
+                    "count": count,
+                    "mean_ms": round(decile_seconds[(route, decile)] / count * 1000, 1),
+                }
+                for (route, decile), count in deciles
+            ],
+        }
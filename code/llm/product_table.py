@@ -0,0 +1,321 @@
+"""Local columnar product table for filtered, sorted and paginated listings.
+
+Numeric columns (price, sale price, stock, rating) live in NumPy arrays and brand and
+category are dictionary-encoded into int32 codes, so filters are vectorized
+masks. One row order per sort field is built on first use and kept until the
+next write; sorted pages, keyset cursors and price ranges on a price sort are
+``searchsorted`` slices of it rather than a sort per request. Deleted rows are
+tombstoned and compacted once they make up half the table.
+
+Pagination is keyset-based: the cursor encodes the sort value and the stable
+sequence number of the last row returned, so pages stay consistent while the
+catalog changes underneath.
+"""
+import base64
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+SORT_FIELDS = ("price", "rating", "stock")
+# Columns a price range can apply to; ``sale_price`` mirrors ``price`` unless a sale price field is configured
+PRICE_COLUMNS = ("price", "sale_price")
+
+
+class _Dictionary:
+    """String <-> int32 code mapping for a categorical column."""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+def encode_cursor(value: float, seq: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, seq]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        value, seq = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(value), int(seq)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ProductTable:
+    def __init__(self, price_field: str = "price", stock_field: str = "stock", rating_field: str = "rating",
+                 brand_field: str = "brand", category_field: str = "category", initial_capacity: int = 1024,
+                 sale_price_field: Optional[str] = None):
+        self.fields = {
+            "price": price_field,
+            "stock": stock_field,
+            "rating": rating_field,
+            "brand": brand_field,
+            "category": category_field,
+        }
+        if sale_price_field is not None:
+            self.fields["sale_price"] = sale_price_field
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self._journal: Optional[list] = None
+        self.ready = False
+        self._reset()
+
+    def _reset(self, capacity: Optional[int] = None):
+        capacity = capacity or self._initial_capacity
+        self._size = 0
+        self._live = 0
+        self._next_seq = 0
+        self._ids: List[Optional[str]] = []
+        self._records: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._brands = _Dictionary()
+        self._categories = _Dictionary()
+        self._columns = {
+            "price": np.zeros(capacity, dtype=np.float64),
+            "sale_price": np.zeros(capacity, dtype=np.float64),
+            "stock": np.zeros(capacity, dtype=np.float64),
+            "rating": np.full(capacity, np.nan, dtype=np.float64),
+            "brand": np.zeros(capacity, dtype=np.int32),
+            "category": np.zeros(capacity, dtype=np.int32),
+            "seq": np.zeros(capacity, dtype=np.int64),
+            "alive": np.zeros(capacity, dtype=bool),
+        }
+        # field -> (rows, keys, seqs), ascending by (key, seq)
+        self._sort_orders: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self._live
+
+    # ------------------------------------------------------------------ writes
+
+    def _grow(self):
+        capacity = len(self._columns["seq"]) * 2
+        for name, column in self._columns.items():
+            grown = np.full(capacity, np.nan, dtype=column.dtype) if name == "rating" else np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    @staticmethod
+    def _number(value, default=np.nan) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return default
+
+    def _write_row(self, row: int, product_id: str, record: Dict[str, Any]):
+        fields, columns = self.fields, self._columns
+        columns["price"][row] = self._number(record.get(fields["price"]), 0.0)
+        columns["sale_price"][row] = self._number(record.get(fields.get("sale_price", fields["price"])), 0.0)
+        columns["stock"][row] = self._number(record.get(fields["stock"]), 0.0)
+        columns["rating"][row] = self._number(record.get(fields["rating"]))
+        columns["brand"][row] = self._brands.encode(str(record.get(fields["brand"], "")))
+        columns["category"][row] = self._categories.encode(str(record.get(fields["category"], "")))
+        columns["alive"][row] = True
+        self._records[row] = dict(record)
+        self._ids[row] = product_id
+
+    def _upsert(self, product_id: str, record: Dict[str, Any]):
+        row = self._id_to_row.get(product_id)
+        if row is None:
+            if self._size == len(self._columns["seq"]):
+                self._grow()
+            row = self._size
+            self._size += 1
+            self._live += 1
+            self._ids.append(product_id)
+            self._records.append(None)
+            self._columns["seq"][row] = self._next_seq
+            self._next_seq += 1
+            self._id_to_row[product_id] = row
+        self._write_row(row, product_id, record)
+
+    def _remove(self, product_id: str):
+        row = self._id_to_row.pop(product_id, None)
+        if row is None:
+            return
+        self._columns["alive"][row] = False
+        self._records[row] = None
+        self._ids[row] = None
+        self._live -= 1
+
+    def _changed(self):
+        self._sort_orders = {}
+        if self._size > self._initial_capacity and self._live * 2 < self._size:
+            self._compact()
+
+    def _compact(self):
+        live = [(self._ids[r], self._records[r], int(self._columns["seq"][r]))
+                for r in range(self._size) if self._columns["alive"][r]]
+        next_seq = self._next_seq
+        self._reset(max(self._initial_capacity, len(live) * 2))
+        for product_id, record, seq in live:
+            self._upsert(product_id, record)
+            self._columns["seq"][self._id_to_row[product_id]] = seq
+        self._next_seq = next_seq
+
+    def upsert(self, product_id: str, record: Dict[str, Any]):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((product_id, record))
+            self._upsert(product_id, record)
+            self._changed()
+
+    def remove(self, product_id: str):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((product_id, None))
+            self._remove(product_id)
+            self._changed()
+
+    def begin_rebuild(self):
+        """Start recording mutations so a rebuild from a slow scan can replay them."""
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+
+    def cancel_rebuild(self):
+        """Stop recording after a scan that failed before ``rebuild``; the current rows stay."""
+        with self._lock:
+            self._journal = None
+
+    def rebuild(self, products: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Replace the table with ``(product_id, record)`` pairs from a full scan."""
+        self.begin_rebuild()
+        fresh = ProductTable(initial_capacity=self._initial_capacity, **{
+            f"{name}_field": field for name, field in self.fields.items()
+        })
+        try:
+            for product_id, record in products:
+                fresh._upsert(product_id, record)
+        finally:
+            with self._lock:
+                journal, self._journal = self._journal, None
+        with self._lock:
+            for product_id, record in journal:
+                if record is None:
+                    fresh._remove(product_id)
+                else:
+                    fresh._upsert(product_id, record)
+            self.__dict__.update({k: v for k, v in fresh.__dict__.items() if k not in ("_lock", "_journal", "ready")})
+            self._changed()
+            self.ready = True
+
+    # ------------------------------------------------------------------- reads
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._id_to_row.get(product_id)
+            return dict(self._records[row]) if row is not None else None
+
+    def values(self, field: str) -> List[str]:
+        """Distinct values seen so far in the ``brand`` or ``category`` column."""
+        with self._lock:
+            return list((self._brands if field == "brand" else self._categories).values)
+
+    def _sort_key(self, field: str) -> np.ndarray:
+        if field == "seq":
+            return self._columns["seq"][:self._size].astype(np.float64)
+        values = self._columns[field][:self._size]
+        # Missing ratings rank below every real value
+        return np.where(np.isnan(values), -np.inf, values) if field == "rating" else values
+
+    def _sort_order(self, field: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Every row (tombstones included) ascending by ``(key, seq)``, cached until the next write."""
+        cached = self._sort_orders.get(field)
+        if cached is None:
+            keys = self._sort_key(field)
+            seqs = self._columns["seq"][:self._size]
+            # Rows are appended in seq order and compaction keeps it, so seq order is row order
+            rows = np.arange(self._size) if field == "seq" else np.lexsort((seqs, keys))
+            cached = self._sort_orders[field] = (rows, keys[rows], seqs[rows])
+        return cached
+
+    @staticmethod
+    def _position(keys: np.ndarray, seqs: np.ndarray, value: float, seq: int, side: str) -> int:
+        """Insertion point of ``(value, seq)`` in arrays sorted by ``(key, seq)``."""
+        lo = int(np.searchsorted(keys, value, side="left"))
+        hi = int(np.searchsorted(keys, value, side="right"))
+        return lo + int(np.searchsorted(seqs[lo:hi], seq, side=side))
+
+    def query(
+        self,
+        brand: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort_by: Optional[str] = None,
+        order: str = "asc",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        price_column: str = "price",
+    ) -> Dict[str, Any]:
+        """Filter, sort and page the table; returns ``products``, ``total`` and ``next_cursor``.
+
+        ``min_price``/``max_price`` apply to ``price_column`` (``price`` or ``sale_price``).
+        """
+        if sort_by is not None and sort_by not in SORT_FIELDS + ("sale_price",):
+            raise ValueError(f"sort_by must be one of {', '.join(SORT_FIELDS)}")
+        if price_column not in PRICE_COLUMNS:
+            raise ValueError(f"price_column must be one of {', '.join(PRICE_COLUMNS)}")
+        descending = order.lower() == "desc"
+        with self._lock:
+            columns = self._columns
+            size = self._size
+            mask = columns["alive"][:size].copy()
+            if brand:
+                code = self._brands.codes.get(brand)
+                mask &= (columns["brand"][:size] == code) if code is not None else False
+            if category:
+                code = self._categories.codes.get(category)
+                mask &= (columns["category"][:size] == code) if code is not None else False
+            field = sort_by or "seq"
+            if field != price_column:
+                prices = columns[price_column][:size]
+                if min_price is not None:
+                    mask &= prices >= min_price
+                if max_price is not None:
+                    mask &= prices <= max_price
+
+            order, keys, seqs = self._sort_order(field)
+            # Window of the ascending order that can hold results: a price range on a price sort is a slice
+            lo, hi = 0, size
+            if field == price_column:
+                if min_price is not None:
+                    lo = int(np.searchsorted(keys, min_price, side="left"))
+                if max_price is not None:
+                    hi = int(np.searchsorted(keys, max_price, side="right"))
+            total = int(np.count_nonzero(mask[order[lo:hi]])) if field == price_column else int(np.count_nonzero(mask))
+            if cursor:
+                value, seq = decode_cursor(cursor)
+                if descending:
+                    hi = min(hi, self._position(keys, seqs, value, seq, "left"))
+                else:
+                    lo = max(lo, self._position(keys, seqs, value, seq, "right"))
+            window = order[lo:hi]
+            if descending:
+                window = window[::-1]
+            # One row past the page tells whether there is a next one
+            hits = np.flatnonzero(mask[window])[:max(0, limit) + 1]
+            positions = (hi - 1 - hits) if descending else (lo + hits)
+            rows, keys, seqs = order[positions], keys[positions], seqs[positions]
+
+            page = rows[:max(0, limit)]
+            products = []
+            for row in page:
+                product = dict(self._records[row])
+                product["id"] = self._ids[row]
+                products.append(product)
+            next_cursor = None
+            if rows.size > page.size and page.size:
+                next_cursor = encode_cursor(float(keys[page.size - 1]), int(seqs[page.size - 1]))
+            return {"products": products, "count": len(products), "total": total, "next_cursor": next_cursor}
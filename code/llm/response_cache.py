@@ -0,0 +1,156 @@
+"""Two-tier cache for full assistant responses.
+
+Exact tier: keyed on the normalized query, language, a fingerprint of the chat
+history and the set of retrieved product IDs.
+Semantic tier: reuses an answer whose query embedding is within a cosine
+threshold of the new query, for the same language and history fingerprint.
+Entries expire after a TTL and are evicted least-recently-used beyond ``max_entries``.
+"""
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w\s-]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def history_fingerprint(formatted_history: str) -> str:
+    return hashlib.sha1(formatted_history.encode("utf-8")).hexdigest() if formatted_history else ""
+
+
+class _Entry:
+    __slots__ = ("key", "scope", "vector", "response", "expires_at")
+
+    def __init__(self, key, scope, vector, response, expires_at):
+        self.key = key
+        self.scope = scope
+        self.vector = vector
+        self.response = response
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Stacked vectors for the semantic tier, rebuilt lazily after writes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_entries: List[_Entry] = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(query: str, language: str, formatted_history: str, product_ids: Iterable[str]) -> tuple:
+        return (normalize_query(query), language.lower(), history_fingerprint(formatted_history),
+                tuple(sorted(set(product_ids))))
+
+    @staticmethod
+    def _scope(key: tuple) -> tuple:
+        # Semantic matches are only allowed within the same language and history
+        return key[1], key[2]
+
+    def _expire(self, now: float):
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for k in expired:
+            del self._entries[k]
+        if expired:
+            self._matrix = None
+
+    def get_exact(self, key: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return copy.deepcopy(entry.response)
+
+    def get_similar(self, language: str, formatted_history: str, vector) -> Optional[Dict[str, Any]]:
+        """Return the cached answer closest to ``vector`` if it clears the similarity threshold."""
+        if vector is None:
+            return None
+        scope = (language.lower(), history_fingerprint(formatted_history))
+        with self._lock:
+            self._expire(time.monotonic())
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._matrix_entries = [e for e in self._entries.values() if e.vector is not None]
+                self._matrix = (np.stack([e.vector for e in self._matrix_entries])
+                                if self._matrix_entries else np.zeros((0, 0), dtype=np.float32))
+            if not self._matrix_entries:
+                return None
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = self._matrix @ query
+            for row in np.argsort(-scores):
+                if scores[row] < self.similarity_threshold:
+                    break
+                entry = self._matrix_entries[row]
+                if entry.scope == scope and entry.key in self._entries:
+                    self._entries.move_to_end(entry.key)
+                    self.semantic_hits += 1
+                    return copy.deepcopy(entry.response)
+            return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: tuple, response: Dict[str, Any], vector=None):
+        if not self.enabled:
+            return
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        entry = _Entry(key, self._scope(key), vector, copy.deepcopy(response), time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        """Drop every entry, e.g. when the catalog changes."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_entries = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "similarity_threshold": self.similarity_threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
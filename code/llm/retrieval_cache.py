@@ -0,0 +1,122 @@
+"""Cache of vector retrieval results keyed on an LSH signature of the query embedding.
+
+The signature is the sign pattern of the embedding against ``bits`` fixed
+random hyperplanes, so the same query (or a near-identical one) maps to the
+same key even when the LLM answer itself is not cacheable. Entries hold the
+top-k product IDs and scores plus the catalog version they were computed at;
+any catalog write bumps the version and makes every older entry a miss.
+Eviction is least-recently-used (``lru``) or least-frequently-used (``lfu``)
+beyond ``max_entries``, with a TTL on top.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+POLICIES = ("lru", "lfu")
+
+
+class _Entry:
+    __slots__ = ("results", "version", "expires_at", "hits")
+
+    def __init__(self, results, version, expires_at):
+        self.results = results
+        self.version = version
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class RetrievalCache:
+    def __init__(self, version, max_entries: int = 2048, ttl_seconds: float = 3600, bits: int = 64,
+                 policy: str = "lru", seed: int = 13):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.bits = bits
+        self.policy = policy
+        self._rng = np.random.default_rng(seed)
+        self._planes: Optional[np.ndarray] = None
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def signature(self, vector) -> bytes:
+        vector = np.asarray(vector, dtype=np.float32)
+        if self._planes is None or self._planes.shape[1] != vector.shape[0]:
+            with self._lock:
+                if self._planes is None or self._planes.shape[1] != vector.shape[0]:
+                    self._planes = self._rng.standard_normal((self.bits, vector.shape[0])).astype(np.float32)
+                    self._entries.clear()
+        return np.packbits(self._planes @ vector > 0).tobytes()
+
+    def make_key(self, vector, k: int, filter: Optional[Dict[str, Any]] = None) -> tuple:
+        return self.signature(vector), k, json.dumps(filter, sort_keys=True, default=str) if filter else ""
+
+    def get(self, key: tuple) -> Optional[List[Tuple[str, float]]]:
+        """Cached ``(product_id, score)`` list, or None on a miss or a stale catalog version."""
+        if not self.enabled:
+            return None
+        version = self.version.current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.version != version or entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            entry.hits += 1
+            if self.policy == "lru":
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry.results)
+
+    def put(self, key: tuple, results: List[Tuple[str, float]], version: int):
+        """Store results computed while the catalog was at ``version`` (read before searching)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = _Entry(tuple(results), version, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                if self.policy == "lru":
+                    self._entries.popitem(last=False)
+                else:
+                    # Newest entry is exempt so a fresh key is not evicted before it can earn hits
+                    victim = min(list(self._entries.items())[:-1], key=lambda item: item[1].hits)[0]
+                    del self._entries[victim]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "policy": self.policy,
+                "bits": self.bits,
+                "catalog_version": self.version.current(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
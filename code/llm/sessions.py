@@ -0,0 +1,192 @@
+"""Server-side conversation sessions for delta chat requests.
+
+With a ``conversation_id``, clients send only the new user turn; the session
+keeps the message list and the formatted history for the prompt. Sessions are
+evicted least-recently-used beyond ``max_sessions`` or ``max_bytes`` and expire
+after ``ttl_seconds`` of inactivity. An optional JSON file persists them across
+restarts.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class Session:
+    __slots__ = ("conversation_id", "messages", "formatted_history", "formatted_count", "nbytes", "last_used")
+
+    def __init__(self, conversation_id: str, messages: Optional[List[Dict[str, str]]] = None):
+        self.conversation_id = conversation_id
+        self.messages: List[Dict[str, str]] = []
+        self.formatted_history = ""
+        # Number of messages formatted_history was rendered from
+        self.formatted_count = 0
+        self.nbytes = 0
+        self.last_used = time.time()
+        for message in messages or []:
+            self._append(message["role"], message["content"])
+
+    def _append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        self.nbytes += len(role) + len(content.encode("utf-8"))
+
+    def _trim(self, max_messages: int):
+        while len(self.messages) > max_messages:
+            dropped = self.messages.pop(0)
+            self.nbytes -= len(dropped["role"]) + len(dropped["content"].encode("utf-8"))
+            self.formatted_count = -1
+
+    @property
+    def total_bytes(self) -> int:
+        return self.nbytes + len(self.formatted_history.encode("utf-8"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"conversation_id": self.conversation_id, "messages": self.messages, "last_used": self.last_used}
+
+
+class SessionStore:
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 6 * 3600,
+        max_messages: int = 200,
+        path: Optional[str] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.path = path
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.expirations = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    # ---------------------------------------------------------------- internals
+
+    def _drop(self, conversation_id: str):
+        session = self._sessions.pop(conversation_id, None)
+        if session is not None:
+            self._bytes -= session.total_bytes
+
+    def _enforce_limits(self):
+        now = time.time()
+        # Sessions are in last-used order, so expired ones are at the front
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used <= self.ttl_seconds:
+                break
+            self._drop(oldest.conversation_id)
+            self.expirations += 1
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _touch(self, session: Session):
+        session.last_used = time.time()
+        self._sessions.move_to_end(session.conversation_id)
+
+    # ------------------------------------------------------------------- public
+
+    def get(self, conversation_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None and time.time() - session.last_used > self.ttl_seconds:
+                self._drop(conversation_id)
+                self.expirations += 1
+                return None
+            return session
+
+    def reset(self, conversation_id: str, messages: List[Dict[str, str]]) -> Session:
+        """Replace a session's messages, e.g. when a client seeds it with its full history."""
+        with self._lock:
+            self._drop(conversation_id)
+            session = Session(conversation_id, messages)
+            session._trim(self.max_messages)
+            self._sessions[conversation_id] = session
+            self._bytes += session.total_bytes
+            self._enforce_limits()
+            return session
+
+    def append(self, conversation_id: str, role: str, content: str) -> Session:
+        with self._lock:
+            session = self.get(conversation_id)
+            if session is None:
+                session = Session(conversation_id)
+                self._sessions[conversation_id] = session
+            before = session.total_bytes
+            session._append(role, content)
+            session._trim(self.max_messages)
+            self._bytes += session.total_bytes - before
+            self._touch(session)
+            self._enforce_limits()
+            return session
+
+    def formatted_history(self, session: Session, formatter) -> str:
+        """Formatted history for the session, re-rendered only when messages were added."""
+        with self._lock:
+            if session.formatted_count != len(session.messages):
+                before = session.total_bytes
+                session.formatted_history = formatter(list(session.messages))
+                session.formatted_count = len(session.messages)
+                if session.conversation_id in self._sessions:
+                    self._bytes += session.total_bytes - before
+            return session.formatted_history
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            existed = conversation_id in self._sessions
+            self._drop(conversation_id)
+            return existed
+
+    def session_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self.get(conversation_id)
+            if session is None:
+                return None
+            return {
+                "conversation_id": conversation_id,
+                "messages": len(session.messages),
+                "bytes": session.total_bytes,
+                "idle_seconds": round(time.time() - session.last_used, 3),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "largest_session_bytes": max((s.total_bytes for s in self._sessions.values()), default=0),
+            }
+
+    # -------------------------------------------------------------- persistence
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = [session.to_dict() for session in self._sessions.values()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            payload = json.load(f)
+        with self._lock:
+            for item in sorted(payload, key=lambda s: s.get("last_used", 0)):
+                session = self.reset(item["conversation_id"], item.get("messages", []))
+                session.last_used = item.get("last_used", time.time())
+            self._enforce_limits()
@@ -0,0 +1,100 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+The first caller for a key runs the work; callers arriving with the same key
+while it is in flight wait for that result instead of repeating it. Nothing
+is cached: the key is forgotten as soon as the call finishes, so later
+callers run fresh. Keys should include whatever makes a result stale (e.g.
+the catalog version) so a caller never joins a call that started before a
+write it has already observed.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self, name: str = "", copy: Optional[Callable[[Any], Any]] = None, enabled: bool = True):
+        """``copy`` is applied to the result handed to each joining caller, for results they may mutate."""
+        self.name = name
+        self.copy = copy
+        self.enabled = enabled
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _shared(self, result):
+        return self.copy(result) if self.copy is not None else result
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``fn()``, or the in-flight call with the same key."""
+        if not self.enabled:
+            return await fn()
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # Shielded so a disconnecting follower does not cancel the shared call
+            return self._shared(await asyncio.shield(task))
+        task = asyncio.ensure_future(fn())
+        self._tasks[key] = task
+        self.executions += 1
+        task.add_done_callback(lambda task, key=key: self._finished(key, task))
+        # Shielded too: if the first caller goes away, joined callers still get the result
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def do_sync(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Thread-based variant for synchronous callers."""
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._shared(call.result)
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.executions + self.coalesced
+        return {
+            "in_flight": len(self._tasks) + len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "saved_ratio": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,75 @@
+"""Phase tracking for service startup, backing the /readyz probe and timing report."""
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class StartupTracker:
+    def __init__(self, phases: Iterable[str]):
+        self._phases: "OrderedDict[str, Dict[str, Any]]" = OrderedDict(
+            (name, {"status": PENDING, "seconds": None}) for name in phases
+        )
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.started = False
+        self.started_at = None
+
+    def begin(self):
+        self.started = True
+        self.started_at = time.time()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase; failures are recorded and re-raised."""
+        start_time = time.time()
+        with self._lock:
+            self._phases.setdefault(name, {})
+            # A retried phase starts clean: no error left over from the failed attempt
+            self._phases[name].pop("error", None)
+            self._phases[name].update(status=RUNNING, seconds=None)
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self._phases[name].update(status=FAILED, seconds=round(time.time() - start_time, 3), error=str(e))
+            print(f"Startup phase '{name}' failed: {str(e)}")
+            traceback.print_exc()
+            raise
+        with self._lock:
+            self._phases[name].update(status=DONE, seconds=round(time.time() - start_time, 3))
+        print(f"Startup phase '{name}' completed in {time.time() - start_time:.2f} seconds")
+
+    def skip(self, name: str):
+        with self._lock:
+            self._phases.setdefault(name, {})
+            self._phases[name].update(status=SKIPPED, seconds=0.0)
+
+    def mark_ready(self):
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None) -> bool:
+        return self._ready.wait(timeout)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = {name: dict(info) for name, info in self._phases.items()}
+        return {
+            "ready": self.ready,
+            # Ready, but a phase it could do without (such as warmup) failed
+            "degraded": self.ready and any(info.get("status") == FAILED for info in phases.values()),
+            "uptime_seconds": round(time.time() - self.started_at, 3) if self.started_at else None,
+            "phases": phases,
+        }
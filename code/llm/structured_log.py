@@ -0,0 +1,187 @@
+"""Structured JSON-lines logging off the request path.
+
+``StructuredLogger.info(event, **fields)`` builds a small dict and appends it
+to a bounded deque the writer never holds a lock on; a background thread wakes
+every ``flush_interval`` seconds and serializes and writes records in
+batches, so a request never waits on stdout. Records below ``level`` are
+ignored, ``debug``/``info`` records are sampled per request (every record of
+a sampled request is kept, so traces stay whole), long string fields are
+truncated, and when the queue is full records are dropped and counted rather
+than blocking. Each record carries the request ID set by the metrics
+middleware, which also tags that request's spans.
+"""
+import atexit
+import json
+import random
+import sys
+import threading
+import time
+import traceback
+import zlib
+from collections import deque
+from typing import Any, Dict, Optional, TextIO
+
+from metrics import current_request_id
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+def truncate(value: Any, max_chars: int) -> Any:
+    if isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}...(+{len(value) - max_chars} chars)"
+    return value
+
+
+class StructuredLogger:
+    def __init__(self, name: str, level: str = "info", sample_rates: Optional[Dict[str, float]] = None,
+                 max_field_chars: int = 256, queue_size: int = 10000, stream: Optional[TextIO] = None,
+                 flush_interval: float = 0.05):
+        self.name = name
+        self.level = LEVELS[level.lower()]
+        self.sample_rates = {"debug": 1.0, "info": 1.0, **(sample_rates or {})}
+        self.max_field_chars = max_field_chars
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.stream = stream
+        # deque.append/popleft are atomic under the GIL, so producers never contend with the writer
+        self._records: deque = deque()
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.write_errors = 0
+        self._enqueue_seconds = 0.0
+        self._enqueue_max = 0.0
+        self._thread = threading.Thread(target=self._drain, name=f"{name}-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _sampled(self, level: str) -> bool:
+        rate = self.sample_rates.get(level, 1.0)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        request_id = current_request_id()
+        if not request_id:
+            return random.random() < rate
+        # Decide per request, not per record, so a kept request has all its records
+        return zlib.crc32(request_id.encode("ascii", "ignore")) < rate * 0xFFFFFFFF
+
+    def log(self, level: str, event: str, **fields):
+        if LEVELS[level] < self.level:
+            return
+        start = time.perf_counter()
+        if level in ("debug", "info") and not self._sampled(level):
+            with self._lock:
+                self.sampled_out += 1
+            return
+        record = {"ts": round(time.time(), 6), "level": level, "logger": self.name, "event": event}
+        request_id = current_request_id()
+        if request_id:
+            record["request_id"] = request_id
+        for key, value in fields.items():
+            record[key] = truncate(value, self.max_field_chars)
+        self._enqueue(record, start)
+
+    def _enqueue(self, record: Dict[str, Any], start: float):
+        """Append within ``queue_size``, or drop and count; ``start`` is when building the record began."""
+        dropped = len(self._records) >= self.queue_size
+        if not dropped:
+            self._records.append(record)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if dropped:
+                self.dropped += 1
+            else:
+                self.enqueued += 1
+            self._enqueue_seconds += elapsed
+            self._enqueue_max = max(self._enqueue_max, elapsed)
+
+    def debug(self, event: str, **fields):
+        self.log("debug", event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log("info", event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log("warning", event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log("error", event, **fields)
+
+    def exception(self, event: str, exc: Optional[BaseException] = None, **fields):
+        """Error record plus a second one with the traceback of ``exc`` (default: the one being handled), untruncated."""
+        self.log("error", event, **fields)
+        if LEVELS["error"] >= self.level:
+            start = time.perf_counter()
+            trace = "".join(traceback.format_exception(exc)) if exc is not None else traceback.format_exc()
+            # Bounded like every other record, so an error storm cannot grow the queue
+            self._enqueue({"ts": round(time.time(), 6), "level": "error", "logger": self.name,
+                           "event": f"{event}.traceback", "request_id": current_request_id(),
+                           "traceback": trace}, start)
+
+    def _write(self, records):
+        stream = self.stream or sys.stdout
+        try:
+            stream.write("".join(json.dumps(record, default=str, ensure_ascii=False) + "\n" for record in records))
+            stream.flush()
+            with self._lock:
+                self.written += len(records)
+        except Exception:
+            with self._lock:
+                self.write_errors += 1
+
+    def _drain(self):
+        while True:
+            closing = self._closing.wait(self.flush_interval)
+            batch, flushed = [], []
+            while self._records:
+                record = self._records.popleft()
+                if isinstance(record, threading.Event):
+                    # Everything before a flush marker must be written before it is released
+                    if batch:
+                        self._write(batch)
+                        batch = []
+                    flushed.append(record)
+                else:
+                    batch.append(record)
+            if batch:
+                self._write(batch)
+            for marker in flushed:
+                marker.set()
+            if closing:
+                return
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far has been written."""
+        if not self._thread.is_alive():
+            return False
+        marker = threading.Event()
+        self._records.append(marker)
+        return marker.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Write out queued records and stop the writer thread."""
+        if not self._thread.is_alive():
+            return
+        self._closing.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self.enqueued + self.dropped
+            return {
+                "level": next(name for name, value in LEVELS.items() if value == self.level),
+                "sample_rates": dict(self.sample_rates),
+                "queued": len(self._records),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "sampled_out": self.sampled_out,
+                "dropped": self.dropped,
+                "write_errors": self.write_errors,
+                "mean_enqueue_us": round(self._enqueue_seconds / calls * 1e6, 3) if calls else 0.0,
+                "max_enqueue_us": round(self._enqueue_max * 1e6, 3),
+            }
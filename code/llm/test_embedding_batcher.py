@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from embedding_batcher import BatchedEmbeddings
+
+
+class SlowEmbeddings(Embeddings):
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def embed_documents(self, texts):
+        self.started.set()
+        self.release.wait(5)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cancelled_waiter_does_not_stop_dispatcher():
+    inner = SlowEmbeddings()
+    batcher = BatchedEmbeddings(inner, max_batch_size=8, max_wait_ms=1)
+
+    async def scenario():
+        # Cancelled while its batch is being embedded
+        running = asyncio.ensure_future(batcher.aembed_query("first"))
+        await asyncio.to_thread(inner.started.wait, 5)
+        # Cancelled while still queued behind it
+        queued = asyncio.ensure_future(batcher.aembed_query("second"))
+        await asyncio.sleep(0.01)
+        running.cancel()
+        queued.cancel()
+        inner.release.set()
+        await asyncio.gather(running, queued, return_exceptions=True)
+        return await asyncio.wait_for(batcher.aembed_query("third"), 5)
+
+    try:
+        assert asyncio.run(scenario()) == [5.0]
+        assert batcher._thread.is_alive()
+    finally:
+        batcher.close()
+
+
+def test_failed_batch_does_not_stop_dispatcher():
+    class Flaky(Embeddings):
+        calls = 0
+
+        def embed_documents(self, texts):
+            Flaky.calls += 1
+            if Flaky.calls == 1:
+                raise RuntimeError("model unavailable")
+            return [[1.0] for _ in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    batcher = BatchedEmbeddings(Flaky(), max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError, match="model unavailable"):
+            batcher.embed_query("a")
+        assert batcher.embed_query("b") == [1.0]
+    finally:
+        batcher.close()
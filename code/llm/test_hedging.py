@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from hedging import (FALLBACK_BUDGET, FALLBACK_ERROR, FALLBACK_TIMEOUT, HEDGE, PRIMARY, DeadlineExceeded, HedgedLLM,
+                     reset_deadline, start_deadline)
+
+
+class FakeModel:
+    """Answers with its name after ``delays`` (one per call, the last one repeats), or fails."""
+
+    def __init__(self, name, delays=(0.0,), fail=False):
+        self.name = name
+        self.delays = list(delays)
+        self.fail = fail
+        self.calls = 0
+
+    def _delay(self):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        return delay
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self._delay())
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return self.name
+
+    async def astream(self, prompt):
+        await asyncio.sleep(self._delay())
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        for part in (self.name, "!"):
+            yield part
+
+    def invoke(self, prompt):
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        return self.name
+
+
+def hedged(primary, fallback=None, **kwargs):
+    options = dict(deadline=2.0, hedge_delay=0.05, min_primary_budget=0.5, fallback_reserve=0.5)
+    options.update(kwargs)
+    return HedgedLLM(primary, fallback, **options)
+
+
+def run(coro, budget=None):
+    async def scenario():
+        token = start_deadline(budget) if budget is not None else None
+        try:
+            return await coro
+        finally:
+            if token is not None:
+                reset_deadline(token)
+    return asyncio.run(scenario())
+
+
+def test_fast_primary_answers():
+    llm = hedged(FakeModel("primary"), FakeModel("fallback"))
+    assert run(llm.ainvoke("q")) == ("primary", PRIMARY)
+    assert llm.stats()["primary_samples"] == 1
+
+
+def test_slow_primary_is_hedged():
+    llm = hedged(FakeModel("primary", delays=(1.0, 0.0)), FakeModel("fallback"))
+    assert run(llm.ainvoke("q")) == ("primary", HEDGE)
+    assert llm.stats()["hedges_sent"] == 1
+
+
+def test_short_budget_goes_straight_to_the_fallback():
+    primary = FakeModel("primary")
+    llm = hedged(primary, FakeModel("fallback"))
+    assert run(llm.ainvoke("q"), budget=0.2) == ("fallback", FALLBACK_BUDGET)
+    assert primary.calls == 0
+
+
+def test_stalled_primary_falls_back_before_the_deadline():
+    llm = hedged(FakeModel("primary", delays=(5.0,)), FakeModel("fallback"), hedge=False)
+    assert run(llm.ainvoke("q"), budget=1.0) == ("fallback", FALLBACK_TIMEOUT)
+
+
+def test_error_fallback_only_answers_errors():
+    fast, large = FakeModel("fast"), FakeModel("large")
+    failing = hedged(FakeModel("small", fail=True), fast, error_fallback=large)
+    assert run(failing.ainvoke("q")) == ("large", FALLBACK_ERROR)
+    assert failing.invoke("q") == ("large", FALLBACK_ERROR)
+    stalled = hedged(FakeModel("small", delays=(5.0,)), fast, error_fallback=large, hedge=False)
+    assert run(stalled.ainvoke("q"), budget=1.0) == ("fast", FALLBACK_TIMEOUT)
+
+
+def test_no_fallback_raises_deadline_exceeded():
+    llm = hedged(FakeModel("primary", delays=(5.0,)), hedge=False)
+    with pytest.raises(DeadlineExceeded):
+        run(llm.ainvoke("q"), budget=0.3)
+    assert llm.stats()["deadline_exceeded"] == 1
+
+
+def test_slow_fallback_is_bounded_by_the_deadline():
+    llm = hedged(FakeModel("primary", fail=True), FakeModel("fallback", delays=(5.0,)))
+    with pytest.raises(DeadlineExceeded):
+        run(llm.ainvoke("q"), budget=0.6)
+
+
+def test_stream_keeps_the_winning_path():
+    async def collect(llm):
+        return [item async for item in llm.astream("q")]
+
+    llm = hedged(FakeModel("primary", fail=True), FakeModel("fallback"), hedge=False)
+    assert run(collect(llm)) == [("fallback", FALLBACK_ERROR), ("!", FALLBACK_ERROR)]
+    # Time to first chunk is tracked apart from complete calls
+    llm = hedged(FakeModel("primary"), FakeModel("fallback"))
+    assert run(collect(llm)) == [("primary", PRIMARY), ("!", PRIMARY)]
+    assert llm.stats()["stream_samples"] == 1 and llm.stats()["primary_samples"] == 0
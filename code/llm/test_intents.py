@@ -0,0 +1,79 @@
+import pytest
+
+from intents import LISTING, OPEN, PRICE, STOCK, IntentRouter
+from lexical import LexicalIndex
+from product_table import ProductTable
+
+PRODUCTS = [
+    {"product_id": "XPS-13", "name": "Dell XPS 13", "brand": "Dell", "model": "XPS-13", "category": "Laptop",
+     "description": "13 inch laptop", "mrp": 25999, "price": 22879, "discount": "12%", "stock": 4,
+     "warranty": "1 year"},
+    {"product_id": "MBP-M2", "name": "Apple MacBook Pro M2", "brand": "Apple", "model": "MBP-M2", "category": "Laptop",
+     "description": "M2 chip laptop", "mrp": 18000, "price": 17280, "discount": "4%", "stock": 0,
+     "warranty": "1 year"},
+    {"product_id": "X1C", "name": "Lenovo ThinkPad X1 Carbon", "brand": "Lenovo", "model": "X1C", "category": "Laptop",
+     "description": "business laptop", "mrp": 75000, "price": 69000, "discount": "8%", "stock": 2,
+     "warranty": "3 years"},
+    {"product_id": "S23U", "name": "Samsung Galaxy S23 Ultra", "brand": "Samsung", "model": "S23U",
+     "category": "Smartphone", "description": "200MP camera", "mrp": 85000, "price": 80749, "discount": "5%",
+     "stock": 7, "warranty": "1 year"},
+]
+
+
+@pytest.fixture
+def router():
+    lexical = LexicalIndex()
+    lexical.rebuild((p["product_id"], p) for p in PRODUCTS)
+    table = ProductTable(price_field="mrp", sale_price_field="price")
+    table.rebuild((p["product_id"], p) for p in PRODUCTS)
+    return IntentRouter(lexical, table)
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("how much is the Galaxy S23 Ultra", PRICE),
+    ("is the ThinkPad in stock", STOCK),
+    ("list Samsung phones", LISTING),
+    ("compare the XPS and the MacBook", OPEN),
+    ("what colours are available for this phone", OPEN),
+    ("tell me a joke", None),
+])
+def test_rule_intent(router, query, intent):
+    assert router.rule_intent(query) == intent
+
+
+def test_price_of_one_product(router):
+    response = router.route("how much is the Galaxy S23 Ultra", "english")
+    assert response["products"][0]["product_id"] == "S23U"
+    assert "₹80,749" in response["messages"][1]["text"]
+
+
+def test_out_of_stock_template(router):
+    response = router.route("is the MacBook Pro M2 in stock", "english")
+    assert response["messages"][1]["facialExpression"] == "sad"
+
+
+def test_listing_bounds_and_shows_the_sale_price(router):
+    # The MacBook's MRP is 18000 but it sells for 17280; the XPS sells for 22879
+    response = router.route("show me laptops under 20000", "english")
+    assert [p["product_id"] for p in response["products"]] == ["MBP-M2"]
+    assert "₹17,280" in response["messages"][1]["text"]
+
+
+def test_listing_sorts_by_sale_price(router):
+    response = router.route("list all laptops", "english")
+    assert [p["product_id"] for p in response["products"]] == ["MBP-M2", "XPS-13", "X1C"]
+
+
+@pytest.mark.parametrize("query", [
+    "show me a laptop for programming",
+    "show me a phone with a good camera",
+    "I have a budget of 30000, what laptop can I get with that price",
+    "what's the price of it?",
+])
+def test_open_questions_fall_through(router, query):
+    assert router.route(query, "english") is None
+
+
+def test_unsupported_language_falls_through(router):
+    assert router.route("list Samsung phones", "hindi") is None
+    assert router.stats()["fallthrough"] == {"language": 1}
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from json_stream import _repair, extract_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2,], }', {"a": [1, 2]}),
+    ('{"a": "cut off', {"a": "cut off"}),
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a":', {"a": None}),
+    # A cut-off key is dropped, and so is a truncated literal
+    ('{"a": 1, "ke', {"a": 1}),
+    ('{"a": 1, "b": tru', {"a": 1}),
+    ('{"a": {"b": 1},', {"a": {"b": 1}}),
+])
+def test_repair(text, expected):
+    assert json.loads(_repair(text, 0)) == expected
+
+
+def test_repair_starts_at_the_given_brace():
+    text = 'Here you go: {"a": "b",}'
+    assert json.loads(_repair(text, text.find("{"))) == {"a": "b"}
+
+
+def test_repair_rejects_mismatched_closers():
+    assert _repair('{"a": 1]', 0) is None
+
+
+def test_repair_keeps_well_formed_prefix():
+    # Only the first complete object is returned; trailing text is ignored
+    assert _repair('{"a": 1} trailing {"b"', 0) == '{"a": 1}'
+
+
+def test_extract_json_skips_fences_and_stray_braces():
+    assert extract_json('```json\n{"messages": [{"text": "hi",}]}\n```') == {"messages": [{"text": "hi"}]}
+    assert extract_json('Sure {not json} here: {"a": 1}') == {"a": 1}
+    assert extract_json("no json at all") is None
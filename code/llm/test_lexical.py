@@ -0,0 +1,45 @@
+from lexical import LexicalIndex
+
+PRODUCTS = [
+    ("p1", {"product_id": "p1", "brand": "Samsung", "name": "Samsung Galaxy Tab S9", "model": "TAB-S9-5G",
+            "category": "Tablet", "description": "120Hz AMOLED, S Pen included"}),
+    ("p2", {"product_id": "p2", "brand": "Samsung", "name": "Samsung Galaxy S23 Ultra", "model": "S23U-456",
+            "category": "Smartphone", "description": "200MP camera, 5000mAh battery"}),
+    ("p3", {"product_id": "p3", "brand": "Google", "name": "Google Pixel 8 Pro", "model": "GP8P-128",
+            "category": "Smartphone", "description": "Tensor G3, 50MP camera"}),
+    ("p4", {"product_id": "p4", "brand": "Lenovo", "name": "Lenovo ThinkPad X1 Carbon", "model": "X1C-G11",
+            "category": "Laptop", "description": "14 inch, 16GB RAM"}),
+    ("p5", {"product_id": "p5", "brand": "Sony", "name": "Sony WH-1000XM5", "model": "WH-1000XM5",
+            "category": "Headphones", "description": "Noise cancelling, 30 hour battery"}),
+]
+
+
+def make_index():
+    index = LexicalIndex()
+    index.rebuild(PRODUCTS)
+    return index
+
+
+def decisive(index, query):
+    return index.decisive(query, index.search(query))
+
+
+def test_single_letter_token_is_not_decisive():
+    # The "s" of "what's" matches "S Pen" in the Tab S9 description only
+    assert decisive(make_index(), "what's the price of it?") == []
+
+
+def test_model_code_is_decisive():
+    assert decisive(make_index(), "is TAB-S9-5G in stock") == ["p1"]
+
+
+def test_rare_word_is_decisive():
+    assert decisive(make_index(), "thinkpad price") == ["p4"]
+
+
+def test_full_product_name_is_decisive():
+    assert decisive(make_index(), "how much is the Galaxy S23 Ultra") == ["p2"]
+
+
+def test_shared_word_is_not_decisive():
+    assert decisive(make_index(), "camera") == []
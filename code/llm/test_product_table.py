@@ -0,0 +1,93 @@
+import pytest
+
+from product_table import ProductTable, decode_cursor
+
+
+def make_table(n=20, **kwargs):
+    table = ProductTable(initial_capacity=4, **kwargs)
+    # Prices repeat so pages have to break ties by insertion order
+    table.rebuild((f"p{i}", {"brand": "A" if i % 2 else "B", "category": "Phone", "price": (i % 5) * 100,
+                             "stock": i, "rating": None if i % 7 == 0 else i % 4})
+                  for i in range(n))
+    return table
+
+
+def page_through(table, cursor=None, **kwargs):
+    ids = []
+    while True:
+        page = table.query(limit=3, cursor=cursor, **kwargs)
+        ids.extend(p["id"] for p in page["products"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_cursor_pages_cover_the_sorted_listing_once(order):
+    table = make_table()
+    ids = page_through(table, sort_by="price", order=order)
+    expected = sorted(range(20), key=lambda i: ((i % 5) * 100, i), reverse=order == "desc")
+    assert ids == [f"p{i}" for i in expected]
+
+
+def test_cursor_survives_writes_between_pages():
+    table = make_table()
+    first = table.query(sort_by="price", limit=5)
+    seen = [p["id"] for p in first["products"]]
+    # A new cheapest product sorts before the cursor, a removed one after it
+    table.upsert("new", {"brand": "A", "category": "Phone", "price": 0, "stock": 1})
+    table.remove("p4")
+    rest = page_through(table, sort_by="price", cursor=first["next_cursor"])
+    assert "new" not in rest and "p4" not in rest
+    assert not set(seen) & set(rest)
+    assert len(seen) + len(rest) == 19
+
+
+def test_price_range_on_price_sort_counts_only_the_window():
+    table = make_table()
+    page = table.query(brand="A", min_price=100, max_price=300, sort_by="price", order="desc", limit=100)
+    prices = [p["price"] for p in page["products"]]
+    assert prices == sorted(prices, reverse=True)
+    assert all(100 <= p <= 300 for p in prices)
+    assert page["total"] == len(prices) == 6
+
+
+def test_missing_ratings_rank_last():
+    table = make_table()
+    ids = page_through(table, sort_by="rating", order="desc")
+    assert ids[-3:] == ["p14", "p7", "p0"]
+
+
+def test_compaction_keeps_rows_and_cursor_order():
+    table = make_table(n=40)
+    for i in range(0, 40, 4):
+        table.remove(f"p{i}")
+    for i in range(1, 40, 4):
+        table.remove(f"p{i}")
+    assert table._size == 40
+    # Over half the table tombstoned, past the initial capacity: compacted
+    table.remove("p2")
+    assert table._size == len(table) == 19
+    ids = page_through(table, sort_by="price")
+    expected = sorted((i for i in range(3, 40) if i % 4 > 1), key=lambda i: ((i % 5) * 100, i))
+    assert ids == [f"p{i}" for i in expected]
+    assert table.get("p3")["stock"] == 3 and table.get("p2") is None
+
+
+def test_sale_price_column_bounds_and_sorts():
+    table = ProductTable(price_field="mrp", sale_price_field="price")
+    table.rebuild([("a", {"mrp": 1000, "price": 900}), ("b", {"mrp": 800, "price": 800}),
+                   ("c", {"mrp": 1200, "price": 700})])
+    page = table.query(max_price=850, sort_by="sale_price", price_column="sale_price")
+    assert [p["id"] for p in page["products"]] == ["c", "b"]
+    assert [p["id"] for p in table.query(max_price=850)["products"]] == ["b"]
+
+
+def test_invalid_arguments():
+    table = make_table()
+    with pytest.raises(ValueError, match="sort_by"):
+        table.query(sort_by="name")
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        table.query(sort_by="price", cursor="not-a-cursor")
+    with pytest.raises(ValueError):
+        decode_cursor("e30=")
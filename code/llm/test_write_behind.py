@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from write_behind import TEXT_KEY, WriteBehindQueue
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+
+class FakeIndex:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+        self.upserted = []
+        self.deleted = []
+
+    def upsert(self, vectors):
+        self.entered.set()
+        self.gate.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("index unavailable")
+        self.upserted.extend(vectors)
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+
+def make_queue(index, **kwargs):
+    return WriteBehindQueue(index, FakeEmbeddings(), lambda meta: meta["name"], flush_interval=0.05,
+                            retry_backoff=0.01, **kwargs)
+
+
+def test_upserts_store_the_embedded_text():
+    index = FakeIndex()
+    queue = make_queue(index)
+    try:
+        queue.upsert("a", {"name": "Pixel"}).result(5)
+        assert index.upserted == [("a", [5.0], {"name": "Pixel", TEXT_KEY: "Pixel"})]
+    finally:
+        queue.close()
+
+
+def test_flush_waits_for_the_batch_in_flight():
+    index = FakeIndex()
+    index.gate.clear()
+    queue = make_queue(index)
+    try:
+        future = queue.upsert("a", {"name": "Pixel"})
+        assert index.entered.wait(5)
+        # Taken off the queue, but not written yet
+        assert queue.pending_count() == 0
+        threading.Timer(0.2, index.gate.set).start()
+        queue.flush(timeout=5)
+        assert future.done() and index.upserted
+    finally:
+        index.gate.set()
+        queue.close()
+
+
+def test_failed_flush_is_retried():
+    index = FakeIndex(failures=2)
+    queue = make_queue(index)
+    try:
+        assert queue.upsert("a", {"name": "Pixel"}).result(5) is True
+        assert [pid for pid, _, _ in index.upserted] == ["a"]
+        assert queue.stats()["retried"] == 2
+    finally:
+        queue.close()
+
+
+def test_newer_write_replaces_a_failed_one():
+    index = FakeIndex(failures=1)
+    index.gate.clear()
+    queue = make_queue(index)
+    try:
+        old = queue.upsert("a", {"name": "old"})
+        assert index.entered.wait(5)
+        new = queue.upsert("a", {"name": "new"})
+        index.gate.set()
+        assert old.result(5) is True and new.result(5) is True
+        assert [meta["name"] for _, _, meta in index.upserted] == ["new"]
+    finally:
+        queue.close()
+
+
+def test_waiters_get_the_error_after_max_retries():
+    index = FakeIndex(failures=100)
+    queue = make_queue(index, max_retries=2)
+    try:
+        future = queue.upsert("a", {"name": "Pixel"})
+        with pytest.raises(RuntimeError, match="index unavailable"):
+            future.result(5)
+        assert queue.stats()["failed"] == 1
+    finally:
+        queue.close()
+
+
+def test_cancelled_waiter_does_not_stop_the_flusher():
+    index = FakeIndex()
+    index.gate.clear()
+    queue = make_queue(index)
+    try:
+        queue.upsert("a", {"name": "a"}).cancel()
+        assert index.entered.wait(5)
+        index.gate.set()
+        queue.flush(timeout=5)
+        started = time.monotonic()
+        queue.delete("b").result(5)
+        assert index.deleted == ["b"] and time.monotonic() - started < 5
+    finally:
+        queue.close()
@@ -0,0 +1,30 @@
+"""Cheap token estimates for prompt budgeting.
+
+Counts word pieces and punctuation marks, which tracks Llama's BPE token count
+closely enough for budgeting without loading a tokenizer.
+"""
+import re
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(_PIECES.findall(text)) if text else 0
+
+
+# Characters per estimated token on catalog product text, for counts where scanning the text is not worth it
+CHARS_PER_TOKEN = 3.75
+
+
+def estimate_tokens_from_length(chars: int) -> int:
+    return int(chars / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, budget: int, suffix: str = "...") -> str:
+    """Cut ``text`` after roughly ``budget`` tokens, on a piece boundary."""
+    if budget <= 0:
+        return ""
+    for count, match in enumerate(_PIECES.finditer(text), start=1):
+        if count > budget:
+            return text[:match.start()].rstrip() + suffix
+    return text
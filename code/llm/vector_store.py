@@ -0,0 +1,254 @@
+"""In-process NumPy vector store, usable as a drop-in for PineconeVectorStore."""
+import json
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """Evaluate a Pinecone-style metadata filter (``$eq``/``$ne``/``$gt``/.../``$in``/``$nin``, ``$and``/``$or``)."""
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported filter operator: {key}")
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                compare = _COMPARISONS.get(operator)
+                if compare is None:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                try:
+                    if not compare(value, operand):
+                        return False
+                except TypeError:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine-similarity search over a contiguous float32 matrix.
+
+    Vectors are L2-normalised on insert so a query is a single matmul against
+    the live rows followed by an argpartition for the top-k. A ``filter`` uses
+    Pinecone's metadata filter syntax and restricts the candidates before the
+    top-k; unsupported operators raise ``ValueError``.
+    """
+
+    def __init__(self, embedding: Embeddings, initial_capacity: int = 1024):
+        self._embedding = embedding
+        self._initial_capacity = initial_capacity
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return self._size
+
+    # ------------------------------------------------------------------ writes
+
+    def _ensure_capacity(self, dim: int, extra: int):
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, extra)
+            self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+            return
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match index dimension {self._matrix.shape[1]}")
+        needed = self._size + extra
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, self._matrix.shape[0] * 2)
+            grown = np.zeros((capacity, dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Insert or replace rows using precomputed embeddings."""
+        if not texts:
+            return []
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1))
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        with self._lock:
+            self._ensure_capacity(vectors.shape[1], len(texts))
+            for text, vector, metadata, doc_id in zip(texts, vectors, metadatas, ids):
+                row = self._id_to_row.get(doc_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._ids.append(doc_id)
+                    self._texts.append(text)
+                    self._metadatas.append(dict(metadata))
+                    self._id_to_row[doc_id] = row
+                else:
+                    self._texts[row] = text
+                    self._metadatas[row] = dict(metadata)
+                self._matrix[row] = vector
+        return list(ids)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        embeddings = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Remove rows by ID, filling each hole with the last row to keep the matrix dense."""
+        if not ids:
+            return False
+        with self._lock:
+            for doc_id in ids:
+                row = self._id_to_row.pop(doc_id, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._matrix[row] = self._matrix[last]
+                    self._ids[row] = moved_id
+                    self._texts[row] = self._texts[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._id_to_row[moved_id] = row
+                self._ids.pop()
+                self._texts.pop()
+                self._metadatas.pop()
+                self._size -= 1
+        return True
+
+    # ------------------------------------------------------------------- reads
+
+    def _document(self, row: int) -> Document:
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def get_by_ids(self, ids: List[str], /) -> List[Document]:
+        with self._lock:
+            return [self._document(self._id_to_row[i]) for i in ids if i in self._id_to_row]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+            query = self._normalize(np.asarray(embedding, dtype=np.float32))
+            scores = self._matrix[:self._size] @ query
+            candidates = self._size
+            if filter:
+                allowed = np.fromiter((matches_filter(m, filter) for m in self._metadatas), dtype=bool, count=self._size)
+                candidates = int(np.count_nonzero(allowed))
+                if candidates == 0:
+                    return []
+                scores = np.where(allowed, scores, -np.inf)
+            k = min(k, candidates)
+            if k < self._size:
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+            else:
+                top = np.argsort(-scores)
+            return [(self._document(int(row)), float(scores[row])) for row in top]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # Only the embedding is worth awaiting; the matmul itself takes microseconds
+        embedding = await self._embedding.aembed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities; map [-1, 1] onto [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    # ------------------------------------------------------------- persistence
+
+    def save(self, path: str):
+        """Persist vectors and payloads to a single .npz file."""
+        with self._lock:
+            matrix = self._matrix[:self._size] if self._matrix is not None else np.zeros((0, 0), dtype=np.float32)
+            payload = json.dumps({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas})
+            with open(path, "wb") as f:
+                np.savez(f, matrix=matrix, payload=np.array(payload))
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings) -> "NumpyVectorStore":
+        with np.load(path, allow_pickle=False) as data:
+            matrix = data["matrix"]
+            payload = json.loads(str(data["payload"]))
+        store = cls(embedding)
+        if len(payload["ids"]):
+            store.add_embeddings(payload["texts"], matrix, payload["metadatas"], payload["ids"])
+        return store
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
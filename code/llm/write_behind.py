@@ -0,0 +1,243 @@
+"""Write-behind queue for product mutations against the Pinecone index.
+
+CRUD handlers enqueue upserts and deletes and return immediately. Mutations
+are coalesced per product ID (the last write wins), then a background thread
+flushes them in batches when ``max_batch`` products are pending or
+``flush_interval`` seconds have passed: one ``embed_documents`` call for all
+upserted products, chunked ``index.upsert`` calls and one ``index.delete``.
+Each upsert stores the embedded text under ``text`` so vector stores that
+read documents back from metadata can use the match.
+
+A failed flush puts its mutations back in the queue, unless a newer write for
+the same product has replaced them, and retries with exponential backoff;
+after ``max_retries`` failures the waiting futures get the error.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+UPSERT = "upsert"
+DELETE = "delete"
+# Metadata key holding the embedded text (LangChain's PineconeVectorStore default ``text_key``)
+TEXT_KEY = "text"
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        index,
+        embeddings,
+        text_fn: Callable[[Dict[str, Any]], str],
+        max_batch: int = 100,
+        flush_interval: float = 0.5,
+        upsert_chunk_size: int = 100,
+        max_retries: int = 5,
+        retry_backoff: float = 0.5,
+        max_retry_backoff: float = 30.0,
+        logger=None,
+    ):
+        """``logger`` is a ``StructuredLogger`` for flush failures; without one they are printed."""
+        self.index = index
+        self.embeddings = embeddings
+        self.text_fn = text_fn
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.upsert_chunk_size = upsert_chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+        self.logger = logger
+        # product_id -> (operation, metadata, futures waiting on this product)
+        self._pending: Dict[str, Tuple[str, Optional[Dict[str, Any]], List[Future]]] = {}
+        self._cond = threading.Condition()
+        # Batches taken off the queue and being written, so ``flush`` can wait on them too
+        self._inflight: List[Dict[str, Tuple[str, Optional[Dict[str, Any]], List[Future]]]] = []
+        # product_id -> failed flushes of its current mutation
+        self._attempts: Dict[str, int] = {}
+        self._retry_at = 0.0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        self.flushes = 0
+        self.coalesced = 0
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------ enqueue
+
+    def _enqueue(self, product_id: str, operation: str, metadata: Optional[Dict[str, Any]]) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            previous = self._pending.get(product_id)
+            futures = previous[2] if previous else []
+            if previous:
+                self.coalesced += 1
+            # A new mutation starts its own retry count
+            self._attempts.pop(product_id, None)
+            futures.append(future)
+            self._pending[product_id] = (operation, metadata, futures)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def upsert(self, product_id: str, metadata: Dict[str, Any]) -> Future:
+        return self._enqueue(product_id, UPSERT, dict(metadata))
+
+    def delete(self, product_id: str) -> Future:
+        return self._enqueue(product_id, DELETE, None)
+
+    def pending(self, product_id: str) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Return the not-yet-flushed ``(operation, metadata)`` for a product, if any."""
+        with self._cond:
+            entry = self._pending.get(product_id)
+            return (entry[0], dict(entry[1]) if entry[1] else None) if entry else None
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    # -------------------------------------------------------------------- flush
+
+    def _log(self, level: str, event: str, **fields):
+        if self.logger is not None:
+            self.logger.log(level, event, **fields)
+        else:
+            print(f"{event}: {fields}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = max(time.monotonic() + self.flush_interval, self._retry_at)
+                while not self._closed and not self._flush_requested and (
+                        len(self._pending) < self.max_batch or time.monotonic() < self._retry_at):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush_requested = False
+                batch, self._pending = self._pending, {}
+                if batch:
+                    self._inflight.append(batch)
+                closed = self._closed
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # The flusher must survive anything one batch does, or the queue stops draining
+                    self._log("error", "write_behind_flusher_error", error=str(e), products=len(batch))
+                    self._settle(batch, error=e)
+                finally:
+                    with self._cond:
+                        self._inflight.remove(batch)
+                        self._cond.notify_all()
+            if closed:
+                with self._cond:
+                    if not self._pending:
+                        return
+
+    @staticmethod
+    def _settle(batch, error: Optional[BaseException] = None):
+        """Resolve the batch's futures, skipping those whose caller already cancelled or that are resolved."""
+        for _, _, futures in batch.values():
+            for future in futures:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(True)
+
+    def _write(self, batch: Dict[str, Tuple[str, Optional[Dict[str, Any]], List[Future]]]):
+        upserts = [(pid, meta) for pid, (op, meta, _) in batch.items() if op == UPSERT]
+        deletes = [pid for pid, (op, _, _) in batch.items() if op == DELETE]
+        try:
+            if upserts:
+                texts = [self.text_fn(meta) for _, meta in upserts]
+                vectors = self.embeddings.embed_documents(texts)
+                records = [(pid, vector, {**meta, TEXT_KEY: text})
+                           for (pid, meta), text, vector in zip(upserts, texts, vectors)]
+                for offset in range(0, len(records), self.upsert_chunk_size):
+                    self.index.upsert(vectors=records[offset:offset + self.upsert_chunk_size])
+            if deletes:
+                self.index.delete(ids=deletes)
+        except Exception as e:
+            self._requeue(batch, e)
+            return
+        self._settle(batch)
+        with self._cond:
+            for product_id in batch:
+                if product_id not in self._pending:
+                    self._attempts.pop(product_id, None)
+            self.flushes += 1
+            self.written += len(batch)
+
+    def _requeue(self, batch, error: Exception):
+        """Put a failed batch back in the queue, behind any newer write for the same product."""
+        exhausted = {}
+        with self._cond:
+            attempts = 0
+            for product_id, (operation, metadata, futures) in batch.items():
+                newer = self._pending.get(product_id)
+                if newer is not None:
+                    # Superseded: the newer mutation carries the final state, so its write settles these waiters
+                    newer[2].extend(futures)
+                    continue
+                failures = self._attempts.get(product_id, 0) + 1
+                if failures > self.max_retries or self._closed:
+                    self._attempts.pop(product_id, None)
+                    exhausted[product_id] = (operation, metadata, futures)
+                    continue
+                self._attempts[product_id] = failures
+                self._pending[product_id] = (operation, metadata, futures)
+                attempts = max(attempts, failures)
+            if attempts:
+                self.retried += 1
+                delay = min(self.retry_backoff * 2 ** (attempts - 1), self.max_retry_backoff)
+                self._retry_at = time.monotonic() + delay
+            self.failed += len(exhausted)
+        self._log("error" if exhausted else "warning", "write_behind_flush_failed", error=str(error), products=len(batch),
+                  requeued=len(batch) - len(exhausted), dropped=len(exhausted))
+        self._settle(exhausted, error=error)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Flush everything queued or being written so far and wait until it is written."""
+        with self._cond:
+            batches = [self._pending] + self._inflight
+            # Copies: a requeue may move these waiters onto a newer entry while we wait
+            futures = [f for batch in batches for _, _, fs in batch.values() for f in list(fs)]
+            self._flush_requested = True
+            self._cond.notify()
+        for future in futures:
+            # A cancelled waiter's write still goes out; only its future is gone
+            if not future.cancelled():
+                future.result(timeout=timeout)
+
+    async def aflush(self):
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Flush outstanding writes and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=30)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "flushes": self.flushes,
+                "written": self.written,
+                "coalesced": self.coalesced,
+                "in_flight": sum(len(batch) for batch in self._inflight),
+                "retried": self.retried,
+                "failed": self.failed,
+                "max_batch": self.max_batch,
+                "flush_interval": self.flush_interval,
+            }